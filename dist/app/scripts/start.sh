@@ -24,7 +24,7 @@ else
 fi
 
 export GUNICORN_CONF=${GUNICORN_CONF:-$DEFAULT_GUNICORN_CONF}
-export WORKER_CLASS=${WORKER_CLASS:-"uvicorn.workers.UvicornWorker"}
+export WORKER_CLASS=${WORKER_CLASS:-"app.worker.TunedUvicornWorker"}
 
 PRE_START_PATH=${PRE_START_PATH:-/app/prestart.sh}
 echo "Checking for script in $PRE_START_PATH"
@@ -43,5 +43,5 @@ else
     # Assume production mode if DEV_MODE isn't 'true'
     # Start Gunicorn
     echo "Starting in normal config"
-    exec gunicorn -k "$WORKER_CLASS" -C "$GUNICORN_CONF" "$APP_MODULE"
+    exec gunicorn -k "$WORKER_CLASS" -c "$GUNICORN_CONF" "$APP_MODULE"
 fi
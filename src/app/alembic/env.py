@@ -31,6 +31,11 @@ target_metadata = Base.metadata  # pylint: disable=no-name-in-module,no-member
 
 
 def get_url() -> str:
+    # Each shard is migrated on its own: alembic -x url=postgresql://... upgrade head
+    url = context.get_x_argument(as_dictionary=True).get("url")
+    if url:
+        # Migrations run synchronously, so accept the async URLs of DB_SHARDS as well
+        return url.replace("postgresql+asyncpg://", "postgresql://", 1)
     host = os.getenv("POSTGRES_SERVER")
     user = os.getenv("POSTGRES_USER")
     password = os.getenv("POSTGRES_PASSWORD")
@@ -0,0 +1,65 @@
+"""user change notifications
+
+Revision ID: 4e8a2d6b1c93
+Revises: 7c1f3e9a5d42
+Create Date: 2026-10-18 11:02:47.118230
+
+"""
+import os
+import re
+
+import sqlalchemy as sa
+from alembic import context, op  # pylint: disable=no-name-in-module
+
+# revision identifiers, used by Alembic.
+revision = '4e8a2d6b1c93'
+down_revision = '7c1f3e9a5d42'
+branch_labels = None
+depends_on = None
+
+
+def get_channel() -> str:
+    # The channel the app listens on: alembic -x channel=... or CHANGE_FEED_CHANNEL
+    channel = context.get_x_argument(as_dictionary=True).get(
+        "channel", os.getenv("CHANGE_FEED_CHANNEL", "user_changes")
+    )
+    if not re.fullmatch(r"[A-Za-z_][A-Za-z0-9_]*", channel):
+        raise ValueError(f"Invalid change feed channel: {channel!r}")
+    return channel
+
+
+def upgrade() -> None:
+    op.create_index('ix_user_updated_at_id', 'user', ['updated_at', 'id'])
+    op.execute(
+        sa.text(
+            """
+            CREATE OR REPLACE FUNCTION notify_user_change() RETURNS trigger AS $$
+            BEGIN
+                PERFORM pg_notify(
+                    TG_ARGV[0],
+                    json_build_object(
+                        'op', lower(TG_OP),
+                        'row', row_to_json(CASE WHEN TG_OP = 'DELETE' THEN OLD ELSE NEW END)
+                    )::text
+                );
+                RETURN NULL;
+            END;
+            $$ LANGUAGE plpgsql
+            """
+        )
+    )
+    op.execute(
+        sa.text(
+            f"""
+            CREATE TRIGGER user_change_notify
+            AFTER INSERT OR UPDATE OR DELETE ON "user"
+            FOR EACH ROW EXECUTE FUNCTION notify_user_change('{get_channel()}')
+            """
+        )
+    )
+
+
+def downgrade() -> None:
+    op.execute(sa.text('DROP TRIGGER IF EXISTS user_change_notify ON "user"'))
+    op.execute(sa.text('DROP FUNCTION IF EXISTS notify_user_change()'))
+    op.drop_index('ix_user_updated_at_id', table_name='user')
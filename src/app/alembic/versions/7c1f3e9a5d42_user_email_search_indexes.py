@@ -0,0 +1,37 @@
+"""user email search indexes
+
+Revision ID: 7c1f3e9a5d42
+Revises: 2bbb456c6a28
+Create Date: 2026-10-18 09:12:31.402117
+
+"""
+import sqlalchemy as sa
+from alembic import op  # pylint: disable=no-name-in-module
+
+# revision identifiers, used by Alembic.
+revision = '7c1f3e9a5d42'
+down_revision = '2bbb456c6a28'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.execute(sa.text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+    op.create_index(
+        'ix_user_email_pattern',
+        'user',
+        ['email'],
+        postgresql_ops={'email': 'text_pattern_ops'},
+    )
+    op.create_index(
+        'ix_user_email_trgm',
+        'user',
+        ['email'],
+        postgresql_using='gin',
+        postgresql_ops={'email': 'gin_trgm_ops'},
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_user_email_trgm', table_name='user')
+    op.drop_index('ix_user_email_pattern', table_name='user')
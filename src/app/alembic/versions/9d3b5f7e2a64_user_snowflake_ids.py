@@ -0,0 +1,46 @@
+"""user snowflake ids
+
+Revision ID: 9d3b5f7e2a64
+Revises: 4e8a2d6b1c93
+Create Date: 2026-10-18 14:27:09.553019
+
+"""
+import sqlalchemy as sa
+from alembic import op  # pylint: disable=no-name-in-module
+
+# revision identifiers, used by Alembic.
+revision = '9d3b5f7e2a64'
+down_revision = '4e8a2d6b1c93'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # IDs are allocated by the application, so that they are unique across shards
+    op.alter_column(
+        'user',
+        'id',
+        existing_type=sa.Integer(),
+        type_=sa.BigInteger(),
+        server_default=None,
+        existing_nullable=False,
+    )
+    op.execute(sa.text('DROP SEQUENCE IF EXISTS user_id_seq'))
+
+
+def downgrade() -> None:
+    # Fails if Snowflake IDs, which don't fit an INTEGER, were allocated
+    op.execute(sa.text('CREATE SEQUENCE IF NOT EXISTS user_id_seq OWNED BY "user".id'))
+    op.execute(
+        sa.text(
+            "SELECT setval('user_id_seq', COALESCE((SELECT max(id) FROM \"user\"), 0) + 1, false)"
+        )
+    )
+    op.alter_column(
+        'user',
+        'id',
+        existing_type=sa.BigInteger(),
+        type_=sa.Integer(),
+        server_default=sa.text("nextval('user_id_seq'::regclass)"),
+        existing_nullable=False,
+    )
@@ -0,0 +1,34 @@
+"""cache invalidation outbox
+
+Revision ID: b6e1c4a8f3d7
+Revises: 9d3b5f7e2a64
+Create Date: 2026-10-18 16:08:41.302774
+
+"""
+import sqlalchemy as sa
+from alembic import op  # pylint: disable=no-name-in-module
+
+# revision identifiers, used by Alembic.
+revision = 'b6e1c4a8f3d7'
+down_revision = '9d3b5f7e2a64'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'cacheinvalidation',
+        sa.Column('id', sa.BigInteger(), autoincrement=True, nullable=False),
+        sa.Column('tag', sa.String(length=64), nullable=False),
+        sa.Column(
+            'created_at', sa.DateTime(), server_default=sa.text('now()'), nullable=False
+        ),
+        sa.Column(
+            'updated_at', sa.DateTime(), server_default=sa.text('now()'), nullable=False
+        ),
+        sa.PrimaryKeyConstraint('id', name=op.f('pk_cacheinvalidation')),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('cacheinvalidation')
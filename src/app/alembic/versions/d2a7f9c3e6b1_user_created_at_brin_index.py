@@ -0,0 +1,27 @@
+"""user created_at brin index
+
+Revision ID: d2a7f9c3e6b1
+Revises: b6e1c4a8f3d7
+Create Date: 2026-10-18 17:41:09.518230
+
+"""
+from alembic import op  # pylint: disable=no-name-in-module
+
+# revision identifiers, used by Alembic.
+revision = 'd2a7f9c3e6b1'
+down_revision = 'b6e1c4a8f3d7'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_index(
+        'ix_user_created_at_brin',
+        'user',
+        ['created_at'],
+        postgresql_using='brin',
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_user_created_at_brin', table_name='user')
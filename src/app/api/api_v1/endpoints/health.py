@@ -1,13 +1,27 @@
-from typing import Callable, Coroutine, Tuple
+import gc
+from typing import Any, Callable, Coroutine, Dict, Literal, Optional, Tuple
 
-from fastapi import APIRouter
+from fastapi import APIRouter, HTTPException
 from fastapi.encoders import jsonable_encoder
 from fastapi.responses import JSONResponse
 
+from app.api import deps
+from app.core.config import settings
+from app.core.tracing import RingBufferExporter, tracer
 from app.db.session import async_session_factory, get_redis_session
+from app.middleware import admission_controller, rate_limiter
+from app.util.bloom import check_user_ids_filter, user_ids
+from app.util.cache import cache_status, pending_invalidations
+from app.util.change_feed import user_changes
+from app.util.hot_keys import hot_keys
+from app.util.memory import memory_profiler, memory_sampler, object_counts, rss
+from app.util.outbox import invalidation_outbox
 
 router = APIRouter()
 
+# How tracemalloc statistics are grouped
+GroupBy = Literal["lineno", "filename", "traceback"]
+
 
 async def test_db_connection() -> Tuple[bool, str]:
     """
@@ -56,7 +70,53 @@ async def test_redis_connection() -> Tuple[bool, str]:
     return response
 
 
-HEALTH_TESTS = [test_db_connection, test_redis_connection]
+async def test_cache_breaker() -> Tuple[bool, str]:
+    """
+    Report the state of the Redis circuit breaker.
+
+    The cache degrades gracefully, so an open breaker does not make the service unhealthy.
+
+    Returns:
+        Tuple[bool, str]: A tuple containing a boolean indicating whether the check passed and a string with a status message.
+
+    """
+    status = cache_status()
+    return (
+        True,
+        f"Redis circuit breaker {status['state']}, failures: {status['failures']}, "
+        f"pending invalidations: {len(status['pending_invalidations'])}.",
+    )
+
+
+async def test_invalidation_outbox() -> Tuple[bool, str]:
+    """
+    Report the deliveries of the cache invalidation outbox drainer.
+
+    Undelivered invalidations are kept in the database and retried, and the cache is bypassed while they are older than `CACHE_OUTBOX_MAX_LAG`, so failures do not make the service unhealthy.
+
+    Returns:
+        Tuple[bool, str]: A tuple containing a boolean indicating whether the check passed and a string with a status message.
+
+    """
+    if not settings.CACHE_OUTBOX_ENABLED:
+        return (True, "Invalidation outbox disabled.")
+    stats = invalidation_outbox.stats()
+    lag = ", ".join(f"shard {index}: {age}s" for index, age in stats["lag"].items())
+    return (
+        True,
+        f"Invalidation outbox delivered: {stats['delivered']}, failures: {stats['failures']}, "
+        f"seconds since last delivery: {stats['since_last_delivery']}, "
+        f"oldest undelivered: {lag or 'not measured'}"
+        f"{', cache bypassed' if stats['behind'] else ''}.",
+    )
+
+
+HEALTH_TESTS = [
+    test_db_connection,
+    test_cache_breaker,
+    test_invalidation_outbox,
+    test_redis_connection,
+]
 
 
 async def _get_health(
@@ -128,3 +188,201 @@ async def get_health_details() -> JSONResponse:
 
     """
     return await _get_health(HEALTH_TESTS, verbose=True)
+
+
+@router.get("/_admission")
+def get_admission() -> JSONResponse:
+    """
+    Get the state of the admission control gates.
+
+    Returns:
+        JSONResponse: A JSON response containing the limits, queue depth and shed counts of each request class.
+
+    """
+    return JSONResponse(jsonable_encoder(admission_controller.stats()), status_code=200)
+
+
+@router.get("/_rate_limit")
+def get_rate_limit() -> JSONResponse:
+    """
+    Get the rate limits and the requests rejected by this worker.
+
+    Returns:
+        JSONResponse: A JSON response containing the bucket and rejected requests of each route class, the checks made in process while Redis was unavailable and the requests with an unknown API key.
+
+    """
+    return JSONResponse(jsonable_encoder(rate_limiter.stats()), status_code=200)
+
+
+@router.post("/_bloom/rebuild", dependencies=[deps.admin])
+async def rebuild_user_ids_filter(cache: deps.cache) -> Dict[str, Any]:
+    """
+    Rebuild the user ID bloom filter from the database.
+
+    Needed after users were inserted without going through the API, e.g. by scripts, which
+    the filter would otherwise report as missing. Lookups go to the database until the
+    rebuild, started in the background by this worker, completes.
+
+    Args:
+        cache (Cache): The Redis cache.
+
+    Returns:
+        Dict[str, Any]: Whether the filter was reset.
+
+    Raises:
+        HTTPException: If the bloom filter is disabled or Redis is unavailable.
+
+    """
+    if not settings.USER_BLOOM_ENABLED:
+        raise HTTPException(status_code=404, detail="User ID bloom filter is disabled")
+    if not await user_ids.reset(cache):
+        raise HTTPException(status_code=503, detail="Redis is unavailable")
+    check_user_ids_filter()
+    return {"reset": True}
+
+
+@router.get("/_hot_keys", dependencies=[deps.admin])
+def get_hot_keys(limit: int = 20) -> Dict[str, Any]:
+    """
+    Get the hot key counters of this worker and its most read cache keys.
+
+    Admin only, since cache keys hold search parameters such as email fragments.
+
+    Args:
+        limit (int, optional): The maximum number of hot keys to return. Defaults to 20.
+
+    Returns:
+        Dict[str, Any]: The hits, misses, refreshes and misses avoided, and the hot keys.
+
+    Raises:
+        HTTPException: If hot key tracking is disabled.
+
+    """
+    if not settings.HOT_KEYS_ENABLED:
+        raise HTTPException(status_code=404, detail="Hot key tracking is disabled")
+    return hot_keys.stats(limit)
+
+
+@router.get("/_traces", dependencies=[deps.admin])
+def get_traces(trace_id: Optional[str] = None, limit: int = 100) -> JSONResponse:
+    """
+    Get the most recent spans recorded by this worker, newest first.
+
+    Args:
+        trace_id (Optional[str], optional): Only return the spans of this trace, e.g. from a response's `traceparent` header. Defaults to None.
+        limit (int, optional): The maximum number of spans to return. Defaults to 100.
+
+    Returns:
+        JSONResponse: The spans.
+
+    Raises:
+        HTTPException: If spans are not kept in memory.
+
+    """
+    if not isinstance(tracer.exporter, RingBufferExporter):
+        raise HTTPException(status_code=404, detail="Spans are not kept in memory")
+    return JSONResponse(tracer.exporter.recent(trace_id, limit))
+
+
+def _check_memory_diagnostics() -> None:
+    """
+    Reject memory diagnostics requests unless they are enabled.
+
+    Raises:
+        HTTPException: If memory diagnostics are disabled.
+
+    """
+    if not settings.MEMORY_DIAGNOSTICS_ENABLED:
+        raise HTTPException(status_code=404, detail="Memory diagnostics are disabled")
+
+
+@router.get("/_memory", dependencies=[deps.admin])
+def get_memory(limit: int = 20, group_by: GroupBy = "lineno") -> Dict[str, Any]:
+    """
+    Get the memory usage of this worker.
+
+    Reports the RSS and its sampled trend, the most common object types tracked by the
+    garbage collector, the size of the worker's long-lived buffers and, when tracemalloc
+    is tracing, the largest allocators.
+
+    Args:
+        limit (int, optional): The number of types and allocators to return. Defaults to 20.
+        group_by (str, optional): How allocators are grouped: `lineno`, `filename` or `traceback`. Defaults to "lineno".
+
+    Returns:
+        Dict[str, Any]: The memory report.
+
+    """
+    _check_memory_diagnostics()
+    trend = memory_sampler.trend()
+    report: Dict[str, Any] = {
+        "rss": rss(),
+        "rss_trend_bytes_per_hour": round(trend) if trend is not None else None,
+        "gc": {"counts": gc.get_count(), "objects": object_counts(limit)},
+        "buffers": {
+            "pending_invalidations": len(pending_invalidations),
+            "change_feed_subscribers": len(user_changes.subscribers),
+            "trace_spans": len(getattr(tracer.exporter, "spans", ())),
+            "hot_keys": len(hot_keys.hot),
+        },
+        "tracemalloc": {
+            "tracing": memory_profiler.tracing,
+            "traced": memory_profiler.traced_memory(),
+        },
+    }
+    if memory_profiler.tracing:
+        report["tracemalloc"]["top"] = memory_profiler.top(limit, group_by)
+    return report
+
+
+@router.get("/_memory/diff", dependencies=[deps.admin])
+def get_memory_diff(limit: int = 20, group_by: GroupBy = "lineno") -> Dict[str, Any]:
+    """
+    Get the allocations that grew most since the previous call, which becomes the new baseline.
+
+    Args:
+        limit (int, optional): The number of allocators to return. Defaults to 20.
+        group_by (str, optional): How allocators are grouped: `lineno`, `filename` or `traceback`. Defaults to "lineno".
+
+    Returns:
+        Dict[str, Any]: The RSS and the allocation growth, None on the first call.
+
+    Raises:
+        HTTPException: If tracemalloc is not tracing.
+
+    """
+    _check_memory_diagnostics()
+    if not memory_profiler.tracing:
+        raise HTTPException(status_code=409, detail="tracemalloc is not tracing")
+    return {"rss": rss(), "diff": memory_profiler.diff(limit, group_by)}
+
+
+@router.post("/_memory/tracemalloc", dependencies=[deps.admin])
+def start_tracemalloc(frames: int = 10) -> Dict[str, Any]:
+    """
+    Start tracing allocations in this worker. Slows the worker down until stopped.
+
+    Args:
+        frames (int, optional): The number of frames stored per allocation. Defaults to 10.
+
+    Returns:
+        Dict[str, Any]: The tracemalloc state.
+
+    """
+    _check_memory_diagnostics()
+    memory_profiler.start(max(frames, 1))
+    return {"tracing": memory_profiler.tracing}
+
+
+@router.delete("/_memory/tracemalloc", dependencies=[deps.admin])
+def stop_tracemalloc() -> Dict[str, Any]:
+    """
+    Stop tracing allocations in this worker.
+
+    Returns:
+        Dict[str, Any]: The tracemalloc state.
+
+    """
+    _check_memory_diagnostics()
+    memory_profiler.stop()
+    return {"tracing": memory_profiler.tracing}
@@ -1,60 +1,415 @@
-import json
-from typing import Any, List
+import asyncio
+import functools
+import math
+from datetime import datetime, timedelta, timezone
+from typing import Any, AsyncIterator, Iterable, List, Literal, Optional, Tuple
+from urllib.parse import urlencode
 
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Header, HTTPException
+from fastapi.responses import JSONResponse, StreamingResponse
 
 from app import crud, schemas
 from app.api import deps
 from app.core.config import settings
-from app.util.api import invalidate_cache
+from app.crud.base import BatchOperation
+from app.db.session import DBSession
+from app.util.bloom import user_ids
+from app.util.cache import MISSING, Cache
+from app.util.change_feed import EVICTED, event_id, format_event, user_changes
+from app.util.hot_keys import hot_keys
+from app.util.outbox import invalidation_outbox
+from app.util.snowflake import WorkerIdUnavailableError, id_generator
 
 router = APIRouter()
 
 
+def _parse_fields(fields: Optional[str]) -> Optional[Tuple[str, ...]]:
+    """
+    Parse the `fields` query parameter of the user endpoints.
+
+    Args:
+        fields (Optional[str]): The comma separated fields.
+
+    Returns:
+        Optional[Tuple[str, ...]]: The fields in column order, or None for all fields.
+
+    Raises:
+        HTTPException: If a field is not a column of the User model.
+
+    """
+    try:
+        return crud.users.parse_fields(fields)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+
+def _respond(content: Any, fields: Optional[Tuple[str, ...]]) -> Any:
+    """
+    Return partial objects as is, since they don't match the endpoint's response model.
+
+    Args:
+        content (Any): The serialized user(s).
+        fields (Optional[Tuple[str, ...]]): The requested fields.
+
+    Returns:
+        Any: The content, or a JSON response bypassing response validation for sparse fieldsets.
+
+    """
+    if fields is None:
+        return content
+    return JSONResponse(content)
+
+
+async def _invalidate(cache: Cache, tags: Iterable[str]) -> None:
+    """
+    Invalidate the cache after a committed write.
+
+    With the outbox enabled the write already recorded its tags, so this only wakes the
+    drainer up and the response does not wait for Redis.
+
+    Args:
+        cache (Cache): The Redis cache.
+        tags (Iterable[str]): The tags made stale by the write.
+
+    """
+    if settings.CACHE_OUTBOX_ENABLED:
+        invalidation_outbox.wake()
+    else:
+        await cache.invalidate(tags)
+
+
+def _new_user_id() -> int:
+    """
+    Allocate the ID of a new user.
+
+    Returns:
+        int: The ID.
+
+    Raises:
+        HTTPException: If the worker holds no Snowflake worker ID, e.g. while Redis is down.
+
+    """
+    try:
+        return id_generator.next_id()
+    except WorkerIdUnavailableError as e:
+        raise HTTPException(
+            status_code=503,
+            detail=str(e),
+            headers={
+                "Retry-After": str(math.ceil(settings.SNOWFLAKE_LEASE_RENEW_INTERVAL))
+            },
+        )
+
+
+async def _add_user_ids(cache: Cache, ids: List[int]) -> None:
+    """
+    Add the IDs of users about to be created to the Bloom filter.
+
+    The IDs are added before the transaction commits, so that no reader ever sees a user
+    the filter still rejects. IDs of creates that fail or roll back are false positives,
+    which only cost a database lookup.
+
+    Args:
+        cache (Cache): The Redis cache.
+        ids (List[int]): The IDs allocated for the new users.
+
+    """
+    if ids and settings.USER_BLOOM_ENABLED:
+        await user_ids.add(cache, ids)
+
+
+def _naive_utc(value: Optional[datetime]) -> Optional[datetime]:
+    """
+    Convert a timezone aware datetime to the naive UTC datetimes stored in the database.
+
+    """
+    if value is None or value.tzinfo is None:
+        return value
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def _parse_after(after: str, order_by: str) -> Tuple[Any, int]:
+    """
+    Parse the keyset cursor of the list endpoint.
+
+    Args:
+        after (str): The cursor, `<id>` or `<updated_at>,<id>` depending on the order.
+        order_by (str): The column the pages are ordered by, before the ID.
+
+    Returns:
+        Tuple[Any, int]: The `(value, id)` of the last user already seen.
+
+    Raises:
+        HTTPException: If the cursor is malformed.
+
+    """
+    try:
+        if order_by == "id":
+            return None, int(after)
+        updated_at, last_id = after.rsplit(",", 1)
+        return _naive_utc(datetime.fromisoformat(updated_at)), int(last_id)
+    except ValueError:
+        raise HTTPException(status_code=422, detail="Malformed cursor")
+
+
+async def _load_users(
+    db: DBSession,
+    *,
+    skip: int,
+    limit: int,
+    email_prefix: Optional[str],
+    email_contains: Optional[str],
+    fields: Optional[Tuple[str, ...]],
+    filters: Iterable[Any] = (),
+    order_by: Optional[List[str]] = None,
+) -> List[dict]:
+    """
+    Load a page of users, serialized as cached by `read_users`.
+
+    Args:
+        db (DBSession): The asynchronous SQLAlchemy session.
+        skip (int): The number of users to skip.
+        limit (int): The maximum number of users to return.
+        email_prefix (Optional[str]): Only return users whose email starts with this value.
+        email_contains (Optional[str]): Only return users whose email contains this value.
+        fields (Optional[Tuple[str, ...]]): The fields to return, None for all fields.
+        filters (Iterable[Any]): More clauses the users must match, e.g. time ranges.
+        order_by (Optional[List[str]]): The columns to sort by. Defaults to the ID.
+
+    Returns:
+        List[dict]: The serialized users.
+
+    """
+    filters = [
+        *crud.users.search_filters(
+            email_prefix=email_prefix, email_contains=email_contains
+        ),
+        *filters,
+    ]
+    # List pages are read-only, skip building ORM instances
+    rows = await crud.users.get_multi_rows(
+        db, skip=skip, limit=limit, filters=filters, fields=fields, order_by=order_by
+    )
+    return crud.users.model.serializer(fields).row_dicts(rows)
+
+
+async def _load_user(
+    db: DBSession, *, id: int, fields: Optional[Tuple[str, ...]]
+) -> Optional[dict]:
+    """
+    Load a user, serialized as cached by `read_user`.
+
+    Args:
+        db (DBSession): The asynchronous SQLAlchemy session.
+        id (int): The ID of the user.
+        fields (Optional[Tuple[str, ...]]): The fields to return, None for all fields.
+
+    Returns:
+        Optional[dict]: The serialized user, or None if it does not exist.
+
+    """
+    row = await crud.users.get_row(db=db, id=id, fields=fields)
+    if not row:
+        return None
+    return crud.users.model.serializer(fields).row_dicts([row])[0]
+
+
 @router.get("/", response_model=List[schemas.User])
 async def read_users(
     db: deps.async_session,
-    redis: deps.redis_async_session,
+    cache: deps.cache,
     skip: int = 0,
     limit: int = 100,
+    email_prefix: Optional[str] = None,
+    email_contains: Optional[str] = None,
+    fields: Optional[str] = None,
+    created_since: Optional[datetime] = None,
+    created_until: Optional[datetime] = None,
+    updated_since: Optional[datetime] = None,
+    updated_until: Optional[datetime] = None,
+    order_by: Literal["id", "updated_at"] = "id",
+    after: Optional[str] = None,
 ) -> Any:
     """
-    Retrieve a list of users.
+    Retrieve a list of users, optionally filtered by email or by creation and update time.
+
+    Time ranges are half-open, `since <= time < until`; naive datetimes are taken as UTC.
+    Pages can be walked with a keyset cursor instead of `skip`: pass the `id`, or the
+    `updated_at,id` when ordered by `updated_at`, of the last user received as `after`.
+    Incremental sync jobs fetch the users changed since their last run with
+    `updated_since` and `order_by=updated_at`. Time range and keyset pages are not cached.
 
     Args:
         db (AsyncSession): The asynchronous SQLAlchemy session.
-        redis (aioredis.Redis): The asynchronous Redis session.
+        cache (Cache): The Redis cache.
         skip (int, optional): The number of users to skip. Defaults to 0.
         limit (int, optional): The maximum number of users to return. Defaults to 100.
+        email_prefix (Optional[str], optional): Only return users whose email starts with this value. Defaults to None.
+        email_contains (Optional[str], optional): Only return users whose email contains this value. Defaults to None.
+        fields (Optional[str], optional): Comma separated fields to return, e.g. `id,email`. Defaults to all fields.
+        created_since (Optional[datetime], optional): Only return users created at or after this time. Defaults to None.
+        created_until (Optional[datetime], optional): Only return users created before this time. Defaults to None.
+        updated_since (Optional[datetime], optional): Only return users updated at or after this time. Defaults to None.
+        updated_until (Optional[datetime], optional): Only return users updated before this time. Defaults to None.
+        order_by (str, optional): `id` or `updated_at`, then `id`. Defaults to "id".
+        after (Optional[str], optional): The keyset cursor of the last user received, `<id>` or `<updated_at>,<id>`. Defaults to None.
 
     Returns:
         Any: A list of user objects.
 
+    Raises:
+        HTTPException: If a field is unknown, or the cursor is malformed or its fields are left out.
+
     """
-    users = []
-    tag = "user_list"
+    projection = _parse_fields(fields)
+    order = [order_by, "id"] if order_by != "id" else ["id"]
+    filters = [
+        *crud.users.range_filter(
+            "created_at", _naive_utc(created_since), _naive_utc(created_until)
+        ),
+        *crud.users.range_filter(
+            "updated_at", _naive_utc(updated_since), _naive_utc(updated_until)
+        ),
+    ]
+    if after is not None:
+        if projection is not None and not set(order) <= set(projection):
+            raise HTTPException(
+                status_code=422, detail=f"Keyset pages need the fields {order}"
+            )
+        filters.append(crud.users.keyset_filter(order_by, _parse_after(after, order_by)))
+    if filters or order_by != "id":
+        # Sync and analytics pages differ on every call, don't fill the cache with them
+        users = await _load_users(
+            db,
+            skip=skip,
+            limit=limit,
+            email_prefix=email_prefix,
+            email_contains=email_contains,
+            fields=projection,
+            filters=filters,
+            order_by=order,
+        )
+        return _respond(users, projection)
+
+    params = {}
+    if email_prefix or email_contains:
+        # Search pages are invalidated separately from the plain list pages
+        tag = "user_search"
+        params = {
+            "email_prefix": email_prefix or "",
+            "email_contains": email_contains or "",
+        }
+    else:
+        tag = "user_list"
+    if projection:
+        params["fields"] = ",".join(projection)
     item_id = f"{tag}_{skip}:{limit}"
+    if params:
+        item_id += f"?{urlencode(params)}"
+    load = functools.partial(
+        _load_users,
+        skip=skip,
+        limit=limit,
+        email_prefix=email_prefix,
+        email_contains=email_contains,
+        fields=projection,
+    )
     # Load user from cache
-    users_bytes = await redis.get(item_id)
-    if users_bytes is not None:
-        users = json.loads(users_bytes.decode("utf-8"))
-        return users
+    users = await cache.get(item_id)
+    if settings.HOT_KEYS_ENABLED:
+        hot_keys.record(item_id, tag, load, hit=users is not None)
+    if users is not None:
+        return _respond(users, projection)
 
-    users = await crud.users.get_multi(db, skip=skip, limit=limit)
+    users = await load(db)
     if users:
         # Store user in cache and set expiration time
-        await redis.set(
-            item_id, json.dumps([u.dict() for u in users]), ex=settings.REDIS_TTL
-        )
-        await redis.sadd(tag, item_id)  # Tag the item for invalidation
-    return users
+        await cache.set(item_id, users, tag)
+    return _respond(users, projection)
+
+
+@router.get("/_changes", response_class=StreamingResponse)
+async def read_user_changes(
+    db: deps.async_session,
+    last_event_id: Optional[str] = Header(None),
+) -> Any:
+    """
+    Stream user changes as Server-Sent Events.
+
+    Events are `insert`, `update` and `delete`, with the user as data. Clients reconnecting
+    with `Last-Event-ID` first get every user changed since that cursor as `upsert` events,
+    starting `CHANGE_FEED_RESUME_OVERLAP` seconds early, so they should dedupe by event ID.
+    Deletes that happened while disconnected are not replayed.
+
+    Args:
+        db (AsyncSession): The asynchronous SQLAlchemy session.
+        last_event_id (Optional[str], optional): The ID of the last event received, `<updated_at>,<id>`. Defaults to None.
+
+    Returns:
+        Any: The event stream.
+
+    Raises:
+        HTTPException: If the change feed is disabled or the cursor is malformed.
+
+    """
+    if not settings.CHANGE_FEED_ENABLED:
+        raise HTTPException(status_code=404, detail="Change feed is disabled")
+    after = None
+    if last_event_id:
+        try:
+            updated_at, last_id = last_event_id.rsplit(",", 1)
+            after = (datetime.fromisoformat(updated_at), int(last_id))
+        except ValueError:
+            raise HTTPException(status_code=422, detail="Malformed Last-Event-ID")
+        if settings.CHANGE_FEED_RESUME_OVERLAP > 0:
+            overlap = timedelta(seconds=settings.CHANGE_FEED_RESUME_OVERLAP)
+            after = (after[0] - overlap, 0)
+
+    async def stream() -> AsyncIterator[bytes]:
+        # Subscribe before replaying so no change falls between the two
+        subscription = user_changes.subscribe()
+        serializer = crud.users.model.serializer()
+        try:
+            cursor = after
+            while cursor is not None:
+                rows = await crud.users.get_multi_rows(
+                    db,
+                    limit=settings.CHANGE_FEED_REPLAY_BATCH,
+                    filters=[crud.users.keyset_filter("updated_at", cursor)],
+                    order_by=["updated_at", "id"],
+                )
+                for user in serializer.row_dicts(rows):
+                    yield format_event("upsert", user, event_id(user))
+                if len(rows) < settings.CHANGE_FEED_REPLAY_BATCH:
+                    break
+                cursor = (rows[-1].updated_at, rows[-1].id)
+
+            while True:
+                try:
+                    message = await asyncio.wait_for(
+                        subscription.queue.get(), settings.CHANGE_FEED_HEARTBEAT
+                    )
+                except asyncio.TimeoutError:
+                    yield b": keepalive\n\n"
+                    continue
+                yield message
+                if message is EVICTED:
+                    return
+        finally:
+            user_changes.unsubscribe(subscription)
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 
 @router.post("/", response_model=schemas.User)
 async def create_user(
     *,
     db: deps.async_session,
-    redis: deps.redis_async_session,
+    cache: deps.cache,
     obj_in: schemas.UserCreate,
 ) -> Any:
     """
@@ -62,7 +417,7 @@ async def create_user(
 
     Args:
         db (AsyncSession): The asynchronous SQLAlchemy session.
-        redis (aioredis.Redis): The asynchronous Redis session.
+        cache (Cache): The Redis cache.
         obj_in (UserCreate): The user object to create.
 
     Returns:
@@ -72,21 +427,81 @@ async def create_user(
         HTTPException: If the user cannot be created.
 
     """
-    invalidate_tags = ["user_list"]
-    user = await crud.users.create(db=db, obj_in=obj_in)
+    id = _new_user_id()
+    await _add_user_ids(cache, [id])
+    user = await crud.users.create(db=db, obj_in=obj_in, id=id)
     if not user:
         raise HTTPException(status_code=500, detail="Couldn't create User.")
     # Invalidate cache
-    await invalidate_cache(redis, invalidate_tags)
+    await _invalidate(cache, crud.users.write_tags("create", user.id))
     return user
 
 
+@router.post("/_batch", response_model=schemas.UserBatchResponse)
+async def batch_users(
+    *,
+    db: deps.async_session,
+    cache: deps.cache,
+    batch: schemas.UserBatch,
+) -> Any:
+    """
+    Apply a list of create, update and delete operations, in order, in one transaction.
+
+    With `atomic` (the default) the first failed operation rolls the whole batch back.
+    Otherwise each operation runs in its own savepoint and failures only skip themselves.
+    The cache is invalidated once, for every tag touched by the committed operations.
+
+    Args:
+        db (AsyncSession): The asynchronous SQLAlchemy session.
+        cache (Cache): The Redis cache.
+        batch (UserBatch): The operations.
+
+    Returns:
+        Any: Whether anything was committed, and the result of each operation.
+
+    """
+    operations = [
+        BatchOperation(op.op, getattr(op, "id", None), getattr(op, "data", None))
+        for op in batch.operations
+    ]
+    operations = [
+        operation._replace(id=_new_user_id())
+        if operation.op == "create" and operation.id is None
+        else operation
+        for operation in operations
+    ]
+    await _add_user_ids(
+        cache, [operation.id for operation in operations if operation.op == "create"]
+    )
+    results = await crud.users.batch(db, operations, atomic=batch.atomic)
+
+    invalidate_tags = set()
+    response = []
+    for operation, result in zip(operations, results):
+        user = result.obj
+        if result.status == "ok":
+            invalidate_tags.update(crud.users.write_tags(operation.op, result.id))
+        response.append(
+            {
+                "op": operation.op,
+                "id": result.id,
+                "status": result.status,
+                "detail": result.detail,
+                "user": user.dict() if user is not None else None,
+            }
+        )
+    if invalidate_tags:
+        # Invalidate cache
+        await _invalidate(cache, sorted(invalidate_tags))
+    return {"committed": bool(invalidate_tags), "results": response}
+
+
 @router.put("/{id}", response_model=schemas.User)
 async def update_user(
     *,
     db: deps.async_session,
     id: int,
-    redis: deps.redis_async_session,
+    cache: deps.cache,
     obj_in: schemas.UserUpdate,
 ) -> Any:
     """
@@ -95,7 +510,7 @@ async def update_user(
     Args:
         db (AsyncSession): The asynchronous SQLAlchemy session.
         id (int): The ID of the user to update.
-        redis (aioredis.Redis): The asynchronous Redis session.
+        cache (Cache): The Redis cache.
         obj_in (UserUpdate): The updated user object.
 
     Returns:
@@ -105,12 +520,11 @@ async def update_user(
         HTTPException: If the user cannot be found.
 
     """
-    invalidate_tags = ["user_list", "user_get"]
     user = await crud.users.update(db=db, id=id, obj_in=obj_in)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     # Invalidate cache
-    await invalidate_cache(redis, invalidate_tags)
+    await _invalidate(cache, crud.users.invalidate_tags["update"])
     return user
 
 
@@ -118,16 +532,18 @@ async def update_user(
 async def read_user(
     *,
     db: deps.async_session,
-    redis: deps.redis_async_session,
+    cache: deps.cache,
     id: int,
+    fields: Optional[str] = None,
 ) -> Any:
     """
     Get a user by ID.
 
     Args:
         db (AsyncSession): The asynchronous SQLAlchemy session.
-        redis (aioredis.Redis): The asynchronous Redis session.
+        cache (Cache): The Redis cache.
         id (int): The ID of the user to retrieve.
+        fields (Optional[str], optional): Comma separated fields to return, e.g. `id,email`. Defaults to all fields.
 
     Returns:
         Any: The user object.
@@ -136,32 +552,45 @@ async def read_user(
         HTTPException: If the user cannot be found.
 
     """
+    projection = _parse_fields(fields)
     tag = "user_get"
     item_id = f"{tag}_{id}"
-    user = await redis.get(item_id)
-    if user:
+    if projection:
+        item_id += f"?{urlencode({'fields': ','.join(projection)})}"
+    user = await cache.get(item_id)
+    if user is MISSING:
+        raise HTTPException(status_code=404, detail="User not found")
+    load = functools.partial(_load_user, id=id, fields=projection)
+    if settings.HOT_KEYS_ENABLED:
+        hot_keys.record(item_id, tag, load, hit=user is not None)
+    if user is not None:
         # Load user from cache
-        return json.loads(user.decode("utf-8"))
-    user = await crud.users.get(db=db, id=id)
-    if not user:
+        return _respond(user, projection)
+    # Reject IDs that were never created without a database round trip
+    if settings.USER_BLOOM_ENABLED and await user_ids.might_contain(cache, id) is False:
+        raise HTTPException(status_code=404, detail="User not found")
+    user = await load(db)
+    if user is None:
+        # Remember the miss for a short while, filed under the ID's own tag, which the
+        # creation of a user with this ID invalidates
+        await cache.set(
+            item_id, MISSING, crud.users.missing_tag(id), ttl=settings.NEGATIVE_CACHE_TTL
+        )
         raise HTTPException(status_code=404, detail="User not found")
 
     # Store user in cache and set expiration time
-    await redis.set(item_id, json.dumps(user.dict()), ex=settings.REDIS_TTL)
-    await redis.sadd(tag, item_id)  # Tag the item for invalidation
-    return user
+    await cache.set(item_id, user, tag)
+    return _respond(user, projection)
 
 
 @router.delete("/{id}", response_model=schemas.User)
-async def delete_user(
-    *, db: deps.async_session, redis: deps.redis_async_session, id: int
-) -> Any:
+async def delete_user(*, db: deps.async_session, cache: deps.cache, id: int) -> Any:
     """
     Delete a user by ID.
 
     Args:
         db (AsyncSession): The asynchronous SQLAlchemy session.
-        redis (aioredis.Redis): The asynchronous Redis session.
+        cache (Cache): The Redis cache.
         id (int): The ID of the user to delete.
 
     Returns:
@@ -171,10 +600,9 @@ async def delete_user(
         HTTPException: If the user cannot be found.
 
     """
-    invalidate_tags = ["user_list", "user_get"]
     user = await crud.users.remove(db=db, id=id)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     # Invalidate cache
-    await invalidate_cache(redis, invalidate_tags)
+    await _invalidate(cache, crud.users.invalidate_tags["delete"])
     return user
@@ -1,16 +1,14 @@
-from typing import Annotated, AsyncGenerator, Generator
+import secrets
+from typing import Annotated, AsyncGenerator, Generator, Optional
 
-from fastapi import Depends
+from fastapi import Depends, Header, HTTPException
 from redis import asyncio as aioredis
 from sqlalchemy.exc import SQLAlchemyError
-from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
-from app.db.session import (
-    async_session_factory,
-    get_redis_session,
-    sync_session_factory,
-)
+from app.core.config import settings
+from app.db.session import DBSession, get_redis_session, shards, sync_session_factory
+from app.util.cache import Cache
 
 
 # Session generators
@@ -34,19 +32,21 @@ def get_sync_db_session() -> Generator[Session, None, None]:
         session.close()
 
 
-async def get_async_db_session() -> AsyncGenerator[AsyncSession, None]:
+async def get_async_db_session() -> AsyncGenerator[DBSession, None]:
     """
     Returns an asynchronous generator that yields an asynchronous SQLAlchemy session.
 
+    With several shards configured, the session is a `ShardedSession` over all of them.
+
     Yields:
-        AsyncGenerator[AsyncSession, None]: An asynchronous SQLAlchemy session.
+        AsyncGenerator[DBSession, None]: An asynchronous SQLAlchemy session.
 
     Raises:
         SQLAlchemyError: If there is an error creating the session.
 
     """
     try:
-        session = async_session_factory()
+        session = shards.session()
         yield session
     except SQLAlchemyError as e:
         print(f"Async Session Exception: {e}")
@@ -74,7 +74,44 @@ async def get_async_redis_session() -> AsyncGenerator[aioredis.Redis, None]:  #
         await session.aclose()
 
 
+async def get_cache(
+    redis: Annotated[aioredis.Redis, Depends(get_async_redis_session)]  # type: ignore
+) -> Cache:
+    """
+    Returns the Redis cache, guarded by the worker's circuit breaker.
+
+    Args:
+        redis (aioredis.Redis): The asynchronous Redis session.
+
+    Returns:
+        Cache: The cache.
+
+    """
+    return Cache(redis)
+
+
+def verify_admin_token(x_admin_token: Optional[str] = Header(None)) -> None:
+    """
+    Check the admin token of a request to an admin endpoint.
+
+    Args:
+        x_admin_token (Optional[str]): The `X-Admin-Token` header.
+
+    Raises:
+        HTTPException: If admin endpoints are disabled or the token is wrong.
+
+    """
+    if not settings.ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if x_admin_token is None or not secrets.compare_digest(
+        x_admin_token.encode("utf-8"), settings.ADMIN_TOKEN.encode("utf-8")
+    ):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+
 # Session dependencies
 sync_session = Annotated[Session, Depends(get_sync_db_session)]
-async_session = Annotated[AsyncSession, Depends(get_async_db_session)]
+async_session = Annotated[DBSession, Depends(get_async_db_session)]
 redis_async_session = Annotated[aioredis.Redis, Depends(get_async_redis_session)]
+cache = Annotated[Cache, Depends(get_cache)]
+admin = Depends(verify_admin_token)
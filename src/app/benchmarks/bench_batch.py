@@ -0,0 +1,102 @@
+"""
+Compare the batch endpoint with the equivalent individual calls.
+
+`single` creates, updates and deletes N users with one request each, paying the HTTP
+round trip, session setup, transaction and cache invalidation per operation.
+`atomic` and `savepoint` send the same operations as three `POST /api/v1/user/_batch`
+requests of N operations, all-or-nothing and with one savepoint per operation.
+
+Runs against a live app, with its Postgres and Redis, over one keep-alive connection.
+It writes to the `user` table: point it at a disposable database.
+
+Usage (from `src/`):
+    python -m app.benchmarks.bench_batch [BASE_URL] [N ...]
+"""
+import http.client
+import json
+import sys
+import time
+from typing import Any, Callable, Dict, List, Optional
+from urllib.parse import urlsplit
+
+DEFAULT_BASE_URL = "http://localhost:8080"
+DEFAULT_SIZES = [10, 100, 500]
+PREFIX = "/api/v1/user"
+
+
+class Client:
+    def __init__(self, base_url: str):
+        url = urlsplit(base_url)
+        self.connection = http.client.HTTPConnection(url.hostname, url.port or 80)
+
+    def request(self, method: str, path: str, body: Optional[Any] = None) -> Any:
+        payload = json.dumps(body) if body is not None else None
+        headers = {"Content-Type": "application/json"} if payload else {}
+        self.connection.request(method, f"{PREFIX}{path}", payload, headers)
+        response = self.connection.getresponse()
+        data = response.read()
+        if response.status >= 400:
+            raise RuntimeError(f"{method} {path}: {response.status} {data!r}")
+        return json.loads(data)
+
+
+def run_single(client: Client, size: int, tag: str) -> None:
+    ids = [
+        client.request("POST", "/", {"email": f"{tag}{i}@example.com"})["id"]
+        for i in range(size)
+    ]
+    for i, id in enumerate(ids):
+        client.request("PUT", f"/{id}", {"email": f"{tag}{i}@example.org"})
+    for id in ids:
+        client.request("DELETE", f"/{id}")
+
+
+def batch_runner(atomic: bool) -> Callable[[Client, int, str], None]:
+    def run(client: Client, size: int, tag: str) -> None:
+        def send(operations: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+            body = {"atomic": atomic, "operations": operations}
+            response = client.request("POST", "/_batch", body)
+            if not response["committed"]:
+                raise RuntimeError(f"Batch not committed: {response['results'][:3]}")
+            return response["results"]
+
+        created = send(
+            [
+                {"op": "create", "data": {"email": f"{tag}{i}@example.com"}}
+                for i in range(size)
+            ]
+        )
+        ids = [result["id"] for result in created]
+        send(
+            [
+                {"op": "update", "id": id, "data": {"email": f"{tag}{i}@example.org"}}
+                for i, id in enumerate(ids)
+            ]
+        )
+        send([{"op": "delete", "id": id} for id in ids])
+
+    return run
+
+
+def main() -> None:
+    args = sys.argv[1:]
+    base_url = args.pop(0) if args and not args[0].isdigit() else DEFAULT_BASE_URL
+    sizes = [int(arg) for arg in args] or DEFAULT_SIZES
+    client = Client(base_url)
+    runners = (
+        ("single", run_single),
+        ("atomic", batch_runner(atomic=True)),
+        ("savepoint", batch_runner(atomic=False)),
+    )
+    print(f"{'ops':>6} {'mode':>10} {'ms':>10} {'ops/s':>10}")
+    for size in sizes:
+        for name, run in runners:
+            started = time.perf_counter()
+            run(client, size, f"bench-{name}-{size}-{time.time_ns()}-")
+            elapsed = time.perf_counter() - started
+            ops = size * 3
+            print(f"{ops:>6} {name:>10} {elapsed * 1000:>10.1f} {ops / elapsed:>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+Compare the cache payload encodings on user list pages.
+
+`current json` is the `json.dumps` of `Base.dict()` rows the cache used to store. The
+other rows go through `CacheSerializer` with the given codec and compression, first on
+the same ISO formatted rows, then on rows keeping native datetimes. Native datetimes
+save about 5 bytes per value but go through a Python callback each, which is why the
+endpoints keep caching ISO strings.
+
+Usage (from `src/`):
+    python -m app.benchmarks.bench_cache_codec [PAGE_SIZE ...]
+"""
+import datetime
+import json
+import random
+import string
+import sys
+import timeit
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from app.util.codec import CODECS, COMPRESSORS, CacheSerializer
+
+DEFAULT_PAGE_SIZES = [100, 1000]
+
+
+def page(size: int, iso: bool) -> List[Dict[str, Any]]:
+    rng = random.Random(size)
+    start = datetime.datetime(2026, 1, 1)
+    rows = []
+    for i in range(size):
+        created = start + datetime.timedelta(
+            seconds=rng.randint(0, 10**7), microseconds=i
+        )
+        updated = created + datetime.timedelta(seconds=rng.randint(0, 10**5))
+        name = "".join(rng.choices(string.ascii_lowercase, k=10))
+        row: Dict[str, Any] = {
+            "email": f"{name}@example.com",
+            "id": i + 1,
+            "created_at": created,
+            "updated_at": updated,
+        }
+        if iso:
+            row = {
+                k: v.isoformat() if isinstance(v, datetime.datetime) else v
+                for k, v in row.items()
+            }
+        rows.append(row)
+    return rows
+
+
+def measure(
+    encode: Callable[[Any], bytes], decode: Callable[[bytes], Any], rows: Any
+) -> Tuple[int, float, float]:
+    payload = encode(rows)
+    number = max(2000 // len(rows), 5)
+    encode_us = (
+        min(timeit.repeat(lambda: encode(rows), number=number, repeat=5)) / number * 1e6
+    )
+    decode_us = (
+        min(timeit.repeat(lambda: decode(payload), number=number, repeat=5))
+        / number
+        * 1e6
+    )
+    return len(payload), encode_us, decode_us
+
+
+def variants() -> List[Tuple[str, bool, Optional[CacheSerializer]]]:
+    found: List[Tuple[str, bool, Optional[CacheSerializer]]] = [
+        ("current json", True, None)
+    ]
+    for iso in (True, False):
+        for codec in ("json", "msgpack"):
+            for compression in [None, *COMPRESSORS]:
+                if codec == "json" and not iso:
+                    continue
+                label = f"{codec}+{compression or 'raw'}{' iso' if iso else ''}"
+                found.append(
+                    (label, iso, CacheSerializer(CODECS[codec], compression, 1024, 1))
+                )
+    return found
+
+
+def main() -> None:
+    sizes = [int(arg) for arg in sys.argv[1:]] or DEFAULT_PAGE_SIZES
+    for size in sizes:
+        print(f"\npage of {size} users")
+        print(
+            f"{'encoding':>22} {'bytes':>9} {'B/row':>7} {'encode us':>10} {'decode us':>10}"
+        )
+        for label, iso, serializer in variants():
+            rows = page(size, iso)
+            if serializer is None:
+                result = measure(lambda r: json.dumps(r).encode(), json.loads, rows)
+            else:
+                result = measure(serializer.encode, serializer.decode, rows)
+            payload, encode_us, decode_us = result
+            print(
+                f"{label:>22} {payload:>9} {payload / size:>7.1f} {encode_us:>10.1f} {decode_us:>10.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
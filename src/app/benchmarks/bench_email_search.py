@@ -0,0 +1,97 @@
+"""
+Benchmark the email search on a growing `user` table.
+
+SQLite stands in for Postgres: with `case_sensitive_like` enabled it serves
+`email LIKE 'prefix%'` from the plain B-tree index, the same way Postgres serves
+it from `ix_user_email_pattern`. Substring search has no SQLite equivalent of the
+`pg_trgm` index, so it is reported as the full scan baseline.
+
+Usage (from `src/`):
+    python -m app.benchmarks.bench_email_search [ROWS ...]
+"""
+import random
+import string
+import sys
+import time
+from typing import Any, Callable, List
+
+from sqlalchemy import create_engine, event, insert, text
+from sqlalchemy.orm import Session
+
+from app.crud import users
+from app.models.base import Base
+from app.models.user import User
+
+DEFAULT_ROWS = [10_000, 100_000, 1_000_000]
+QUERIES = 200
+
+
+def random_email(rng: random.Random) -> str:
+    name = "".join(rng.choices(string.ascii_lowercase + string.digits, k=12))
+    domain = rng.choice(["example.com", "example.org", "mail.test", "corp.test"])
+    return f"{name}@{domain}"
+
+
+def build_engine(rows: int, rng: random.Random) -> Any:
+    engine = create_engine("sqlite://")
+
+    @event.listens_for(engine, "connect")
+    def _case_sensitive_like(dbapi_connection: Any, _: Any) -> None:
+        dbapi_connection.execute("PRAGMA case_sensitive_like = ON")
+
+    Base.metadata.create_all(engine)
+    with engine.begin() as conn:
+        batch = 50_000
+        for start in range(0, rows, batch):
+            conn.execute(
+                insert(User),
+                [{"email": random_email(rng)} for _ in range(min(batch, rows - start))],
+            )
+    return engine
+
+
+def timed(engine: Any, stmts: List[Any]) -> float:
+    with Session(engine) as session:
+        started = time.perf_counter()
+        for stmt in stmts:
+            session.scalars(stmt).all()
+        return (time.perf_counter() - started) / len(stmts) * 1e6
+
+
+def run(rows: int) -> List[float]:
+    rng = random.Random(rows)
+    engine = build_engine(rows, rng)
+    needles = [random_email(rng)[:4] for _ in range(QUERIES)]
+
+    def stmts(build: Callable[[str], Any]) -> List[Any]:
+        return [users._select_multi(limit=100, filters=build(n)) for n in needles]
+
+    prefix = stmts(lambda n: users.search_filters(email_prefix=n))
+    contains = stmts(lambda n: users.search_filters(email_contains=n))
+
+    indexed = timed(engine, prefix)
+    with engine.begin() as conn:
+        conn.execute(text("DROP INDEX ix_user_email_pattern"))
+    unindexed = timed(engine, prefix)
+    substring = timed(engine, contains)
+    engine.dispose()
+    return [indexed, unindexed, substring]
+
+
+def main() -> None:
+    sizes = [int(arg) for arg in sys.argv[1:]] or DEFAULT_ROWS
+    print(
+        f"{'rows':>10} {'prefix idx us':>14} {'prefix scan us':>15} {'substr scan us':>15}"
+    )
+    previous = None
+    for rows in sizes:
+        results = run(rows)
+        line = f"{rows:>10} " + " ".join(f"{r:>14.1f}" for r in results)
+        if previous:
+            line += f" idx growth x{results[0] / previous[0]:.2f}"
+        print(line)
+        previous = results
+
+
+if __name__ == "__main__":
+    main()
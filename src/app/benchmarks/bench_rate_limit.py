@@ -0,0 +1,101 @@
+"""
+Measure the latency the rate limiter adds to each request.
+
+`none` calls a bare ASGI app. `local` goes through `RateLimitMiddleware` with the
+in-process buckets used while Redis is unavailable. `redis` uses the Lua token bucket on
+the Redis of `REDIS_URI`, one `EVALSHA` round trip per request, and is skipped if Redis
+cannot be reached. Requests come from 1000 clients and the limits are high enough that
+none is rejected.
+
+Usage (from `src/`):
+    python -m app.benchmarks.bench_rate_limit [REQUESTS ...]
+"""
+import asyncio
+import statistics
+import sys
+import time
+from typing import Any, Dict, List
+
+from app.middleware.rate_limit import (
+    Decision,
+    RateLimit,
+    RateLimiter,
+    RateLimitMiddleware,
+)
+from app.util.cache import redis_breaker
+
+DEFAULT_REQUESTS = [10_000]
+CLIENTS = 1000
+
+
+class LocalRateLimiter(RateLimiter):
+    async def acquire(self, route_class: str, client: str) -> Decision:
+        key = f"{self.prefix}:{route_class}:{client}"
+        return self.fallback.acquire(key, self.limits[route_class])
+
+
+def limiter(cls: type) -> RateLimiter:
+    return cls(
+        limits={"list": RateLimit(rate=1e6, burst=1_000_000)},
+        routes={"GET /api/v1/user/": "list"},
+        key_header="X-API-Key",
+        fallback_size=CLIENTS,
+        prefix="bench_rate_limit",
+    )
+
+
+async def app(scope: Dict[str, Any], receive: Any, send: Any) -> None:
+    pass
+
+
+async def measure(handler: Any, requests: int) -> List[float]:
+    scopes = [
+        {
+            "type": "http",
+            "method": "GET",
+            "path": "/api/v1/user/",
+            "headers": [],
+            "client": (f"10.0.{i // 256}.{i % 256}", 40000),
+        }
+        for i in range(CLIENTS)
+    ]
+    timings = []
+    for i in range(requests):
+        started = time.perf_counter()
+        await handler(scopes[i % CLIENTS], None, None)
+        timings.append(time.perf_counter() - started)
+    return timings
+
+
+async def redis_available(rate_limiter: RateLimiter) -> bool:
+    await rate_limiter.acquire("list", "ip:probe")
+    return rate_limiter.fallbacks == 0 and redis_breaker.state == "closed"
+
+
+async def main() -> None:
+    sizes = [int(arg) for arg in sys.argv[1:]] or DEFAULT_REQUESTS
+    redis_limiter = limiter(RateLimiter)
+    handlers = {
+        "none": app,
+        "local": RateLimitMiddleware(app, limiter(LocalRateLimiter)),
+    }
+    if await redis_available(redis_limiter):
+        handlers["redis"] = RateLimitMiddleware(app, redis_limiter)
+    else:
+        print("Redis unavailable, skipping the redis runs")
+
+    print(f"{'requests':>9} {'limiter':>8} {'mean us':>9} {'p50 us':>8} {'p99 us':>8}")
+    for size in sizes:
+        for name, handler in handlers.items():
+            # Warm up, e.g. to load the script into Redis
+            await measure(handler, min(size, CLIENTS))
+            timings = sorted(await measure(handler, size))
+            mean = statistics.fmean(timings) * 1e6
+            p50 = timings[len(timings) // 2] * 1e6
+            p99 = timings[int(len(timings) * 0.99)] * 1e6
+            print(f"{size:>9} {name:>8} {mean:>9.1f} {p50:>8.1f} {p99:>8.1f}")
+    await redis_limiter.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,77 @@
+"""
+Compare the ORM list path with the plain row path on large pages.
+
+`orm` loads `User` instances through the session (identity map, instance state) and
+converts them with `serializer().dicts`, as `get_multi` callers do. `rows` selects the
+columns with `CRUDBase._select_rows` and converts them with `serializer().row_dicts`,
+as `read_users` does. Both run the statements the CRUD layer builds, on SQLite.
+
+Usage (from `src/`):
+    python -m app.benchmarks.bench_read_path [PAGE_SIZE ...]
+"""
+import sys
+import time
+import tracemalloc
+from typing import Any, Callable, List, Tuple
+
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import Session
+
+from app.crud import users
+from app.models.base import Base
+from app.models.user import User
+
+DEFAULT_PAGE_SIZES = [1_000, 10_000]
+REPEAT = 5
+
+
+def build_engine(rows: int) -> Any:
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    with engine.begin() as conn:
+        conn.execute(
+            insert(User), [{"email": f"user{i}@example.com"} for i in range(rows)]
+        )
+    return engine
+
+
+def orm_page(session: Session, size: int) -> List[Any]:
+    objs = session.scalars(users._select_multi(limit=size)).all()
+    return User.serializer().dicts(objs)
+
+
+def rows_page(session: Session, size: int) -> List[Any]:
+    rows = session.execute(users._select_rows(limit=size)).all()
+    return User.serializer().row_dicts(rows)
+
+
+def measure(
+    engine: Any, page: Callable[[Session, int], Any], size: int
+) -> Tuple[float, float]:
+    best = float("inf")
+    for _ in range(REPEAT):
+        with Session(engine) as session:
+            started = time.perf_counter()
+            page(session, size)
+            best = min(best, time.perf_counter() - started)
+    with Session(engine) as session:
+        tracemalloc.start()
+        result = page(session, size)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        del result
+    return best * 1000, peak / 1024
+
+
+def main() -> None:
+    sizes = [int(arg) for arg in sys.argv[1:]] or DEFAULT_PAGE_SIZES
+    engine = build_engine(max(sizes))
+    print(f"{'page':>7} {'path':>5} {'ms':>8} {'peak KiB':>10}")
+    for size in sizes:
+        for name, page in (("orm", orm_page), ("rows", rows_page)):
+            ms, peak = measure(engine, page, size)
+            print(f"{size:>7} {name:>5} {ms:>8.2f} {peak:>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""
+Compare the ways of turning loaded `User` rows into dicts and JSON.
+
+`legacy Base.dict` is the previous implementation, walking `__dict__` and
+isoformatting every datetime it finds.
+
+Usage (from `src/`):
+    python -m app.benchmarks.bench_serializer [ROWS]
+"""
+import datetime
+import json
+import sys
+import timeit
+from typing import Any, Callable, Dict, List
+
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy import create_engine, insert, select
+from sqlalchemy.orm import Session
+
+from app import schemas
+from app.models.base import Base
+from app.models.user import User
+
+
+def legacy_dict(obj: Any) -> Dict[str, Any]:
+    return {
+        k: v.isoformat() if isinstance(v, datetime.datetime) else v
+        for k, v in obj.__dict__.items()
+        if not k.startswith("_")
+    }
+
+
+def load_users(rows: int) -> List[User]:
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    with engine.begin() as conn:
+        conn.execute(
+            insert(User), [{"email": f"user{i}@example.com"} for i in range(rows)]
+        )
+    with Session(engine, expire_on_commit=False) as session:
+        users = list(session.scalars(select(User)))
+        session.expunge_all()
+    return users
+
+
+def main() -> None:
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    users = load_users(rows)
+    serializer = User.serializer()
+    candidates: Dict[str, Callable[[User], Any]] = {
+        "legacy Base.dict": legacy_dict,
+        "legacy Base.__repr__": lambda u: json.dumps(legacy_dict(u)),
+        "jsonable_encoder": jsonable_encoder,
+        "pydantic from_orm": lambda u: schemas.User.from_orm(u).dict(),
+        "serializer.dict": serializer.dict,
+        "serializer.json": serializer.json,
+    }
+    print(f"{rows} users, time per row")
+    print(f"{'method':>22} {'us/row':>8} {'speedup':>8}")
+    baseline = None
+    for name, func in candidates.items():
+        seconds = min(timeit.repeat(lambda: [func(u) for u in users], number=5, repeat=5))
+        per_row = seconds / 5 / rows * 1e6
+        baseline = baseline or per_row
+        print(f"{name:>22} {per_row:>8.2f} {baseline / per_row:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+"""
+Compare the shipped gunicorn profile with the server defaults it replaced.
+
+`baseline` is gunicorn without a config file: one worker running uvicorn on the asyncio
+loop with the h11 parser, as the image did without `gunicorn_conf.py`, uvloop and
+httptools. `tuned` is `gunicorn_conf.py` with `app.worker.TunedUvicornWorker`.
+
+Both serve `/api/v1/health/_alive`, which needs neither Postgres nor Redis, to a
+keep-alive load generator spread over several processes.
+
+Usage (from `src/`):
+    python -m app.benchmarks.bench_server [SECONDS] [CONNECTIONS]
+"""
+import asyncio
+import multiprocessing
+import os
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import time
+from typing import Dict, List, Tuple
+
+from uvicorn.workers import UvicornWorker
+
+HOST = "127.0.0.1"
+PATH = "/api/v1/health/_alive"
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SRC_DIR = os.path.dirname(APP_DIR)
+
+
+class StockUvicornWorker(UvicornWorker):
+    """
+    The uvicorn worker as it ran before uvloop and httptools were installed.
+
+    """
+
+    CONFIG_KWARGS = {"loop": "asyncio", "http": "h11"}
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind((HOST, 0))
+        return int(sock.getsockname()[1])
+
+
+def start_server(profile: str, port: int) -> subprocess.Popen:  # type: ignore
+    command = [sys.executable, "-m", "gunicorn", "app.main:app"]
+    if profile == "baseline":
+        command += ["-k", "app.benchmarks.bench_server.StockUvicornWorker"]
+        command += ["-b", f"{HOST}:{port}", "--log-level", "warning"]
+    else:
+        command += ["-c", os.path.join(APP_DIR, "gunicorn_conf.py")]
+    env = dict(
+        os.environ,
+        PYTHONPATH=SRC_DIR,
+        BIND=f"{HOST}:{port}",
+        ACCESS_LOG="",
+        LOG_LEVEL="warning",
+        REDIS_HOST=os.getenv("REDIS_HOST", "localhost"),
+    )
+    server = subprocess.Popen(command, env=env, cwd=SRC_DIR)
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection((HOST, port), timeout=0.2).close()
+            return server
+        except OSError:
+            time.sleep(0.2)
+    server.kill()
+    raise RuntimeError(f"{profile} server did not start")
+
+
+async def client(port: int, until: float, latencies: List[float]) -> None:
+    reader, writer = await asyncio.open_connection(HOST, port)
+    request = f"GET {PATH} HTTP/1.1\r\nHost: bench\r\n\r\n".encode()
+    while time.monotonic() < until:
+        started = time.perf_counter()
+        writer.write(request)
+        headers = await reader.readuntil(b"\r\n\r\n")
+        length = 0
+        for line in headers.split(b"\r\n"):
+            if line.lower().startswith(b"content-length:"):
+                length = int(line.split(b":", 1)[1])
+        await reader.readexactly(length)
+        latencies.append(time.perf_counter() - started)
+    writer.close()
+
+
+def load(port: int, seconds: float, connections: int) -> List[float]:
+    latencies: List[float] = []
+
+    async def run() -> None:
+        until = time.monotonic() + seconds
+        await asyncio.gather(
+            *[client(port, until, latencies) for _ in range(connections)]
+        )
+
+    asyncio.run(run())
+    return latencies
+
+
+def measure(port: int, seconds: float, connections: int) -> Dict[str, float]:
+    processes = max(os.cpu_count() or 1, 1)
+    per_process = max(connections // processes, 1)
+    with multiprocessing.Pool(processes) as pool:
+        results = pool.starmap(load, [(port, seconds, per_process)] * processes)
+    latencies = sorted(lat for result in results for lat in result)
+    return {
+        "rps": len(latencies) / seconds,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p99_ms": latencies[int(len(latencies) * 0.99) - 1] * 1000,
+    }
+
+
+def bench(profile: str, seconds: float, connections: int) -> Tuple[str, Dict[str, float]]:
+    port = free_port()
+    server = start_server(profile, port)
+    try:
+        measure(port, 1, connections)  # warm up
+        return profile, measure(port, seconds, connections)
+    finally:
+        server.send_signal(signal.SIGTERM)
+        server.wait(timeout=60)
+
+
+def main() -> None:
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 10
+    connections = int(sys.argv[2]) if len(sys.argv) > 2 else 64
+    print(f"{'profile':>10} {'req/s':>10} {'p50 ms':>8} {'p99 ms':>8}")
+    for profile in ("baseline", "tuned"):
+        name, result = bench(profile, seconds, connections)
+        print(
+            f"{name:>10} {result['rps']:>10.0f} "
+            f"{result['p50_ms']:>8.2f} {result['p99_ms']:>8.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
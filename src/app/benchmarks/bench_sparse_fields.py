@@ -0,0 +1,66 @@
+"""
+Measure what `?fields=` saves on user list pages.
+
+Each page runs the statement `CRUDBase._select_rows` builds for the projection, converts
+the rows with the matching serializer and renders the JSON body, on SQLite.
+
+Usage (from `src/`):
+    python -m app.benchmarks.bench_sparse_fields [PAGE_SIZE ...]
+"""
+import json
+import sys
+import time
+from typing import Any, Optional, Tuple
+
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import Session
+
+from app.crud import users
+from app.models.base import Base
+from app.models.user import User
+
+DEFAULT_PAGE_SIZES = [100, 1_000, 10_000]
+PROJECTIONS = [None, ("id", "email"), ("id",)]
+REPEAT = 5
+
+
+def build_engine(rows: int) -> Any:
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    with engine.begin() as conn:
+        conn.execute(
+            insert(User), [{"email": f"user{i}@example.com"} for i in range(rows)]
+        )
+    return engine
+
+
+def page(engine: Any, size: int, fields: Optional[Tuple[str, ...]]) -> Tuple[float, int]:
+    best = float("inf")
+    body = b""
+    for _ in range(REPEAT):
+        with Session(engine) as session:
+            started = time.perf_counter()
+            rows = session.execute(users._select_rows(limit=size, fields=fields)).all()
+            body = json.dumps(User.serializer(fields).row_dicts(rows)).encode()
+            best = min(best, time.perf_counter() - started)
+    return best * 1000, len(body)
+
+
+def main() -> None:
+    sizes = [int(arg) for arg in sys.argv[1:]] or DEFAULT_PAGE_SIZES
+    engine = build_engine(max(sizes))
+    print(f"{'page':>7} {'fields':>24} {'ms':>8} {'bytes':>9} {'bytes/ms':>8}")
+    for size in sizes:
+        full = None
+        for fields in PROJECTIONS:
+            ms, length = page(engine, size, fields)
+            full = full or (ms, length)
+            label = ",".join(fields) if fields else "(all)"
+            saving = (
+                f"-{(1 - length / full[1]) * 100:.0f}%/-{(1 - ms / full[0]) * 100:.0f}%"
+            )
+            print(f"{size:>7} {label:>24} {ms:>8.2f} {length:>9} {saving:>8}")
+
+
+if __name__ == "__main__":
+    main()
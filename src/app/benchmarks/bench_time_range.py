@@ -0,0 +1,129 @@
+"""
+Benchmark fetching the users changed since a point in time against a full-table crawl.
+
+The table holds a year of users, in `created_at` order, of which `CHANGED` were updated
+within the last hour. `crawl` pages through every user by ID and keeps the changed ones,
+what a sync job without time filters has to do. `delta` pages with `updated_since` and
+a keyset over `(updated_at, id)`, served by `ix_user_updated_at_id`. `created` pages
+through the users created within the last day; SQLite has no BRIN index, so it scans the
+table as Postgres would without `ix_user_created_at_brin`.
+
+Usage (from `src/`):
+    python -m app.benchmarks.bench_time_range [ROWS ...]
+"""
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+from typing import Any, Callable, List, Optional, Tuple
+
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import Session
+
+from app.crud import users
+from app.models.base import Base
+from app.models.user import User
+
+DEFAULT_ROWS = [100_000, 1_000_000]
+CHANGED = 0.01
+PAGE = 1000
+NOW = datetime(2026, 10, 18)
+
+
+def build_engine(rows: int, rng: random.Random) -> Any:
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    step = timedelta(days=365) / rows
+    with engine.begin() as conn:
+        batch = 50_000
+        for start in range(0, rows, batch):
+            values = []
+            for i in range(start, min(start + batch, rows)):
+                created_at = NOW - timedelta(days=365) + step * i
+                updated_at = created_at
+                if rng.random() < CHANGED:
+                    updated_at = NOW - timedelta(seconds=rng.uniform(0, 3600))
+                values.append(
+                    {
+                        "id": i + 1,
+                        "email": f"user{i}@example.com",
+                        "created_at": created_at,
+                        "updated_at": updated_at,
+                    }
+                )
+            conn.execute(insert(User), values)
+    return engine
+
+
+def iterate(
+    session: Session,
+    order: List[str],
+    filters: List[Any],
+    cursor: Callable[[Any], Tuple[Any, Any]],
+) -> List[Any]:
+    rows: List[Any] = []
+    after: Optional[Tuple[Any, Any]] = None
+    while True:
+        page_filters = list(filters)
+        if after is not None:
+            page_filters.append(users.keyset_filter(order[0], after))
+        stmt = users._select_multi(limit=PAGE, filters=page_filters, order_by=order)
+        page = session.scalars(stmt).all()
+        rows.extend(page)
+        if len(page) < PAGE:
+            return rows
+        after = cursor(page[-1])
+
+
+def timed(engine: Any, crawl: Callable[[Session], List[Any]]) -> Tuple[float, int]:
+    with Session(engine) as session:
+        started = time.perf_counter()
+        found = len(crawl(session))
+        return (time.perf_counter() - started) * 1e3, found
+
+
+def run(rows: int) -> List[Tuple[float, int]]:
+    engine = build_engine(rows, random.Random(rows))
+    since = NOW - timedelta(hours=1)
+
+    def crawl(session: Session) -> List[Any]:
+        every = iterate(session, ["id"], [], lambda u: (None, u.id))
+        return [u for u in every if u.updated_at >= since]
+
+    def delta(session: Session) -> List[Any]:
+        return iterate(
+            session,
+            ["updated_at", "id"],
+            users.range_filter("updated_at", since=since),
+            lambda u: (u.updated_at, u.id),
+        )
+
+    def created(session: Session) -> List[Any]:
+        return iterate(
+            session,
+            ["id"],
+            users.range_filter("created_at", since=NOW - timedelta(days=1)),
+            lambda u: (None, u.id),
+        )
+
+    results = [timed(engine, crawl), timed(engine, delta), timed(engine, created)]
+    engine.dispose()
+    return results
+
+
+def main() -> None:
+    sizes = [int(arg) for arg in sys.argv[1:]] or DEFAULT_ROWS
+    print(
+        f"{'rows':>10} {'crawl ms':>10} {'delta ms':>10} {'changed':>8} "
+        f"{'created ms':>11} {'created':>8}"
+    )
+    for rows in sizes:
+        (crawl, _), (delta, changed), (created, found) = run(rows)
+        print(
+            f"{rows:>10} {crawl:>10.1f} {delta:>10.1f} {changed:>8} "
+            f"{created:>11.1f} {found:>8} speedup x{crawl / delta:.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
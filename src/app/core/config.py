@@ -1,5 +1,5 @@
 from pathlib import Path
-from typing import Any, Dict, Optional
+from typing import Any, Dict, List, Optional, Tuple
 
 from pydantic import BaseSettings, PostgresDsn, validator
 
@@ -9,6 +9,10 @@ class Settings(BaseSettings):
     APP_DIR: str = str(Path(__file__).resolve(strict=True).parent.parent)
     PROJECT_NAME: str = "Demo"
     DEBUG_MODE: bool = False
+    # Token expected in the X-Admin-Token header of the admin endpoints, None disables them
+    ADMIN_TOKEN: Optional[str] = None
+    # Time budget of each request in seconds, 0 disables it
+    REQUEST_TIMEOUT: float = 10.0
 
     # Database
     POSTGRES_SERVER: str = "localhost:5432"
@@ -17,6 +21,24 @@ class Settings(BaseSettings):
     POSTGRES_DB: str = "app"
     DB_URI: Optional[PostgresDsn] = None
     DB_ASYNC_URI: Optional[PostgresDsn] = None
+    DB_POOL_SIZE: int = 5
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_TIMEOUT: float = 5.0
+    DB_POOL_RECYCLE: int = 1800
+    # Async URIs of the databases the user table is sharded across, by consistent hash of
+    # the user ID. Empty for a single database, DB_ASYNC_URI. Multi-shard writes commit
+    # with two-phase commit if DB_SHARD_TWO_PHASE is set (needs max_prepared_transactions)
+    DB_SHARDS: List[str] = []
+    DB_SHARD_TWO_PHASE: bool = False
+    # Snowflake IDs: worker ID, leased from Redis if None, and epoch in ms. A lease lasts
+    # SNOWFLAKE_LEASE_TTL seconds and is renewed every SNOWFLAKE_LEASE_RENEW_INTERVAL
+    # seconds. Without a lease, e.g. while Redis is down, creates are refused with a 503
+    SNOWFLAKE_WORKER_ID: Optional[int] = None
+    SNOWFLAKE_EPOCH_MS: int = 1_704_067_200_000
+    SNOWFLAKE_LEASE_TTL: float = 30.0
+    SNOWFLAKE_LEASE_RENEW_INTERVAL: float = 10.0
+    # Log every statement through SQLAlchemy, very verbose
+    DB_ECHO: bool = False
 
     # Cache
     REDIS_HOST: str
@@ -24,6 +46,127 @@ class Settings(BaseSettings):
     REDIS_DB: int = 0
     REDIS_TTL: int = 60
     REDIS_URI: Optional[str] = None
+    # Timeout of each cache call in seconds, failures past it count towards the breaker
+    CACHE_TIMEOUT: float = 0.1
+    CACHE_BREAKER_FAILURE_THRESHOLD: int = 5
+    CACHE_BREAKER_RESET_TIMEOUT: float = 10.0
+    # Cache payloads: codec ("msgpack" or "json"), compression ("zstd", "lz4" or None)
+    # applied above the threshold in bytes, and the version of the cached data layout,
+    # to bump whenever a cached schema changes
+    CACHE_CODEC: str = "msgpack"
+    CACHE_COMPRESSION: Optional[str] = "zstd"
+    CACHE_COMPRESSION_THRESHOLD: int = 1024
+    CACHE_SCHEMA_VERSION: int = 1
+    # Lifetime of the cache entries recording that an object does not exist. They are
+    # tagged by ID, and creating an object with that ID clears them sooner
+    NEGATIVE_CACHE_TTL: int = 10
+    # Bloom filter of existing user ids, sized for USER_BLOOM_CAPACITY ids. Each worker
+    # checks every USER_BLOOM_CHECK_INTERVAL seconds that it is built, and builds it if not
+    USER_BLOOM_ENABLED: bool = True
+    USER_BLOOM_CAPACITY: int = 1_000_000
+    USER_BLOOM_ERROR_RATE: float = 0.01
+    USER_BLOOM_CHECK_INTERVAL: float = 60.0
+
+    # Cache invalidation outbox: writes record the tags they make stale in their own
+    # transaction, and a background drainer delivers them to Redis as soon as the write
+    # commits, and at least every CACHE_OUTBOX_POLL_INTERVAL seconds. Failed deliveries
+    # are retried with exponential backoff up to CACHE_OUTBOX_MAX_BACKOFF seconds. Cache
+    # reads are skipped while the oldest undelivered invalidation of a shard is older than
+    # CACHE_OUTBOX_MAX_LAG seconds, measured every poll, so a committed write is served
+    # from the cache for at most about CACHE_OUTBOX_MAX_LAG + CACHE_OUTBOX_POLL_INTERVAL
+    # seconds. 0 disables the bound
+    CACHE_OUTBOX_ENABLED: bool = True
+    CACHE_OUTBOX_BATCH_SIZE: int = 500
+    CACHE_OUTBOX_POLL_INTERVAL: float = 1.0
+    CACHE_OUTBOX_MAX_BACKOFF: float = 30.0
+    CACHE_OUTBOX_MAX_LAG: float = 5.0
+
+    # Hot keys: the HOT_KEYS_TOP_K most read cache keys of each worker, counted in a
+    # count-min sketch, are reloaded every HOT_KEYS_REFRESH_INTERVAL seconds when they
+    # expire within HOT_KEYS_REFRESH_AHEAD seconds, at most HOT_KEYS_REFRESH_BUDGET keys
+    # per round. Counts are halved every HOT_KEYS_DECAY_INTERVAL seconds
+    HOT_KEYS_ENABLED: bool = False
+    HOT_KEYS_TOP_K: int = 100
+    HOT_KEYS_SKETCH_WIDTH: int = 4096
+    HOT_KEYS_SKETCH_DEPTH: int = 4
+    HOT_KEYS_REFRESH_INTERVAL: float = 5.0
+    HOT_KEYS_REFRESH_AHEAD: float = 15.0
+    HOT_KEYS_REFRESH_BUDGET: int = 20
+    HOT_KEYS_DECAY_INTERVAL: float = 60.0
+
+    # Request stats: Server-Timing header and one log line per request, statements slower
+    # than SLOW_QUERY_THRESHOLD seconds (0 disables), and a warning when a request runs the
+    # same statement more than N_PLUS_ONE_THRESHOLD times
+    REQUEST_STATS_ENABLED: bool = True
+    SLOW_QUERY_THRESHOLD: float = 0.2
+    N_PLUS_ONE_THRESHOLD: int = 10
+
+    # Tracing: share of requests traced, unless the caller's traceparent decides, and the
+    # span exporter, "memory" (ring buffer behind /health/_traces) or "jsonl" (TRACING_FILE,
+    # where {pid} is replaced by the worker's process ID)
+    TRACING_ENABLED: bool = False
+    TRACING_SAMPLE_RATIO: float = 0.1
+    TRACING_EXPORTER: str = "memory"
+    TRACING_BUFFER_SIZE: int = 10_000
+    TRACING_FILE: str = "/tmp/traces-{pid}.jsonl"
+
+    # Memory diagnostics: admin endpoints under /health/_memory, tracemalloc started at
+    # boot with that many frames per allocation (0 leaves it off until asked for), and
+    # an RSS sampler logging every MEMORY_SAMPLE_INTERVAL seconds (0 disables it) with
+    # the growth trend over the last MEMORY_SAMPLE_WINDOW samples
+    MEMORY_DIAGNOSTICS_ENABLED: bool = False
+    MEMORY_TRACEMALLOC_FRAMES: int = 0
+    MEMORY_SAMPLE_INTERVAL: float = 0
+    MEMORY_SAMPLE_WINDOW: int = 288
+
+    # Maximum number of operations accepted by the batch endpoints
+    BATCH_MAX_OPERATIONS: int = 500
+
+    # Long-lived streaming endpoints, exempt from the request deadline
+    STREAMING_PATHS: List[str] = ["/api/v1/user/_changes"]
+
+    # Change feed: LISTEN channel, which the trigger gets from its migration (alembic -x
+    # channel=..., defaults to this variable), events buffered per client before it is
+    # evicted, maximum concurrent clients per worker, heartbeat interval and how far before
+    # the Last-Event-ID cursor a resume starts, to catch transactions that committed late
+    CHANGE_FEED_ENABLED: bool = True
+    CHANGE_FEED_CHANNEL: str = "user_changes"
+    CHANGE_FEED_BUFFER: int = 1000
+    CHANGE_FEED_MAX_CLIENTS: int = 500
+    CHANGE_FEED_HEARTBEAT: float = 15.0
+    CHANGE_FEED_RESUME_OVERLAP: float = 5.0
+    CHANGE_FEED_REPLAY_BATCH: int = 500
+
+    # Rate limiting: one token bucket per client, identified by the API key in
+    # RATE_LIMIT_KEY_HEADER if its SHA-256 hex digest is one of RATE_LIMIT_API_KEYS, else
+    # by IP, and route class. RATE_LIMIT_ROUTES maps "METHOD path" glob patterns to
+    # a class, first match wins, and RATE_LIMIT_CLASSES gives the tokens per second and
+    # burst of each class. Requests mapped to no class are not limited. Buckets live in
+    # Redis, in process (at most RATE_LIMIT_FALLBACK_BUCKETS) while it is unavailable
+    RATE_LIMIT_ENABLED: bool = False
+    RATE_LIMIT_KEY_HEADER: str = "X-API-Key"
+    RATE_LIMIT_API_KEYS: List[str] = []
+    RATE_LIMIT_CLASSES: Dict[str, Tuple[float, int]] = {
+        "list": (5.0, 20),
+        "read": (50.0, 100),
+        "write": (10.0, 20),
+    }
+    RATE_LIMIT_ROUTES: Dict[str, str] = {
+        "* /api/v1/health/*": "",
+        "GET /api/v1/user/": "list",
+        "GET /api/v1/*": "read",
+        "* /api/v1/*": "write",
+    }
+    RATE_LIMIT_FALLBACK_BUCKETS: int = 10_000
+
+    # Admission control
+    ADMISSION_CONTROL_ENABLED: bool = True
+    ADMISSION_READ_LIMIT: int = 64
+    ADMISSION_WRITE_LIMIT: int = 16
+    ADMISSION_HEALTH_LIMIT: int = 4
+    ADMISSION_QUEUE_SIZE: int = 64
+    ADMISSION_QUEUE_TIMEOUT: float = 1.0
+    ADMISSION_RETRY_AFTER: int = 1
 
     # pylint: disable=no-self-argument
     @validator("DB_ASYNC_URI", pre=True)
@@ -0,0 +1,45 @@
+import asyncio
+from contextvars import ContextVar, Token
+from typing import Optional
+
+# Loop time at which the current request runs out of budget
+_deadline: ContextVar[Optional[float]] = ContextVar("request_deadline", default=None)
+
+
+def set_deadline(timeout: float) -> Token[Optional[float]]:
+    """
+    Start the time budget of the current request.
+
+    Args:
+        timeout (float): The budget, in seconds.
+
+    Returns:
+        Token[Optional[float]]: The token to pass to `reset_deadline` once the request is done.
+
+    """
+    return _deadline.set(asyncio.get_running_loop().time() + timeout)
+
+
+def reset_deadline(token: Token[Optional[float]]) -> None:
+    """
+    Clear the time budget set by `set_deadline`.
+
+    Args:
+        token (Token[Optional[float]]): The token returned by `set_deadline`.
+
+    """
+    _deadline.reset(token)
+
+
+def remaining() -> Optional[float]:
+    """
+    Get the time left before the current request's deadline.
+
+    Returns:
+        Optional[float]: The seconds left, never negative, or None if there is no deadline.
+
+    """
+    deadline = _deadline.get()
+    if deadline is None:
+        return None
+    return max(deadline - asyncio.get_running_loop().time(), 0.0)
@@ -0,0 +1,166 @@
+import hashlib
+import json
+import logging
+import re
+from collections import Counter
+from contextvars import ContextVar, Token
+from functools import lru_cache
+from typing import Any, Dict, Optional
+
+_COMMENTS = re.compile(r"--[^\n]*|/\*.*?\*/", re.S)
+_STRINGS = re.compile(r"'(?:[^']|'')*'")
+_NUMBERS = re.compile(r"(?<![\w$])-?\d+(?:\.\d+)?\b")
+_PLACEHOLDERS = re.compile(r"\$\d+|%\(\w+\)s|%s|(?<!:):\w+|\?")
+_LISTS = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_SPACES = re.compile(r"\s+")
+
+
+@lru_cache(maxsize=1024)
+def fingerprint(statement: str) -> str:
+    """
+    Normalize a SQL statement so that executions differing only by their parameters match.
+
+    Literals and bind placeholders become `?`, lists of them `(...)`, and whitespace and
+    comments are collapsed, so no parameter value ever reaches the logs.
+
+    Args:
+        statement (str): The SQL statement.
+
+    Returns:
+        str: The fingerprint.
+
+    """
+    statement = _COMMENTS.sub(" ", statement)
+    statement = _STRINGS.sub("?", statement)
+    statement = _PLACEHOLDERS.sub("?", statement)
+    statement = _NUMBERS.sub("?", statement)
+    statement = _LISTS.sub("(...)", statement)
+    return _SPACES.sub(" ", statement).strip()
+
+
+def fingerprint_id(fingerprint: str) -> str:
+    """
+    Get a short, stable ID of a fingerprint, to group log lines by.
+
+    Args:
+        fingerprint (str): The fingerprint.
+
+    Returns:
+        str: The first 12 hex digits of its SHA-1.
+
+    """
+    return hashlib.sha1(fingerprint.encode("utf-8")).hexdigest()[:12]
+
+
+def log_event(logger: logging.Logger, level: int, event: str, **fields: Any) -> None:
+    """
+    Log a structured event as a single JSON line.
+
+    Args:
+        logger (logging.Logger): The logger.
+        level (int): The logging level.
+        event (str): The event name, e.g. `slow_query`.
+        **fields (Any): The event's fields.
+
+    """
+    if logger.isEnabledFor(level):
+        logger.log(level, json.dumps({"event": event, **fields}, default=str))
+
+
+class RequestStats:
+    """
+    Database and Redis activity of one request.
+
+    Attributes:
+        queries (int): The number of SQL statements executed.
+        db_time (float): The time spent executing them, in seconds.
+        redis_commands (int): The number of Redis commands sent.
+        redis_time (float): The time spent waiting for Redis, in seconds.
+        fingerprints (Counter[str]): The number of executions of each statement fingerprint.
+
+    """
+
+    def __init__(self) -> None:
+        self.queries = 0
+        self.db_time = 0.0
+        self.redis_commands = 0
+        self.redis_time = 0.0
+        self.fingerprints: "Counter[str]" = Counter()
+
+    def record_query(self, fingerprint: str, elapsed: float) -> None:
+        """
+        Record an executed SQL statement.
+
+        Args:
+            fingerprint (str): The statement's fingerprint.
+            elapsed (float): Its execution time, in seconds.
+
+        """
+        self.queries += 1
+        self.db_time += elapsed
+        self.fingerprints[fingerprint] += 1
+
+    def record_redis(self, commands: int, elapsed: float) -> None:
+        """
+        Record a Redis round trip.
+
+        Args:
+            commands (int): The number of commands sent, more than one for pipelines.
+            elapsed (float): The time spent waiting for the reply, in seconds.
+
+        """
+        self.redis_commands += commands
+        self.redis_time += elapsed
+
+    def repeated(self, threshold: int) -> Dict[str, int]:
+        """
+        Get the fingerprints executed more than `threshold` times, a likely N+1 pattern.
+
+        Args:
+            threshold (int): The maximum number of executions considered normal.
+
+        Returns:
+            Dict[str, int]: The execution count of each repeated fingerprint.
+
+        """
+        return {fp: count for fp, count in self.fingerprints.items() if count > threshold}
+
+
+# Stats of the request being served, shared by the tasks it spawns
+_stats: ContextVar[Optional[RequestStats]] = ContextVar("request_stats", default=None)
+
+
+def start_stats(stats: RequestStats) -> Token[Optional[RequestStats]]:
+    """
+    Start collecting the stats of the current request.
+
+    Args:
+        stats (RequestStats): The stats to fill.
+
+    Returns:
+        Token[Optional[RequestStats]]: The token to pass to `reset_stats` once the request is done.
+
+    """
+    return _stats.set(stats)
+
+
+def reset_stats(token: Token[Optional[RequestStats]]) -> None:
+    """
+    Stop collecting the stats started by `start_stats`.
+
+    Args:
+        token (Token[Optional[RequestStats]]): The token returned by `start_stats`.
+
+    """
+    _stats.reset(token)
+
+
+def current_stats() -> Optional[RequestStats]:
+    """
+    Get the stats of the current request.
+
+    Returns:
+        Optional[RequestStats]: The stats, or None outside of a request.
+
+    """
+    return _stats.get()
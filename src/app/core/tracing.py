@@ -0,0 +1,376 @@
+import functools
+import json
+import os
+import random
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar, Token
+from typing import (
+    Any,
+    Awaitable,
+    Callable,
+    Deque,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+    TypeVar,
+)
+
+from app.core.config import settings
+
+F = TypeVar("F", bound=Callable[..., Awaitable[Any]])
+
+
+class Span:
+    """
+    A timed operation of a trace, following the OpenTelemetry span model.
+
+    Attributes:
+        name (str): The operation name, e.g. `GET /api/v1/user/{id}` or `CRUDBase.get`.
+        trace_id (str): The 32 hex digit ID of the trace.
+        span_id (str): The 16 hex digit ID of the span.
+        parent_id (Optional[str]): The ID of the parent span, None for a root span.
+        kind (str): `server`, `client` or `internal`.
+        attributes (Dict[str, Any]): The span attributes.
+        status (str): `unset`, `ok` or `error`.
+        start_ns (int): The start time, in nanoseconds since the epoch.
+        end_ns (Optional[int]): The end time, None while the span is running.
+
+    """
+
+    sampled = True
+
+    def __init__(
+        self,
+        tracer: "Tracer",
+        name: str,
+        trace_id: str,
+        parent_id: Optional[str] = None,
+        kind: str = "internal",
+        attributes: Optional[Dict[str, Any]] = None,
+    ):
+        self.tracer = tracer
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = f"{random.getrandbits(64):016x}"
+        self.parent_id = parent_id
+        self.kind = kind
+        self.attributes = attributes or {}
+        self.status = "unset"
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.token: Optional[Token[Any]] = None
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+
+    def record_exception(self, exc: BaseException) -> None:
+        self.status = "error"
+        self.attributes["exception.type"] = type(exc).__name__
+        self.attributes["exception.message"] = str(exc)
+
+    def end(self) -> None:
+        """
+        End the span and hand it to the exporter. Ending a span twice is a no-op.
+
+        """
+        if self.end_ns is None:
+            self.end_ns = time.time_ns()
+            self.tracer.exporter.export(self)
+
+    @property
+    def traceparent(self) -> str:
+        """
+        The W3C `traceparent` header continuing the trace from this span.
+
+        """
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        Convert the span to a dict, with the field names of the OTLP JSON encoding.
+
+        Returns:
+            Dict[str, Any]: The span.
+
+        """
+        return {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "parentSpanId": self.parent_id or "",
+            "name": self.name,
+            "kind": self.kind,
+            "startTimeUnixNano": self.start_ns,
+            "endTimeUnixNano": self.end_ns,
+            "durationMs": ((self.end_ns or time.time_ns()) - self.start_ns) / 1e6,
+            "attributes": self.attributes,
+            "status": self.status,
+        }
+
+
+class NonRecordingSpan:
+    """
+    Stand-in for the spans of unsampled traces, recording nothing.
+
+    Attributes:
+        traceparent (Optional[str]): The `traceparent` to propagate, if the trace came with one.
+
+    """
+
+    sampled = False
+
+    def __init__(self, traceparent: Optional[str] = None):
+        self.traceparent = traceparent
+        self.token: Optional[Token[Any]] = None
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        pass
+
+    def record_exception(self, exc: BaseException) -> None:
+        pass
+
+    def end(self) -> None:
+        pass
+
+
+class RingBufferExporter:
+    """
+    Keeps the most recent spans in memory, for the `/health/_traces` endpoint.
+
+    Attributes:
+        spans (Deque[Span]): The finished spans, oldest first.
+
+    """
+
+    def __init__(self, size: int):
+        self.spans: Deque[Span] = deque(maxlen=size)
+
+    def export(self, span: Span) -> None:
+        self.spans.append(span)
+
+    def recent(
+        self, trace_id: Optional[str] = None, limit: int = 100
+    ) -> List[Dict[str, Any]]:
+        """
+        Get the most recent spans, newest first.
+
+        Args:
+            trace_id (Optional[str]): Only return the spans of this trace.
+            limit (int): The maximum number of spans to return.
+
+        Returns:
+            List[Dict[str, Any]]: The spans.
+
+        """
+        found = []
+        for span in reversed(self.spans):
+            if trace_id is None or span.trace_id == trace_id:
+                found.append(span.to_dict())
+                if len(found) >= limit:
+                    break
+        return found
+
+
+class JSONLinesExporter:
+    """
+    Appends every span to a file as one JSON line.
+
+    Attributes:
+        path (str): The file, `{pid}` being replaced by the ID of the worker process.
+
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._file: Optional[Any] = None
+
+    def export(self, span: Span) -> None:
+        line = json.dumps(span.to_dict(), default=str) + "\n"
+        with self._lock:
+            if self._file is None:
+                # Opened on first use, so that `{pid}` is the worker's and not the master's
+                path = self.path.replace("{pid}", str(os.getpid()))
+                self._file = open(path, "a", buffering=1, encoding="utf-8")
+            self._file.write(line)
+
+
+class Tracer:
+    """
+    Minimal tracer producing OpenTelemetry compatible spans.
+
+    Traces are sampled when they start: a request continuing a trace through its
+    `traceparent` header follows the caller's decision, any other one is sampled with
+    probability `sample_ratio`. Spans of unsampled traces cost a context lookup.
+
+    Attributes:
+        exporter (Any): Where finished spans go, e.g. a `RingBufferExporter`.
+        sample_ratio (float): The share of new traces recorded, from 0 to 1.
+
+    """
+
+    def __init__(self, exporter: Any, sample_ratio: float):
+        self.exporter = exporter
+        self.sample_ratio = sample_ratio
+        self._current: ContextVar[Optional[Any]] = ContextVar(
+            "current_span", default=None
+        )
+
+    @staticmethod
+    def parse_traceparent(header: Optional[str]) -> Optional[Tuple[str, str, bool]]:
+        """
+        Parse a W3C `traceparent` header.
+
+        Args:
+            header (Optional[str]): The header value.
+
+        Returns:
+            Optional[Tuple[str, str, bool]]: The trace ID, parent span ID and sampled flag,
+                or None if the header is missing or malformed.
+
+        """
+        if not header:
+            return None
+        parts = header.strip().split("-")
+        if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+            return None
+        try:
+            flags = int(parts[3], 16)
+            int(parts[1], 16), int(parts[2], 16)
+        except ValueError:
+            return None
+        return parts[1], parts[2], bool(flags & 1)
+
+    def start_trace(
+        self, name: str, traceparent: Optional[str] = None, **attributes: Any
+    ) -> Any:
+        """
+        Start the server span of a request, and make it current.
+
+        Args:
+            name (str): The span name.
+            traceparent (Optional[str]): The request's `traceparent` header, if any.
+            **attributes (Any): The span attributes.
+
+        Returns:
+            Any: The span, a `NonRecordingSpan` if the trace is not sampled. Pass it to
+                `finish_trace` once the request is done.
+
+        """
+        parent = self.parse_traceparent(traceparent)
+        if parent is not None:
+            trace_id, parent_id, sampled = parent
+        else:
+            trace_id, parent_id = f"{random.getrandbits(128):032x}", None
+            sampled = random.random() < self.sample_ratio
+        span: Any
+        if sampled:
+            span = Span(self, name, trace_id, parent_id, "server", attributes)
+        else:
+            span = NonRecordingSpan(traceparent if parent is not None else None)
+        span.token = self._current.set(span)
+        return span
+
+    def finish_trace(self, span: Any) -> None:
+        """
+        End the server span started by `start_trace`.
+
+        Args:
+            span (Any): The span returned by `start_trace`.
+
+        """
+        self._current.reset(span.token)
+        span.end()
+
+    def start_span(self, name: str, kind: str = "internal", **attributes: Any) -> Any:
+        """
+        Start a child of the current span, without making it current.
+
+        Meant for leaf operations timed by callbacks, such as SQL statements.
+
+        Args:
+            name (str): The span name.
+            kind (str): The span kind. Defaults to `internal`.
+            **attributes (Any): The span attributes.
+
+        Returns:
+            Any: The span, or a `NonRecordingSpan` outside of a sampled trace.
+
+        """
+        parent = self._current.get()
+        if parent is None or not parent.sampled:
+            return _NON_RECORDING
+        return Span(self, name, parent.trace_id, parent.span_id, kind, attributes)
+
+    @contextmanager
+    def span(self, name: str, kind: str = "internal", **attributes: Any) -> Iterator[Any]:
+        """
+        Run a block in a child of the current span.
+
+        Args:
+            name (str): The span name.
+            kind (str): The span kind. Defaults to `internal`.
+            **attributes (Any): The span attributes.
+
+        Yields:
+            Any: The span, or a `NonRecordingSpan` outside of a sampled trace.
+
+        """
+        span = self.start_span(name, kind, **attributes)
+        if not span.sampled:
+            yield span
+            return
+        token = self._current.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.record_exception(e)
+            raise
+        finally:
+            self._current.reset(token)
+            span.end()
+
+    def traced(self, name: Optional[str] = None) -> Callable[[F], F]:
+        """
+        Decorate a coroutine function to run in a span named after it.
+
+        Args:
+            name (Optional[str]): The span name. Defaults to the function's qualified name.
+
+        Returns:
+            Callable[[F], F]: The decorator.
+
+        """
+
+        def decorator(func: F) -> F:
+            span_name = name or func.__qualname__
+
+            @functools.wraps(func)
+            async def wrapper(*args: Any, **kwargs: Any) -> Any:
+                with self.span(span_name):
+                    return await func(*args, **kwargs)
+
+            return wrapper  # type: ignore
+
+        return decorator
+
+
+_NON_RECORDING = NonRecordingSpan()
+
+
+def _exporter() -> Any:
+    """
+    Build the span exporter chosen in the settings.
+
+    """
+    if settings.TRACING_EXPORTER == "jsonl":
+        return JSONLinesExporter(settings.TRACING_FILE)
+    return RingBufferExporter(settings.TRACING_BUFFER_SIZE)
+
+
+# Traces are only started by TracingMiddleware, installed when TRACING_ENABLED is set
+tracer = Tracer(exporter=_exporter(), sample_ratio=settings.TRACING_SAMPLE_RATIO)
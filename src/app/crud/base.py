@@ -1,16 +1,151 @@
-from typing import Any, AsyncGenerator, Dict, Generic, Optional, Type, TypeVar, Union
+import asyncio
+import heapq
+from itertools import islice
+from operator import attrgetter, itemgetter
+from typing import (
+    Any,
+    AsyncGenerator,
+    Callable,
+    Dict,
+    Generic,
+    List,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Tuple,
+    Type,
+    TypeVar,
+    Union,
+)
 
-from fastapi.encoders import jsonable_encoder
 from pydantic import BaseModel
-from sqlalchemy import select
+from sqlalchemy import ColumnElement, Row, Select, event, select, tuple_
+from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, SessionTransaction
 
+from app.core.config import settings
+from app.core.tracing import tracer
+from app.db.session import DBSession, DeadlineSession, ShardedSession
 from app.models.base import Base
+from app.models.cache_invalidation import CacheInvalidation
+from app.util.snowflake import id_generator
 
 ModelType = TypeVar("ModelType", bound=Base)
 CreateSchemaType = TypeVar("CreateSchemaType", bound=BaseModel)
 UpdateSchemaType = TypeVar("UpdateSchemaType", bound=BaseModel)
 
+LIKE_ESCAPE_CHAR = "\\"
+
+
+def _session_for(db: DBSession, id: Any) -> AsyncSession:
+    """
+    Get the session of the shard an ID belongs to.
+
+    """
+    return db.for_id(id) if isinstance(db, ShardedSession) else db
+
+
+def _sessions(db: DBSession) -> List[AsyncSession]:
+    """
+    Get the session of every shard.
+
+    """
+    return db.all() if isinstance(db, ShardedSession) else [db]
+
+
+@event.listens_for(DeadlineSession, "before_commit")
+def write_invalidations(session: Session) -> None:
+    """
+    Write the cache tags made stale by a transaction to the outbox, once each, as it commits.
+
+    Tags of writes undone by a rolled back savepoint are still written, which only costs
+    a needless invalidation.
+
+    Args:
+        session (Session): The committing session.
+
+    """
+    if session.in_nested_transaction():
+        # Released savepoints commit nothing yet
+        return
+    tags = session.info.pop("invalidate_tags", None)
+    if tags:
+        session.add_all(CacheInvalidation(tag=tag) for tag in sorted(tags))
+
+
+@event.listens_for(DeadlineSession, "after_transaction_end")
+def discard_invalidations(session: Session, transaction: SessionTransaction) -> None:
+    """
+    Forget the cache tags of a rolled back transaction.
+
+    Args:
+        session (Session): The session.
+        transaction (SessionTransaction): The transaction that ended.
+
+    """
+    if transaction.parent is None:
+        session.info.pop("invalidate_tags", None)
+
+
+class BatchOperation(NamedTuple):
+    """
+    One operation of a batch.
+
+    Attributes:
+        op (str): `create`, `update` or `delete`.
+        id (Any): The ID of the object to update or delete.
+        obj_in (Any): The object to create, or the update to apply.
+
+    """
+
+    op: str
+    id: Any = None
+    obj_in: Any = None
+
+
+class BatchResult(NamedTuple):
+    """
+    The outcome of one operation of a batch.
+
+    Attributes:
+        status (str): `ok`, `not_found`, `failed`, `rolled_back` or `skipped`.
+        obj (Any): The created, updated or deleted object, if `ok`.
+        detail (Optional[str]): Why the operation did not apply, if it failed.
+        id (Any): The ID of the object, allocated by `CRUDBase.batch` for creates.
+
+    """
+
+    status: str
+    obj: Any = None
+    detail: Optional[str] = None
+    id: Any = None
+
+
+class _BatchAborted(Exception):
+    """
+    Raised to roll an atomic batch back after a failed operation.
+
+    """
+
+
+def escape_like(value: str) -> str:
+    """
+    Escape the LIKE wildcards in a user supplied value.
+
+    Args:
+        value (str): The raw value.
+
+    Returns:
+        str: The value with `%`, `_` and the escape character escaped.
+
+    """
+    return (
+        value.replace(LIKE_ESCAPE_CHAR, LIKE_ESCAPE_CHAR * 2)
+        .replace("%", f"{LIKE_ESCAPE_CHAR}%")
+        .replace("_", f"{LIKE_ESCAPE_CHAR}_")
+    )
+
 
 class CRUDBase(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
     """
@@ -18,13 +153,195 @@ class CRUDBase(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
 
     Attributes:
         model (Type[ModelType]): The SQLAlchemy model.
+        invalidate_tags (Dict[str, Sequence[str]]): The cache tags made stale by each kind
+            of write, `create`, `update` and `delete`.
 
     """
 
+    invalidate_tags: Dict[str, Sequence[str]] = {}
+
     def __init__(self, model: Type[ModelType]):
         self.model = model
 
-    async def _get(self, db: AsyncSession, id: Any) -> Optional[ModelType]:
+    def missing_tag(self, id: Any) -> str:
+        """
+        Get the tag of the negative cache entries of an ID.
+
+        Args:
+            id (Any): The ID of the object.
+
+        Returns:
+            str: The tag, invalidated when an object with this ID is created.
+
+        """
+        return f"{self.model.__tablename__}_missing_{id}"
+
+    def write_tags(self, op: str, id: Any) -> List[str]:
+        """
+        Get the cache tags made stale by a write.
+
+        Args:
+            op (str): The kind of write, `create`, `update` or `delete`.
+            id (Any): The ID of the written object.
+
+        Returns:
+            List[str]: The `invalidate_tags` of the write, and for creates the negative
+                cache entries of the new ID.
+
+        """
+        tags = list(self.invalidate_tags.get(op, ()))
+        if op == "create":
+            tags.append(self.missing_tag(id))
+        return tags
+
+    def _enqueue_invalidations(self, session: AsyncSession, op: str, id: Any) -> None:
+        """
+        Record the cache tags made stale by a write, written to the outbox once per
+        transaction by `write_invalidations` when it commits.
+
+        """
+        if settings.CACHE_OUTBOX_ENABLED:
+            tags = session.info.setdefault("invalidate_tags", set())
+            tags.update(self.write_tags(op, id))
+
+    def _column(self, field: str) -> Any:
+        """
+        Get a mapped column of the model by name.
+
+        Args:
+            field (str): The name of the column.
+
+        Returns:
+            Any: The instrumented column attribute.
+
+        Raises:
+            ValueError: If the model has no such column.
+
+        """
+        if field not in self.model.__table__.columns:
+            raise ValueError(f"{self.model.__name__} has no column '{field}'")
+        return getattr(self.model, field)
+
+    def parse_fields(self, value: Optional[str]) -> Optional[Tuple[str, ...]]:
+        """
+        Parse a comma separated sparse fieldset.
+
+        Args:
+            value (Optional[str]): The requested fields, e.g. `"id,email"`.
+
+        Returns:
+            Optional[Tuple[str, ...]]: The fields in column order, or None for all columns.
+
+        Raises:
+            ValueError: If a field is not a column of the model.
+
+        """
+        if not value:
+            return None
+        requested = {field.strip() for field in value.split(",") if field.strip()}
+        keys = self.model.serializer().keys
+        unknown = requested.difference(keys)
+        if unknown:
+            raise ValueError(
+                f"Unknown field(s) {sorted(unknown)}, expected any of {list(keys)}"
+            )
+        fields = tuple(key for key in keys if key in requested)
+        return fields if fields and fields != keys else None
+
+    def _like(self, field: str, pattern: str, raw: str) -> ColumnElement[bool]:
+        """
+        Build a LIKE clause, only adding an ESCAPE clause when the value needed escaping.
+
+        Postgres can only use a `text_pattern_ops` index for a LIKE whose pattern it can
+        read at plan time, so the plain form is kept for the common case.
+
+        Args:
+            field (str): The name of the column.
+            pattern (str): The escaped LIKE pattern.
+            raw (str): The value the pattern was built from.
+
+        Returns:
+            ColumnElement[bool]: The LIKE clause.
+
+        """
+        column = self._column(field)
+        if escape_like(raw) != raw:
+            return column.like(pattern, escape=LIKE_ESCAPE_CHAR)
+        return column.like(pattern)
+
+    def prefix_filter(self, field: str, value: str) -> ColumnElement[bool]:
+        """
+        Build a case-sensitive prefix filter (`field LIKE 'value%'`).
+
+        The clause can be served by a B-tree index on the column (`text_pattern_ops` on Postgres).
+
+        Args:
+            field (str): The name of the column.
+            value (str): The prefix to match.
+
+        Returns:
+            ColumnElement[bool]: The filter clause.
+
+        """
+        return self._like(field, f"{escape_like(value)}%", value)
+
+    def contains_filter(self, field: str, value: str) -> ColumnElement[bool]:
+        """
+        Build a case-sensitive substring filter (`field LIKE '%value%'`).
+
+        The clause can be served by a `pg_trgm` GIN index on the column.
+
+        Args:
+            field (str): The name of the column.
+            value (str): The substring to match.
+
+        Returns:
+            ColumnElement[bool]: The filter clause.
+
+        """
+        return self._like(field, f"%{escape_like(value)}%", value)
+
+    def keyset_filter(self, field: str, after: Tuple[Any, Any]) -> ColumnElement[bool]:
+        """
+        Build a keyset pagination filter, `(field, id) > (value, id)`, or `id > id` when
+        the pages are ordered by ID alone.
+
+        Args:
+            field (str): The name of the column the pages are ordered by, before the ID.
+            after (Tuple[Any, Any]): The `(value, id)` of the last row already seen.
+
+        Returns:
+            ColumnElement[bool]: The filter clause.
+
+        """
+        if field == "id":
+            return self.model.id > after[1]
+        return tuple_(self._column(field), self.model.id) > tuple_(*after)
+
+    def range_filter(
+        self, field: str, since: Optional[Any] = None, until: Optional[Any] = None
+    ) -> List[ColumnElement[bool]]:
+        """
+        Build the filters of a half-open range, `since <= field < until`.
+
+        Args:
+            field (str): The name of the column.
+            since (Optional[Any]): The inclusive lower bound, None for no lower bound.
+            until (Optional[Any]): The exclusive upper bound, None for no upper bound.
+
+        Returns:
+            List[ColumnElement[bool]]: The filter clauses, empty if both bounds are None.
+
+        """
+        column = self._column(field)
+        filters = []
+        if since is not None:
+            filters.append(column >= since)
+        if until is not None:
+            filters.append(column < until)
+        return filters
+
+    async def _get(self, db: DBSession, id: Any) -> Optional[ModelType]:
         """
         Get a single object by ID without managing the database session.
 
@@ -32,21 +349,22 @@ class CRUDBase(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
         It is designed to be used internally by other methods like `get`, update` or `delete` that manage the session themselves.
 
         Args:
-            db (AsyncSession): The asynchronous SQLAlchemy session.
+            db (DBSession): The asynchronous SQLAlchemy session, or a sharded session.
             id (Any): The ID of the object to retrieve.
 
         Returns:
             Optional[ModelType]: The retrieved object, or None if it does not exist.
         """
         stmt = select(self.model).where(self.model.id == id)
-        return await db.scalar(stmt.order_by(self.model.id))
+        return await _session_for(db, id).scalar(stmt.order_by(self.model.id))
 
-    async def get(self, db: AsyncSession, id: Any) -> Optional[ModelType]:
+    @tracer.traced()
+    async def get(self, db: DBSession, id: Any) -> Optional[ModelType]:
         """
         Get a single object by ID, managing the session automatically.
 
         Args:
-            db (AsyncSession): The asynchronous SQLAlchemy session.
+            db (DBSession): The asynchronous SQLAlchemy session, or a sharded session.
             id (Any): The ID of the object to retrieve.
 
         Returns:
@@ -57,8 +375,40 @@ class CRUDBase(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
             response = await self._get(db=db, id=id)
         return response
 
+    def _select_multi(
+        self,
+        *,
+        skip: int = 0,
+        limit: int = 100,
+        filters: Optional[Sequence[ColumnElement[bool]]] = None,
+        order_by: Optional[Sequence[str]] = None,
+    ) -> Select[Any]:
+        """
+        Build the statement used to list objects.
+
+        Args:
+            skip (int): The number of objects to skip before starting to retrieve (offset).
+            limit (int): The maximum number of objects to retrieve (batch size).
+            filters (Optional[Sequence[ColumnElement[bool]]]): Clauses the objects must all match.
+            order_by (Optional[Sequence[str]]): The columns to sort by. Defaults to the ID.
+
+        Returns:
+            Select[Any]: The select statement.
+        """
+        stmt = select(self.model)
+        if filters:
+            stmt = stmt.where(*filters)
+        order = [self._column(field) for field in order_by or ["id"]]
+        return stmt.order_by(*order).offset(skip).limit(limit)
+
     async def _get_multi(
-        self, db: AsyncSession, *, skip: int = 0, limit: int = 100
+        self,
+        db: DBSession,
+        *,
+        skip: int = 0,
+        limit: int = 100,
+        filters: Optional[Sequence[ColumnElement[bool]]] = None,
+        order_by: Optional[Sequence[str]] = None,
     ) -> AsyncGenerator[ModelType, None]:
         """
         Stream objects from the database in an asynchronous manner.
@@ -66,45 +416,287 @@ class CRUDBase(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
         This method streams database objects directly, intended for use with external session management.
 
         Args:
-            db (AsyncSession): The asynchronous SQLAlchemy session.
+            db (DBSession): The asynchronous SQLAlchemy session, or a sharded session.
             skip (int): The number of objects to skip before starting to retrieve (offset).
             limit (int): The maximum number of objects to retrieve (batch size).
+            filters (Optional[Sequence[ColumnElement[bool]]]): Clauses the objects must all match.
+            order_by (Optional[Sequence[str]]): The columns to sort by. Defaults to the ID.
 
         Yields:
             AsyncGenerator[ModelType, None]: An asynchronous generator of the retrieved objects.
         """
-        stmt = select(self.model).order_by(self.model.id).offset(skip).limit(limit)
-        stream = await db.stream_scalars(stmt.order_by(self.model.id))
+        stmt = self._select_multi(
+            skip=skip, limit=limit, filters=filters, order_by=order_by
+        )
+        stream = await db.stream_scalars(stmt)
         async for row in stream:
             yield row
 
+    @tracer.traced()
     async def get_multi(
-        self, db: AsyncSession, *, skip: int = 0, limit: int = 100
+        self,
+        db: DBSession,
+        *,
+        skip: int = 0,
+        limit: int = 100,
+        filters: Optional[Sequence[ColumnElement[bool]]] = None,
+        order_by: Optional[Sequence[str]] = None,
     ) -> Any:
         """
         Retrieve a list of objects from the database within a managed session.
 
         Args:
-            db (AsyncSession): The asynchronous SQLAlchemy session.
+            db (DBSession): The asynchronous SQLAlchemy session, or a sharded session.
             skip (int): The number of objects to skip before starting to retrieve (offset).
             limit (int): The maximum number of objects to retrieve (batch size).
+            filters (Optional[Sequence[ColumnElement[bool]]]): Clauses the objects must all match.
+            order_by (Optional[Sequence[str]]): The columns to sort by. Defaults to the ID.
 
         Returns:
             List[ModelType]: A list of the retrieved objects.
         """
-        response = []
+        response: List[ModelType] = []
         async with db:
-            async for db_obj in self._get_multi(db, skip=skip, limit=limit):
+            if isinstance(db, ShardedSession):
+                order = list(order_by or ["id"])
+                stmt = self._select_multi(
+                    limit=skip + limit, filters=filters, order_by=order
+                )
+                return await self._fan_out(
+                    db, stmt, skip, limit, key=attrgetter(*order), scalars=True
+                )
+            async for db_obj in self._get_multi(
+                db, skip=skip, limit=limit, filters=filters, order_by=order_by
+            ):
                 response.append(db_obj)
         return response
 
-    async def create(self, db: AsyncSession, *, obj_in: CreateSchemaType) -> ModelType:
+    async def _fan_out(
+        self,
+        db: ShardedSession,
+        stmt: Select[Any],
+        skip: int,
+        limit: int,
+        *,
+        key: Callable[[Any], Any],
+        scalars: bool = False,
+    ) -> List[Any]:
+        """
+        Run a list query on every shard in parallel and merge the results.
+
+        Each shard returns its first `skip + limit` results in order, which hold the
+        requested page once merged.
+
+        Args:
+            db (ShardedSession): The sharded session.
+            stmt (Select[Any]): The statement, ordered and limited to `skip + limit` results.
+            skip (int): The number of merged results to skip.
+            limit (int): The maximum number of merged results to return.
+            key (Callable[[Any], Any]): The sort key of a result, matching the statement's order.
+            scalars (bool): Whether to return ORM instances instead of rows. Defaults to False.
+
+        Returns:
+            List[Any]: The requested page of results.
+        """
+        sessions = db.all()
+        if scalars:
+            results = await asyncio.gather(*(s.scalars(stmt) for s in sessions))
+        else:
+            results = await asyncio.gather(*(s.execute(stmt) for s in sessions))
+        merged = heapq.merge(*(result.all() for result in results), key=key)
+        return list(islice(merged, skip, skip + limit))
+
+    def _select_columns(self, fields: Optional[Tuple[str, ...]] = None) -> Select[Any]:
+        """
+        Select the model's columns in the order of its serializer keys.
+
+        Args:
+            fields (Optional[Tuple[str, ...]]): Only select these columns. Defaults to all.
+
+        Returns:
+            Select[Any]: The select statement.
+        """
+        keys = self.model.serializer(fields).keys
+        return select(*[getattr(self.model, key) for key in keys])
+
+    def _select_rows(
+        self,
+        *,
+        skip: int = 0,
+        limit: int = 100,
+        filters: Optional[Sequence[ColumnElement[bool]]] = None,
+        fields: Optional[Tuple[str, ...]] = None,
+        order_by: Optional[Sequence[str]] = None,
+    ) -> Select[Any]:
+        """
+        Build the statement used to list plain rows.
+
+        Args:
+            skip (int): The number of rows to skip before starting to retrieve (offset).
+            limit (int): The maximum number of rows to retrieve (batch size).
+            filters (Optional[Sequence[ColumnElement[bool]]]): Clauses the rows must all match.
+            fields (Optional[Tuple[str, ...]]): Only select these columns. Defaults to all.
+            order_by (Optional[Sequence[str]]): The columns to sort by. Defaults to the ID.
+
+        Returns:
+            Select[Any]: The select statement.
+        """
+        stmt = self._select_columns(fields)
+        if filters:
+            stmt = stmt.where(*filters)
+        order = [self._column(field) for field in order_by or ["id"]]
+        return stmt.order_by(*order).offset(skip).limit(limit)
+
+    @tracer.traced()
+    async def get_multi_rows(
+        self,
+        db: DBSession,
+        *,
+        skip: int = 0,
+        limit: int = 100,
+        filters: Optional[Sequence[ColumnElement[bool]]] = None,
+        fields: Optional[Tuple[str, ...]] = None,
+        order_by: Optional[Sequence[str]] = None,
+    ) -> Sequence[Row[Any]]:
+        """
+        Retrieve a read-only list of plain rows within a managed session.
+
+        Unlike `get_multi` no ORM instances are built, so rows skip the identity map and
+        instance state bookkeeping. Use the model serializer's `row_dicts` to convert them.
+
+        Args:
+            db (DBSession): The asynchronous SQLAlchemy session, or a sharded session.
+            skip (int): The number of rows to skip before starting to retrieve (offset).
+            limit (int): The maximum number of rows to retrieve (batch size).
+            filters (Optional[Sequence[ColumnElement[bool]]]): Clauses the rows must all match.
+            fields (Optional[Tuple[str, ...]]): Only select these columns. Defaults to all.
+            order_by (Optional[Sequence[str]]): The columns to sort by. Defaults to the ID.
+
+        Returns:
+            Sequence[Row[Any]]: The rows, named tuples in the order of the serializer keys.
+        """
+        async with db:
+            if isinstance(db, ShardedSession):
+                return await self._get_sharded_rows(
+                    db,
+                    skip=skip,
+                    limit=limit,
+                    filters=filters,
+                    fields=fields,
+                    order_by=order_by,
+                )
+            result = await db.execute(
+                self._select_rows(
+                    skip=skip,
+                    limit=limit,
+                    filters=filters,
+                    fields=fields,
+                    order_by=order_by,
+                )
+            )
+            return result.all()
+
+    async def _get_sharded_rows(
+        self,
+        db: ShardedSession,
+        *,
+        skip: int,
+        limit: int,
+        filters: Optional[Sequence[ColumnElement[bool]]],
+        fields: Optional[Tuple[str, ...]],
+        order_by: Optional[Sequence[str]],
+    ) -> List[Row[Any]]:
+        """
+        Retrieve a list of plain rows from every shard, merged in order.
+
+        The sort columns left out of the projection are selected after the requested ones,
+        to merge by, and are ignored by the serializer's `row_dicts`.
+        """
+        order = list(order_by or ["id"])
+        columns = list(self.model.serializer(fields).keys)
+        extra = [field for field in order if field not in columns]
+        stmt = self._select_rows(
+            limit=skip + limit, filters=filters, fields=fields, order_by=order
+        )
+        if extra:
+            stmt = stmt.add_columns(*[self._column(field) for field in extra])
+        columns += extra
+        key = itemgetter(*[columns.index(field) for field in order])
+        return await self._fan_out(db, stmt, skip, limit, key=key)
+
+    @tracer.traced()
+    async def get_row(
+        self, db: DBSession, id: Any, *, fields: Optional[Tuple[str, ...]] = None
+    ) -> Optional[Row[Any]]:
+        """
+        Get a single object by ID as a plain row, managing the session automatically.
+
+        Args:
+            db (DBSession): The asynchronous SQLAlchemy session, or a sharded session.
+            id (Any): The ID of the object to retrieve.
+            fields (Optional[Tuple[str, ...]]): Only select these columns. Defaults to all.
+
+        Returns:
+            Optional[Row[Any]]: The row, in the order of the serializer keys, or None if it does not exist.
+        """
+        async with db:
+            result = await _session_for(db, id).execute(
+                self._select_columns(fields).where(self.model.id == id)
+            )
+            return result.first()
+
+    async def stream_ids(
+        self, db: DBSession, *, batch_size: int = 10_000
+    ) -> AsyncGenerator[Any, None]:
+        """
+        Stream the IDs of all objects, fetching them from the server in batches.
+
+        Args:
+            db (DBSession): The asynchronous SQLAlchemy session, or a sharded session.
+            batch_size (int): The number of IDs fetched per round trip.
+
+        Yields:
+            AsyncGenerator[Any, None]: An asynchronous generator of the IDs.
+        """
+        async with db:
+            stmt = select(self.model.id).execution_options(yield_per=batch_size)
+            for session in _sessions(db):
+                stream = await session.stream_scalars(stmt)
+                async for id in stream:
+                    yield id
+
+    async def _create(
+        self, db: DBSession, *, obj_in: CreateSchemaType, id: Optional[int] = None
+    ) -> ModelType:
+        """
+        Create a new object within the session's current transaction.
+
+        The ID is allocated before the flush, so that it can pick the object's shard.
+
+        """
+        db_obj = self.model(**obj_in.dict())
+        if db_obj.id is None:
+            db_obj.id = id if id is not None else id_generator.next_id()
+        session = _session_for(db, db_obj.id)
+        session.add(db_obj)
+        self._enqueue_invalidations(session, "create", db_obj.id)
+        await session.flush()
+        # Expunge the object to decouple it from the session for independent use.
+        session.expunge(db_obj)
+        return db_obj
+
+    @tracer.traced()
+    async def create(
+        self, db: DBSession, *, obj_in: CreateSchemaType, id: Optional[int] = None
+    ) -> ModelType:
         """
         Create a new object in the database.
 
         Args:
-            db (AsyncSession): The asynchronous SQLAlchemy session.
+            db (DBSession): The asynchronous SQLAlchemy session, or a sharded session.
             obj_in (CreateSchemaType): The object to create.
+            id (Optional[int]): The ID of the object, allocated beforehand. Defaults to a
+                new Snowflake ID.
 
         Returns:
             ModelType: The created object.
@@ -112,26 +704,52 @@ class CRUDBase(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
         """
         db_obj = None
         async with db.begin():
-            obj_in_data = jsonable_encoder(obj_in)
-            db_obj = self.model(**obj_in_data)
-            db.add(db_obj)
-            await db.flush()
+            db_obj = await self._create(db, obj_in=obj_in, id=id)
+        return db_obj
+
+    async def _update(
+        self,
+        db: DBSession,
+        *,
+        id: Any,
+        obj_in: Union[UpdateSchemaType, Dict[str, Any]],
+    ) -> Optional[ModelType]:
+        """
+        Update an object within the session's current transaction.
+
+        """
+        session = _session_for(db, id)
+        db_obj = await self._get(session, id)
+        # Check if exists
+        if db_obj:
+            if isinstance(obj_in, dict):
+                update_data = obj_in
+            else:
+                update_data = obj_in.dict(exclude_unset=True)
+            # Update the object
+            for field in self.model.serializer().keys:
+                if field in update_data:
+                    setattr(db_obj, field, update_data[field])
+            self._enqueue_invalidations(session, "update", id)
+            await session.flush()
+            await session.refresh(db_obj)
             # Expunge the object to decouple it from the session for independent use.
-            db.expunge(db_obj)
+            session.expunge(db_obj)
         return db_obj
 
+    @tracer.traced()
     async def update(
         self,
-        db: AsyncSession,
+        db: DBSession,
         *,
         id: Any,
-        obj_in: Union[UpdateSchemaType, Dict[str, Any]]
+        obj_in: Union[UpdateSchemaType, Dict[str, Any]],
     ) -> Optional[ModelType]:
         """
         Update an object in the database.
 
         Args:
-            db (AsyncSession): The asynchronous SQLAlchemy session.
+            db (DBSession): The asynchronous SQLAlchemy session, or a sharded session.
             id (Any): The ID of the object to update.
             obj_in (Union[UpdateSchemaType, Dict[str, Any]]): The updated object.
 
@@ -141,30 +759,31 @@ class CRUDBase(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
         """
         db_obj = None
         async with db.begin():
-            db_obj = await self._get(db, id)
-            # Check if exists
-            if db_obj:
-                obj_data = jsonable_encoder(db_obj)
-                if isinstance(obj_in, dict):
-                    update_data = obj_in
-                else:
-                    update_data = obj_in.dict(exclude_unset=True)
-                # Update the object
-                for field in obj_data:
-                    if field in update_data:
-                        setattr(db_obj, field, update_data[field])
-                await db.flush()
-                await db.refresh(db_obj)
-                # Expunge the object to decouple it from the session for independent use.
-                db.expunge(db_obj)
+            db_obj = await self._update(db, id=id, obj_in=obj_in)
         return db_obj
 
-    async def remove(self, db: AsyncSession, *, id: str) -> Optional[ModelType]:
+    async def _remove(self, db: DBSession, *, id: Any) -> Optional[ModelType]:
+        """
+        Remove an object within the session's current transaction.
+
+        """
+        session = _session_for(db, id)
+        db_obj = await self._get(session, id)
+        if db_obj:
+            await session.delete(db_obj)
+            self._enqueue_invalidations(session, "delete", id)
+            await session.flush()
+            # Expunge the object to decouple it from the session for independent use.
+            session.expunge(db_obj)
+        return db_obj
+
+    @tracer.traced()
+    async def remove(self, db: DBSession, *, id: str) -> Optional[ModelType]:
         """
         Remove an object from the database.
 
         Args:
-            db (AsyncSession): The asynchronous SQLAlchemy session.
+            db (DBSession): The asynchronous SQLAlchemy session, or a sharded session.
             id (str): The ID of the object to remove.
 
         Returns:
@@ -173,10 +792,97 @@ class CRUDBase(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
         """
         db_obj = None
         async with db.begin():
-            db_obj = await self._get(db, id)
-            if db_obj:
-                await db.delete(db_obj)
-                await db.flush()
-                # Expunge the object to decouple it from the session for independent use.
-                db.expunge(db_obj)
+            db_obj = await self._remove(db, id=id)
         return db_obj
+
+    async def _apply(self, db: DBSession, operation: BatchOperation) -> BatchResult:
+        """
+        Apply one batch operation within the session's current transaction.
+
+        Args:
+            db (DBSession): The asynchronous SQLAlchemy session, or a sharded session.
+            operation (BatchOperation): The operation.
+
+        Returns:
+            BatchResult: The result, `ok` or `not_found`.
+
+        Raises:
+            ValueError: If the operation is unknown.
+
+        """
+        if operation.op == "create":
+            db_obj = await self._create(db, obj_in=operation.obj_in, id=operation.id)
+        elif operation.op == "update":
+            db_obj = await self._update(db, id=operation.id, obj_in=operation.obj_in)
+        elif operation.op == "delete":
+            db_obj = await self._remove(db, id=operation.id)
+        else:
+            raise ValueError(f"Unknown batch operation: {operation.op}")
+        if db_obj is None:
+            return BatchResult("not_found", detail="Not found")
+        return BatchResult("ok", db_obj)
+
+    @tracer.traced()
+    async def batch(
+        self,
+        db: DBSession,
+        operations: Sequence[BatchOperation],
+        *,
+        atomic: bool = True,
+    ) -> List[BatchResult]:
+        """
+        Apply a sequence of operations, in order, in a single transaction.
+
+        When atomic, the first operation that fails rolls the whole batch back: the
+        operations before it are reported `rolled_back` and the ones after it `skipped`.
+        Otherwise every operation runs in its own savepoint, so a failure only undoes that
+        operation and the others are committed. With a sharded session there is one
+        transaction per shard, see `ShardedSession.begin`.
+
+        Args:
+            db (DBSession): The asynchronous SQLAlchemy session, or a sharded session.
+            operations (Sequence[BatchOperation]): The operations.
+            atomic (bool): Whether to apply all the operations or none. Defaults to True.
+
+        Returns:
+            List[BatchResult]: The result of each operation, in order, with its object's
+                ID, including the IDs allocated to creates that were not committed.
+
+        Raises:
+            ValueError: If an operation is unknown.
+
+        """
+        # Allocate the new IDs first, so that every operation knows its shard
+        operations = [
+            operation._replace(id=id_generator.next_id())
+            if operation.op == "create" and operation.id is None
+            else operation
+            for operation in operations
+        ]
+        results: List[BatchResult] = []
+        try:
+            async with db.begin():
+                for operation in operations:
+                    try:
+                        if atomic:
+                            result = await self._apply(db, operation)
+                        else:
+                            session = _session_for(db, operation.id)
+                            async with session.begin_nested():
+                                result = await self._apply(db, operation)
+                    except SQLAlchemyError as e:
+                        result = BatchResult("failed", detail=type(e).__name__)
+                    results.append(result)
+                    if atomic and result.status != "ok":
+                        # Leave the transaction block to roll everything back
+                        raise _BatchAborted()
+        except _BatchAborted:
+            failed = results.pop()
+            executed = len(results) + 1
+            results = [BatchResult("rolled_back") for _ in results]
+            results.append(failed)
+            results.extend(BatchResult("skipped") for _ in operations[executed:])
+        return [
+            result._replace(id=operation.id)
+            for operation, result in zip(operations, results)
+        ]
@@ -1,3 +1,7 @@
+from typing import List, Optional
+
+from sqlalchemy import ColumnElement
+
 from app.crud.base import CRUDBase
 from app.models.user import User  # noqa
 from app.schemas.user import UserCreate, UserUpdate
@@ -9,8 +13,36 @@ class CRUDUser(CRUDBase[User, UserCreate, UserUpdate]):
 
     Attributes:
         model (Type[User]): The User SQLAlchemy model.
+        invalidate_tags (Dict[str, Sequence[str]]): The cache tags made stale by each kind of write.
 
     """
 
+    invalidate_tags = {
+        "create": ["user_list", "user_search"],
+        "update": ["user_list", "user_search", "user_get"],
+        "delete": ["user_list", "user_search", "user_get"],
+    }
+
+    def search_filters(
+        self, *, email_prefix: Optional[str] = None, email_contains: Optional[str] = None
+    ) -> List[ColumnElement[bool]]:
+        """
+        Build the filters for an email search.
+
+        Args:
+            email_prefix (Optional[str]): Only match emails starting with this value.
+            email_contains (Optional[str]): Only match emails containing this value.
+
+        Returns:
+            List[ColumnElement[bool]]: The filter clauses, empty if no search was requested.
+
+        """
+        filters = []
+        if email_prefix:
+            filters.append(self.prefix_filter("email", email_prefix))
+        if email_contains:
+            filters.append(self.contains_filter("email", email_contains))
+        return filters
+
 
 users = CRUDUser(User)
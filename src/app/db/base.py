@@ -1,2 +1,3 @@
 from app.models.base import Base  # noqa
+from app.models.cache_invalidation import CacheInvalidation  # noqa
 from app.models.user import User  # noqa
@@ -1,9 +1,26 @@
+import logging
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, List, Optional, Sequence, Union
+
 from redis import asyncio as aioredis
-from sqlalchemy import create_engine
-from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
-from sqlalchemy.orm import sessionmaker
+from redis.asyncio.client import Pipeline
+from redis.asyncio.connection import Connection as RedisConnection
+from sqlalchemy import Connection, Engine, create_engine, event
+from sqlalchemy.ext.asyncio import (
+    AsyncEngine,
+    AsyncSession,
+    async_sessionmaker,
+    create_async_engine,
+)
+from sqlalchemy.orm import Session, SessionTransaction, sessionmaker
 
+from app.core import deadline
 from app.core.config import settings
+from app.core.request_stats import current_stats, fingerprint, fingerprint_id, log_event
+from app.core.tracing import tracer
+
+logger = logging.getLogger(__name__)
 
 sync_engine = create_engine(settings.DB_URI, pool_pre_ping=True)
 sync_session_factory = sessionmaker(autocommit=False, autoflush=False, bind=sync_engine)
@@ -11,22 +28,452 @@ sync_session_factory = sessionmaker(autocommit=False, autoflush=False, bind=sync
 async_engine = create_async_engine(
     settings.DB_ASYNC_URI,
     pool_pre_ping=True,
-    echo=True,
+    pool_size=settings.DB_POOL_SIZE,
+    max_overflow=settings.DB_MAX_OVERFLOW,
+    pool_timeout=settings.DB_POOL_TIMEOUT,
+    pool_recycle=settings.DB_POOL_RECYCLE,
+    echo=settings.DB_ECHO,
 )
 
+
+def start_query_timer(
+    conn: Connection,
+    cursor: Any,
+    statement: str,
+    parameters: Any,
+    context: Any,
+    executemany: bool,
+) -> None:
+    """
+    Note when a statement was sent, for `record_query`, and open its span.
+
+    """
+    span = tracer.start_span("sql", kind="client", **{"db.system": conn.dialect.name})
+    if span.sampled and statement.strip():
+        span.name = f"sql {statement.split(None, 1)[0].upper()}"
+    conn.info.setdefault("query_spans", []).append(span)
+    conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+
+def record_query(
+    conn: Connection,
+    cursor: Any,
+    statement: str,
+    parameters: Any,
+    context: Any,
+    executemany: bool,
+) -> None:
+    """
+    Add an executed statement to the request's stats and trace, and log it if it was slow.
+
+    Only the statement's fingerprint is recorded, never its parameters.
+
+    """
+    elapsed = time.perf_counter() - conn.info["query_started"].pop()
+    span = conn.info["query_spans"].pop()
+    stats = current_stats()
+    slow = 0 < settings.SLOW_QUERY_THRESHOLD <= elapsed
+    if stats is None and not slow and not span.sampled:
+        return
+    statement_fingerprint = fingerprint(statement)
+    span.set_attribute("db.statement", statement_fingerprint)
+    span.end()
+    if stats is not None:
+        stats.record_query(statement_fingerprint, elapsed)
+    if slow:
+        log_event(
+            logger,
+            logging.WARNING,
+            "slow_query",
+            fingerprint_id=fingerprint_id(statement_fingerprint),
+            fingerprint=statement_fingerprint,
+            duration_ms=round(elapsed * 1000, 2),
+        )
+
+
+def record_query_error(context: Any) -> None:
+    """
+    Close the timer and span of a statement that failed.
+
+    """
+    info = context.connection.info if context.connection is not None else {}
+    if info.get("query_started"):
+        info["query_started"].pop()
+        span = info["query_spans"].pop()
+        span.record_exception(context.original_exception)
+        span.end()
+
+
+def start_connect_span(
+    dialect: Any, connection_record: Any, cargs: Any, cparams: Any
+) -> None:
+    """
+    Open the span of a new database connection, ended by `end_connect_span`.
+
+    Pool checkouts of an open connection are free, so only new connections are timed.
+
+    """
+    span = tracer.start_span("db connect", kind="client", **{"db.system": dialect.name})
+    connection_record.info["connect_span"] = span
+
+
+def end_connect_span(dbapi_connection: Any, connection_record: Any) -> None:
+    """
+    Close the span of a new database connection, once connected.
+
+    """
+    span = connection_record.info.pop("connect_span", None)
+    if span is not None:
+        span.end()
+
+
+def instrument_engine(engine: Engine) -> None:
+    """
+    Record the statements of an engine in the request stats, traces and slow-query log,
+    and the time spent opening connections in traces.
+
+    Args:
+        engine (Engine): The engine, the `sync_engine` of an async engine.
+
+    """
+    event.listen(engine, "before_cursor_execute", start_query_timer)
+    event.listen(engine, "after_cursor_execute", record_query)
+    event.listen(engine, "handle_error", record_query_error)
+    event.listen(engine, "do_connect", start_connect_span)
+    event.listen(engine, "connect", end_connect_span)
+
+
+for engine in (sync_engine, async_engine.sync_engine):
+    instrument_engine(engine)
+
+
+class DeadlineSession(Session):
+    """
+    Session bounding every transaction by the time left to the current request.
+
+    """
+
+
+@event.listens_for(DeadlineSession, "after_begin")
+def apply_statement_timeout(
+    session: Session, transaction: SessionTransaction, connection: Connection
+) -> None:
+    """
+    Set the Postgres `statement_timeout` of a new transaction to the request's remaining budget.
+
+    Args:
+        session (Session): The session that began the transaction.
+        transaction (SessionTransaction): The new transaction.
+        connection (Connection): The connection the transaction runs on.
+
+    """
+    remaining = deadline.remaining()
+    if remaining is None or connection.dialect.name != "postgresql":
+        return
+    # SET LOCAL only lasts until the transaction ends, so the pooled connection stays clean
+    timeout_ms = max(int(remaining * 1000), 1)
+    connection.exec_driver_sql(f"SET LOCAL statement_timeout = {timeout_ms}")
+
+
 async_session_factory = async_sessionmaker(
     bind=async_engine,
     autoflush=False,
     future=True,
+    sync_session_class=DeadlineSession,
 )
 
 
+def jump_hash(key: int, buckets: int) -> int:
+    """
+    Map a key to a bucket with Lamping and Veach's jump consistent hash.
+
+    Growing from n to n + 1 buckets only moves 1 / (n + 1) of the keys, all to the new bucket.
+
+    Args:
+        key (int): The key, a 64-bit integer.
+        buckets (int): The number of buckets.
+
+    Returns:
+        int: The bucket, from 0 to `buckets - 1`.
+
+    """
+    key &= 0xFFFFFFFFFFFFFFFF
+    bucket, jump = -1, 0
+    while jump < buckets:
+        bucket = jump
+        key = (key * 2862933555777941757 + 1) & 0xFFFFFFFFFFFFFFFF
+        jump = int((bucket + 1) * ((1 << 31) / ((key >> 33) + 1)))
+    return bucket
+
+
+class ShardedSession:
+    """
+    Per-request view over the shards, opening one session per shard on first use.
+
+    `CRUDBase` routes single object operations to the session of the object's shard
+    with `for_id`, and fans list queries out to `all` of them in parallel. Used as a
+    context manager, like `AsyncSession`, it closes every session it opened.
+
+    Attributes:
+        router (ShardRouter): The shards.
+
+    """
+
+    def __init__(self, router: "ShardRouter"):
+        self.router = router
+        self._sessions: Dict[int, AsyncSession] = {}
+
+    def shard(self, index: int) -> AsyncSession:
+        """
+        Get the session of a shard.
+
+        Args:
+            index (int): The shard index.
+
+        Returns:
+            AsyncSession: The session.
+
+        """
+        session = self._sessions.get(index)
+        if session is None:
+            session = self._sessions[index] = self.router.factories[index]()
+        return session
+
+    def for_id(self, id: Any) -> AsyncSession:
+        """
+        Get the session of the shard an ID belongs to.
+
+        Args:
+            id (Any): The ID.
+
+        Returns:
+            AsyncSession: The session.
+
+        """
+        return self.shard(self.router.shard_for(id))
+
+    def all(self) -> List[AsyncSession]:
+        """
+        Get the sessions of every shard.
+
+        Returns:
+            List[AsyncSession]: The sessions, in shard order.
+
+        """
+        return [self.shard(index) for index in range(len(self.router.factories))]
+
+    @asynccontextmanager
+    async def begin(self) -> AsyncIterator["ShardedSession"]:
+        """
+        Run a block in a transaction on every shard it touches.
+
+        The shard sessions begin on first use. On exit they all commit, with a two-phase
+        commit when the router asks for it and more than one shard was used. An error in
+        the block rolls them all back; without two-phase commit, a failure while committing
+        leaves the shards that already committed as they are.
+
+        Yields:
+            ShardedSession: This session.
+
+        """
+        try:
+            yield self
+            active = [s for s in self._sessions.values() if s.in_transaction()]
+            if self.router.two_phase and len(active) > 1:
+                for session in active:
+                    await session.run_sync(lambda s: s.get_transaction().prepare())
+            for session in active:
+                await session.commit()
+        except BaseException:
+            for session in self._sessions.values():
+                await session.rollback()
+            raise
+
+    async def close(self) -> None:
+        """
+        Close every session opened so far.
+
+        """
+        sessions, self._sessions = list(self._sessions.values()), {}
+        for session in sessions:
+            await session.close()
+
+    async def __aenter__(self) -> "ShardedSession":
+        return self
+
+    async def __aexit__(self, *exc_info: Any) -> None:
+        await self.close()
+
+
+# A plain session, or a sharded session when the tables are spread across databases
+DBSession = Union[AsyncSession, ShardedSession]
+
+
+class ShardRouter:
+    """
+    The databases the sharded tables are spread across, and which one holds each ID.
+
+    Attributes:
+        engines (List[AsyncEngine]): The engine of each shard.
+        factories (List[async_sessionmaker[AsyncSession]]): The session factory of each shard.
+        two_phase (bool): Whether writes to several shards commit with two-phase commit.
+
+    """
+
+    def __init__(self, urls: Sequence[str], two_phase: bool = False):
+        self.two_phase = two_phase
+        self.engines: List[AsyncEngine] = []
+        for url in urls:
+            options: Dict[str, Any] = {"pool_pre_ping": True}
+            if not url.startswith("sqlite"):
+                options.update(
+                    pool_size=settings.DB_POOL_SIZE,
+                    max_overflow=settings.DB_MAX_OVERFLOW,
+                    pool_timeout=settings.DB_POOL_TIMEOUT,
+                    pool_recycle=settings.DB_POOL_RECYCLE,
+                )
+            engine = create_async_engine(url, echo=settings.DB_ECHO, **options)
+            instrument_engine(engine.sync_engine)
+            self.engines.append(engine)
+        self.factories = [
+            async_sessionmaker(
+                bind=engine,
+                autoflush=False,
+                sync_session_class=DeadlineSession,
+                twophase=two_phase,
+            )
+            for engine in self.engines
+        ]
+
+    @classmethod
+    def single(cls, factory: async_sessionmaker[AsyncSession]) -> "ShardRouter":
+        """
+        Build a router over a single database.
+
+        Args:
+            factory (async_sessionmaker[AsyncSession]): The session factory of the database.
+
+        Returns:
+            ShardRouter: The router.
+
+        """
+        router = cls([])
+        router.factories = [factory]
+        return router
+
+    @property
+    def sharded(self) -> bool:
+        return len(self.factories) > 1
+
+    def shard_for(self, id: Any) -> int:
+        """
+        Get the shard an ID belongs to.
+
+        Args:
+            id (Any): The ID.
+
+        Returns:
+            int: The shard index.
+
+        """
+        return jump_hash(int(id), len(self.factories))
+
+    def session(self) -> DBSession:
+        """
+        Open a session for a request.
+
+        Returns:
+            DBSession: A plain session when there is a single
+                database, so unsharded deployments pay nothing for sharding.
+
+        """
+        if not self.sharded:
+            return self.factories[0]()
+        return ShardedSession(self)
+
+
+if settings.DB_SHARDS:
+    shards = ShardRouter(settings.DB_SHARDS, two_phase=settings.DB_SHARD_TWO_PHASE)
+else:
+    shards = ShardRouter.single(async_session_factory)
+
+
+class InstrumentedPipeline(Pipeline):  # type: ignore
+    """
+    Pipeline adding its commands to the request's stats and trace, as one round trip.
+
+    """
+
+    async def execute(self, raise_on_error: bool = True) -> List[Any]:
+        stats = current_stats()
+        commands = len(self.command_stack)
+        started = time.perf_counter()
+        try:
+            with tracer.span("redis pipeline", kind="client", **{"db.system": "redis"}):
+                return await super().execute(raise_on_error)
+        finally:
+            if stats is not None:
+                stats.record_redis(commands, time.perf_counter() - started)
+
+
+class InstrumentedConnection(RedisConnection):  # type: ignore
+    """
+    Redis connection timing its connection setup in the request's trace.
+
+    """
+
+    async def connect(self) -> None:
+        if self.is_connected:
+            return
+        with tracer.span("redis connect", kind="client", **{"db.system": "redis"}):
+            await super().connect()
+
+
+class InstrumentedRedis(aioredis.Redis):  # type: ignore
+    """
+    Redis client adding its commands to the request's stats and trace, and its
+    connection setup to the trace.
+
+    """
+
+    @classmethod
+    def from_url(cls, url: str, **kwargs: Any) -> "InstrumentedRedis":
+        # Plain TCP connections only, the URL picks the class of TLS and unix sockets
+        kwargs.setdefault("connection_class", InstrumentedConnection)
+        return super().from_url(url, **kwargs)
+
+    async def execute_command(self, *args: Any, **options: Any) -> Any:
+        stats = current_stats()
+        started = time.perf_counter()
+        try:
+            with tracer.span(f"redis {args[0]}", kind="client", **{"db.system": "redis"}):
+                return await super().execute_command(*args, **options)
+        finally:
+            if stats is not None:
+                stats.record_redis(1, time.perf_counter() - started)
+
+    def pipeline(
+        self, transaction: bool = True, shard_hint: Optional[str] = None
+    ) -> InstrumentedPipeline:
+        return InstrumentedPipeline(
+            self.connection_pool, self.response_callbacks, transaction, shard_hint
+        )
+
+
 async def get_redis_session() -> aioredis.Redis:  # type: ignore
     """
     Get a Redis session.
 
+    Socket timeouts are bounded by the time left to the current request, if any.
+
     Returns:
         aioredis.Redis: The Redis session.
 
     """
-    return await aioredis.from_url(settings.REDIS_URI)
+    options: dict[str, Any] = {}
+    remaining = deadline.remaining()
+    if remaining is not None:
+        options["socket_timeout"] = options["socket_connect_timeout"] = max(
+            remaining, 0.001
+        )
+    return await InstrumentedRedis.from_url(settings.REDIS_URI, **options)
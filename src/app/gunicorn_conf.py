@@ -0,0 +1,87 @@
+"""
+Gunicorn configuration for production, every value can be overridden from the environment.
+
+Used by `dist/app/scripts/start.sh` when `DEV_MODE` is not `true`.
+"""
+import math
+import os
+
+from app.core.config import settings
+
+
+def available_cpus() -> int:
+    """
+    Count the CPUs this process may actually use.
+
+    Takes the scheduler affinity and the cgroup v2 CPU quota into account, so a container
+    limited to 2 CPUs on a 64 core host gets 2.
+
+    Returns:
+        int: The number of usable CPUs, at least 1.
+
+    """
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as cpu_max:
+            quota, period = cpu_max.read().split()
+        if quota != "max":
+            cpus = min(cpus, math.ceil(int(quota) / int(period)))
+    except (OSError, ValueError):
+        pass
+    return max(cpus, 1)
+
+
+def worker_count() -> int:
+    """
+    Get the number of workers to start.
+
+    Async workers keep a core busy on their own, so the default is one per CPU
+    instead of the `2 * CPU + 1` recommended for sync workers, with a floor of two so a
+    crashing worker never takes the whole service down. `MAX_WORKERS` caps the
+    count so that `workers * (DB_POOL_SIZE + DB_MAX_OVERFLOW)` stays under the
+    Postgres `max_connections`.
+
+    Returns:
+        int: The number of workers.
+
+    """
+    if os.getenv("WEB_CONCURRENCY"):
+        return max(int(os.environ["WEB_CONCURRENCY"]), 1)
+    workers = math.ceil(float(os.getenv("WORKERS_PER_CORE", "1")) * available_cpus())
+    workers = max(workers, 2)
+    if os.getenv("MAX_WORKERS"):
+        workers = min(workers, int(os.environ["MAX_WORKERS"]))
+    return max(workers, 1)
+
+
+# Server socket
+bind = os.getenv("BIND") or f"{os.getenv('HOST', '0.0.0.0')}:{os.getenv('PORT', '80')}"
+# Pending connections the kernel queues for us, also capped by net.core.somaxconn
+backlog = int(os.getenv("BACKLOG", "2048"))
+
+# Workers
+workers = worker_count()
+worker_class = os.getenv("WORKER_CLASS", "app.worker.TunedUvicornWorker")
+# Longer than the usual load balancer idle timeout (60s), so the proxy closes idle connections first
+keepalive = int(os.getenv("KEEPALIVE", "75"))
+# Recycle workers periodically to bound memory growth, jittered so they don't restart together
+max_requests = int(os.getenv("MAX_REQUESTS", "10000"))
+max_requests_jitter = int(os.getenv("MAX_REQUESTS_JITTER", "1000"))
+
+# Timeouts: in-flight requests are bounded by REQUEST_TIMEOUT, and waits for a pooled
+# connection by DB_POOL_TIMEOUT, so draining on restart never needs longer than that
+graceful_timeout = int(
+    os.getenv(
+        "GRACEFUL_TIMEOUT",
+        str(math.ceil(max(settings.REQUEST_TIMEOUT, settings.DB_POOL_TIMEOUT)) + 5),
+    )
+)
+timeout = int(os.getenv("TIMEOUT", str(max(graceful_timeout, 30))))
+
+# Logging
+loglevel = os.getenv("LOG_LEVEL", "info")
+accesslog = os.getenv("ACCESS_LOG", "-") or None
+errorlog = os.getenv("ERROR_LOG", "-")
@@ -1,17 +1,97 @@
+import asyncio
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+
 from fastapi import FastAPI
 from fastapi.responses import HTMLResponse
 
 from app.api.api_v1.api import api_router
 from app.core.config import settings
+from app.core.tracing import tracer
+from app.db.session import get_redis_session
+from app.middleware import (
+    AdmissionControlMiddleware,
+    DeadlineMiddleware,
+    RateLimitMiddleware,
+    RequestStatsMiddleware,
+    TracingMiddleware,
+    admission_controller,
+    instrument_fastapi,
+    rate_limiter,
+)
+from app.util.bloom import keep_user_ids_filter
+from app.util.change_feed import user_changes
+from app.util.hot_keys import hot_keys
+from app.util.memory import memory_profiler, memory_sampler
+from app.util.outbox import invalidation_outbox
+from app.util.snowflake import worker_id_lease
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI) -> AsyncIterator[None]:
+    """
+    Run the background jobs of the worker for as long as it serves requests.
+
+    Args:
+        app (FastAPI): The application.
+
+    """
+    tasks = []
+    if settings.SNOWFLAKE_WORKER_ID is None:
+        redis = await get_redis_session()
+        try:
+            await worker_id_lease.keep(redis)
+        finally:
+            await redis.aclose()
+        tasks.append(asyncio.create_task(worker_id_lease.run()))
+    if settings.CACHE_OUTBOX_ENABLED:
+        tasks.append(asyncio.create_task(invalidation_outbox.run()))
+    if settings.USER_BLOOM_ENABLED:
+        tasks.append(asyncio.create_task(keep_user_ids_filter()))
+    if settings.HOT_KEYS_ENABLED:
+        tasks.append(asyncio.create_task(hot_keys.run()))
+    if settings.MEMORY_DIAGNOSTICS_ENABLED:
+        if settings.MEMORY_TRACEMALLOC_FRAMES > 0:
+            memory_profiler.start(settings.MEMORY_TRACEMALLOC_FRAMES)
+        if settings.MEMORY_SAMPLE_INTERVAL > 0:
+            tasks.append(asyncio.create_task(memory_sampler.run()))
+    yield
+    await user_changes.stop()
+    await rate_limiter.close()
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
 
 app = FastAPI(
     title=settings.PROJECT_NAME,
     openapi_url=f"{settings.API_V1_STR}/openapi.json",
     debug=settings.DEBUG_MODE,
+    lifespan=lifespan,
 )
 
 app.include_router(api_router, prefix=settings.API_V1_STR)
 
+if settings.ADMISSION_CONTROL_ENABLED:
+    app.add_middleware(AdmissionControlMiddleware, controller=admission_controller)
+# Added after admission control so rejected clients never wait for a slot
+if settings.RATE_LIMIT_ENABLED:
+    app.add_middleware(RateLimitMiddleware, limiter=rate_limiter)
+# Added after admission control so time spent queueing counts against the budget
+app.add_middleware(
+    DeadlineMiddleware,
+    timeout=settings.REQUEST_TIMEOUT,
+    exempt_paths=settings.STREAMING_PATHS,
+)
+if settings.REQUEST_STATS_ENABLED:
+    app.add_middleware(
+        RequestStatsMiddleware, n_plus_one_threshold=settings.N_PLUS_ONE_THRESHOLD
+    )
+# Outermost, so the server span covers the whole request
+if settings.TRACING_ENABLED:
+    instrument_fastapi(tracer)
+    app.add_middleware(TracingMiddleware, tracer=tracer)
+
 
 @app.get("/", response_class=HTMLResponse)
 async def root() -> str:
@@ -0,0 +1,16 @@
+from .admission import AdmissionControlMiddleware, admission_controller
+from .deadline import DeadlineMiddleware
+from .rate_limit import RateLimitMiddleware, rate_limiter
+from .request_stats import RequestStatsMiddleware
+from .tracing import TracingMiddleware, instrument_fastapi
+
+__all__ = [
+    "AdmissionControlMiddleware",
+    "DeadlineMiddleware",
+    "RateLimitMiddleware",
+    "RequestStatsMiddleware",
+    "TracingMiddleware",
+    "admission_controller",
+    "instrument_fastapi",
+    "rate_limiter",
+]
@@ -0,0 +1,238 @@
+import asyncio
+from typing import Any, Dict, Iterable, Optional
+
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from app.core.config import settings
+
+
+class AdmissionGate:
+    """
+    Concurrency limiter for one class of requests with a bounded wait queue.
+
+    Attributes:
+        name (str): The request class the gate admits.
+        limit (int): The maximum number of requests served concurrently.
+        queue_size (int): The maximum number of requests waiting for a slot.
+        queue_timeout (float): How long, in seconds, a request may wait for a slot.
+        active (int): The number of requests currently being served.
+        waiting (int): The number of requests currently waiting for a slot.
+        admitted (int): The total number of admitted requests.
+        shed (int): The total number of rejected requests.
+
+    """
+
+    def __init__(self, name: str, limit: int, queue_size: int, queue_timeout: float):
+        self.name = name
+        self.limit = limit
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self.active = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.shed = 0
+        self._semaphore = asyncio.Semaphore(limit)
+
+    async def acquire(self) -> bool:
+        """
+        Wait for a free slot.
+
+        Requests are shed straight away when the queue is full, or once they waited
+        longer than `queue_timeout`.
+
+        Returns:
+            bool: Whether the request was admitted.
+
+        """
+        if self._semaphore.locked() and self.waiting >= self.queue_size:
+            self.shed += 1
+            return False
+
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            self.shed += 1
+            return False
+        finally:
+            self.waiting -= 1
+
+        self.active += 1
+        self.admitted += 1
+        return True
+
+    def release(self) -> None:
+        """
+        Free the slot held by an admitted request.
+
+        """
+        self.active -= 1
+        self._semaphore.release()
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get the current state of the gate.
+
+        Returns:
+            Dict[str, Any]: The limits, queue depth and counters of the gate.
+
+        """
+        return {
+            "limit": self.limit,
+            "queue_size": self.queue_size,
+            "active": self.active,
+            "waiting": self.waiting,
+            "admitted": self.admitted,
+            "shed": self.shed,
+        }
+
+
+class AdmissionController:
+    """
+    Maps requests to their admission gate.
+
+    Requests are split in four classes: `health` for the health endpoints, `stream` for
+    long-lived streaming endpoints, `read` for safe methods and `write` for everything else.
+
+    Attributes:
+        gates (Dict[str, AdmissionGate]): The gates, keyed by request class.
+        health_prefix (str): The path prefix of the health endpoints.
+        exempt_paths (set[str]): Paths that are always served, bypassing the gates.
+        retry_after (int): The `Retry-After` value, in seconds, sent with shed requests.
+        stream_paths (set[str]): Paths of the streaming endpoints.
+
+    """
+
+    SAFE_METHODS = {"GET", "HEAD", "OPTIONS"}
+
+    def __init__(
+        self,
+        gates: Dict[str, AdmissionGate],
+        health_prefix: str,
+        exempt_paths: Iterable[str],
+        retry_after: int,
+        stream_paths: Iterable[str] = (),
+    ):
+        self.gates = gates
+        self.health_prefix = health_prefix
+        self.exempt_paths = set(exempt_paths)
+        self.retry_after = retry_after
+        self.stream_paths = set(stream_paths)
+
+    def classify(self, scope: Scope) -> str:
+        """
+        Get the request class of an HTTP request.
+
+        Args:
+            scope (Scope): The ASGI scope of the request.
+
+        Returns:
+            str: The request class.
+
+        """
+        if scope["path"].startswith(self.health_prefix):
+            return "health"
+        if scope["path"] in self.stream_paths:
+            return "stream"
+        if scope["method"] in self.SAFE_METHODS:
+            return "read"
+        return "write"
+
+    def gate_for(self, scope: Scope) -> Optional[AdmissionGate]:
+        """
+        Get the gate an HTTP request has to pass.
+
+        Args:
+            scope (Scope): The ASGI scope of the request.
+
+        Returns:
+            Optional[AdmissionGate]: The gate, or None if the request is exempt.
+
+        """
+        if scope["path"] in self.exempt_paths:
+            return None
+        return self.gates.get(self.classify(scope))
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Get the current state of all gates.
+
+        Returns:
+            Dict[str, Dict[str, Any]]: The state of each gate, keyed by request class.
+
+        """
+        return {name: gate.stats() for name, gate in self.gates.items()}
+
+
+class AdmissionControlMiddleware:
+    """
+    ASGI middleware shedding requests with 503 once their admission gate is saturated.
+
+    """
+
+    def __init__(self, app: ASGIApp, controller: AdmissionController):
+        self.app = app
+        self.controller = controller
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        gate = self.controller.gate_for(scope)
+        if gate is None:
+            await self.app(scope, receive, send)
+            return
+
+        if not await gate.acquire():
+            response = JSONResponse(
+                {"detail": "Service is overloaded, retry later."},
+                status_code=503,
+                headers={"Retry-After": str(self.controller.retry_after)},
+            )
+            await response(scope, receive, send)
+            return
+
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            gate.release()
+
+
+def _gate(
+    name: str, limit: int, queue_size: int = settings.ADMISSION_QUEUE_SIZE
+) -> AdmissionGate:
+    """
+    Create a gate with the configured queue settings.
+
+    Args:
+        name (str): The request class the gate admits.
+        limit (int): The maximum number of requests served concurrently.
+        queue_size (int): The maximum number of requests waiting for a slot.
+
+    Returns:
+        AdmissionGate: The gate.
+
+    """
+    return AdmissionGate(
+        name,
+        limit=limit,
+        queue_size=queue_size,
+        queue_timeout=settings.ADMISSION_QUEUE_TIMEOUT,
+    )
+
+
+admission_controller = AdmissionController(
+    gates={
+        "read": _gate("read", settings.ADMISSION_READ_LIMIT),
+        "write": _gate("write", settings.ADMISSION_WRITE_LIMIT),
+        "health": _gate("health", settings.ADMISSION_HEALTH_LIMIT),
+        # Streams hold their slot for their whole life, so there is no point queueing
+        "stream": _gate("stream", settings.CHANGE_FEED_MAX_CLIENTS, queue_size=0),
+    },
+    health_prefix=f"{settings.API_V1_STR}/health",
+    exempt_paths=[f"{settings.API_V1_STR}/health/_alive"],
+    retry_after=settings.ADMISSION_RETRY_AFTER,
+    stream_paths=settings.STREAMING_PATHS,
+)
@@ -0,0 +1,92 @@
+import asyncio
+from typing import Any, Iterable, MutableMapping
+
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.core.deadline import reset_deadline, set_deadline
+
+
+class DeadlineMiddleware:
+    """
+    ASGI middleware giving every HTTP request a time budget.
+
+    The deadline is stored in a context variable so the database and Redis sessions
+    can derive their own timeouts from it. The request is cancelled when the
+    budget runs out, answering 504 if nothing was sent yet, or as soon as the client
+    disconnects. Cancelling unwinds the session dependencies, which hands the pooled
+    connections back straight away.
+
+    Once the whole response is sent the request is never cancelled: the handler may still
+    be closing its dependencies, and clients disconnect as soon as they have the response.
+
+    Attributes:
+        timeout (float): The budget of each request, in seconds.
+        exempt_paths (set[str]): Paths without a budget, such as streaming endpoints.
+
+    """
+
+    def __init__(self, app: ASGIApp, timeout: float, exempt_paths: Iterable[str] = ()):
+        self.app = app
+        self.timeout = timeout
+        self.exempt_paths = set(exempt_paths)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if (
+            scope["type"] != "http"
+            or self.timeout <= 0
+            or scope["path"] in self.exempt_paths
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        state: MutableMapping[str, Any] = {
+            "response_started": False,
+            "response_complete": False,
+        }
+        messages: "asyncio.Queue[Message]" = asyncio.Queue()
+
+        async def pump_receive() -> None:
+            # Own `receive` so a disconnect is noticed while the handler is busy
+            while True:
+                message = await receive()
+                await messages.put(message)
+                if message["type"] == "http.disconnect":
+                    return
+
+        async def send_wrapper(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                state["response_started"] = True
+            elif message["type"] == "http.response.body" and not message.get(
+                "more_body", False
+            ):
+                state["response_complete"] = True
+            await send(message)
+
+        token = set_deadline(self.timeout)
+        try:
+            handler = asyncio.ensure_future(self.app(scope, messages.get, send_wrapper))
+            listener = asyncio.ensure_future(pump_receive())
+            done, _ = await asyncio.wait(
+                {handler, listener},
+                timeout=self.timeout,
+                return_when=asyncio.FIRST_COMPLETED,
+            )
+        finally:
+            reset_deadline(token)
+
+        if handler in done or state["response_complete"]:
+            # Let a handler done with its response finish tearing down its dependencies
+            listener.cancel()
+            await handler
+            return
+
+        handler.cancel()
+        listener.cancel()
+        await asyncio.gather(handler, listener, return_exceptions=True)
+        if not done and not state["response_started"]:
+            # Deadline exceeded while the client is still waiting
+            response = JSONResponse(
+                {"detail": "Request deadline exceeded."}, status_code=504
+            )
+            await response(scope, receive, send)
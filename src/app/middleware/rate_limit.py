@@ -0,0 +1,322 @@
+import fnmatch
+import hashlib
+import math
+import re
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from starlette.datastructures import Headers
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from app.core.config import settings
+from app.db.session import InstrumentedRedis
+from app.util.cache import Cache
+
+# Refills the bucket for the time elapsed since its last use, by the clock of the Redis
+# server so that every worker agrees, then takes one token if there is one.
+# KEYS[1]: the bucket, ARGV[1]: tokens per second, ARGV[2]: capacity.
+# Returns whether the request is allowed, the tokens left and the milliseconds until
+# the next token.
+TOKEN_BUCKET_SCRIPT = """
+if redis.replicate_commands then
+    -- Needed before Redis 5 for writes after TIME, a no-op since
+    redis.replicate_commands()
+end
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local time = redis.call('TIME')
+local now = tonumber(time[1]) * 1000 + math.floor(tonumber(time[2]) / 1000)
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(bucket[1])
+local ts = tonumber(bucket[2])
+if tokens == nil or ts == nil then
+    tokens = burst
+    ts = now
+end
+tokens = math.min(burst, tokens + math.max(0, now - ts) * rate / 1000)
+local allowed = 0
+local retry_after = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+    allowed = 1
+else
+    retry_after = math.ceil((1 - tokens) * 1000 / rate)
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+redis.call('PEXPIRE', KEYS[1], math.ceil(burst * 1000 / rate))
+return {allowed, math.floor(tokens), retry_after}
+"""
+
+
+class RateLimit(NamedTuple):
+    """
+    The token bucket of a route class.
+
+    Attributes:
+        rate (float): The tokens added per second, i.e. the sustained requests per second.
+        burst (int): The capacity of the bucket, i.e. the requests allowed at once.
+
+    """
+
+    rate: float
+    burst: int
+
+
+class Decision(NamedTuple):
+    """
+    The outcome of a rate limit check.
+
+    Attributes:
+        allowed (bool): Whether the request may go through.
+        remaining (int): The requests the client may still make right away.
+        retry_after (float): The seconds until the next request is allowed, if rejected.
+
+    """
+
+    allowed: bool
+    remaining: int
+    retry_after: float
+
+
+class LocalTokenBuckets:
+    """
+    In-process token buckets, used while Redis is unavailable.
+
+    Each worker counts on its own, so the effective limit is multiplied by the number of
+    workers. The least recently used buckets are dropped past `max_buckets`.
+
+    Attributes:
+        max_buckets (int): The maximum number of buckets kept.
+
+    """
+
+    def __init__(self, max_buckets: int):
+        self.max_buckets = max_buckets
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+
+    def acquire(self, key: str, limit: RateLimit) -> Decision:
+        """
+        Take a token from a bucket.
+
+        Args:
+            key (str): The bucket.
+            limit (RateLimit): The rate and capacity of the bucket.
+
+        Returns:
+            Decision: Whether the request is allowed.
+
+        """
+        now = time.monotonic()
+        tokens, last = self._buckets.pop(key, (float(limit.burst), now))
+        tokens = min(limit.burst, tokens + (now - last) * limit.rate)
+        if tokens >= 1:
+            decision = Decision(True, math.floor(tokens - 1), 0.0)
+            tokens -= 1
+        else:
+            decision = Decision(False, 0, (1 - tokens) / limit.rate)
+        self._buckets[key] = (tokens, now)
+        if len(self._buckets) > self.max_buckets:
+            self._buckets.popitem(last=False)
+        return decision
+
+
+class RateLimiter:
+    """
+    Per-client token bucket rate limiting, shared by all workers through Redis.
+
+    Requests are mapped to a route class by the first `METHOD path` glob pattern of
+    `routes` they match, and each client gets one bucket per class. Clients are told
+    apart by their `key_header`, an API key, if its SHA-256 digest is one of `api_keys`,
+    else by their IP address, so that sending random keys never gets a fresh bucket.
+    A check is one `EVALSHA` round trip, through the cache's circuit breaker and
+    timeout. While Redis is unavailable the buckets are kept in process.
+
+    Attributes:
+        limits (Dict[str, RateLimit]): The bucket of each route class.
+        routes (List[Tuple[re.Pattern, str]]): The route patterns and their class.
+        key_header (str): The header identifying a client.
+        api_keys (Set[str]): The SHA-256 hex digests of the known API keys.
+        prefix (str): The prefix of the Redis keys of the buckets.
+        fallback (LocalTokenBuckets): The buckets used while Redis is unavailable.
+        limited (Dict[str, int]): The number of rejected requests per route class.
+        fallbacks (int): The number of checks made in process.
+        unknown_keys (int): The number of requests with an unknown API key.
+
+    """
+
+    def __init__(
+        self,
+        limits: Dict[str, RateLimit],
+        routes: Dict[str, str],
+        key_header: str,
+        fallback_size: int,
+        api_keys: Iterable[str] = (),
+        prefix: str = "rate_limit",
+    ):
+        self.limits = limits
+        self.routes: List[Tuple[re.Pattern, str]] = [
+            (re.compile(fnmatch.translate(pattern)), name)
+            for pattern, name in routes.items()
+        ]
+        self.key_header = key_header
+        self.api_keys = {digest.lower() for digest in api_keys}
+        self.prefix = prefix
+        self.fallback = LocalTokenBuckets(fallback_size)
+        self.limited = {name: 0 for name in limits}
+        self.fallbacks = 0
+        self.unknown_keys = 0
+        self._redis: Optional[Any] = None
+        self._script: Optional[Any] = None
+
+    def classify(self, scope: Scope) -> Optional[str]:
+        """
+        Get the route class of an HTTP request.
+
+        Args:
+            scope (Scope): The ASGI scope of the request.
+
+        Returns:
+            Optional[str]: The route class, or None if the request is not limited.
+
+        """
+        target = f"{scope['method']} {scope['path']}"
+        for pattern, name in self.routes:
+            if pattern.match(target):
+                return name if name in self.limits else None
+        return None
+
+    def client(self, scope: Scope) -> str:
+        """
+        Identify the client of an HTTP request.
+
+        Args:
+            scope (Scope): The ASGI scope of the request.
+
+        Returns:
+            str: The digest of the client's key if it is known, else its IP address.
+
+        """
+        key = Headers(scope=scope).get(self.key_header)
+        if key:
+            digest = hashlib.sha256(key.encode()).hexdigest()
+            if digest in self.api_keys:
+                return f"key:{digest[:32]}"
+            self.unknown_keys += 1
+        client = scope.get("client")
+        return f"ip:{client[0] if client else 'unknown'}"
+
+    async def acquire(self, route_class: str, client: str) -> Decision:
+        """
+        Take a token from a client's bucket.
+
+        Args:
+            route_class (str): The route class of the request.
+            client (str): The client, as returned by `client`.
+
+        Returns:
+            Decision: Whether the request is allowed.
+
+        """
+        limit = self.limits[route_class]
+        key = f"{self.prefix}:{route_class}:{client}"
+        if self._redis is None:
+            # Created on first use, so that it belongs to the worker's event loop
+            self._redis = InstrumentedRedis.from_url(settings.REDIS_URI)
+            self._script = self._redis.register_script(TOKEN_BUCKET_SCRIPT)
+        script = self._script
+        ok, result = await Cache(self._redis).call(
+            lambda: script(keys=[key], args=[limit.rate, limit.burst])
+        )
+        if not ok:
+            self.fallbacks += 1
+            return self.fallback.acquire(key, limit)
+        allowed, remaining, retry_after_ms = result
+        return Decision(bool(allowed), int(remaining), int(retry_after_ms) / 1000)
+
+    async def check(self, scope: Scope) -> Tuple[Optional[str], Optional[Decision]]:
+        """
+        Rate limit an HTTP request.
+
+        Args:
+            scope (Scope): The ASGI scope of the request.
+
+        Returns:
+            Tuple[Optional[str], Optional[Decision]]: The route class and the decision, or
+                None and None if the request is not limited.
+
+        """
+        route_class = self.classify(scope)
+        if route_class is None:
+            return None, None
+        decision = await self.acquire(route_class, self.client(scope))
+        if not decision.allowed:
+            self.limited[route_class] += 1
+        return route_class, decision
+
+    async def close(self) -> None:
+        """
+        Close the Redis connections of the worker.
+
+        """
+        if self._redis is not None:
+            await self._redis.aclose()
+            self._redis = self._script = None
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get the limits and counters of the worker.
+
+        Returns:
+            Dict[str, Any]: The bucket and rejected requests of each route class, the
+                number of checks made in process and of requests with an unknown API key.
+
+        """
+        return {
+            "classes": {
+                name: {**limit._asdict(), "limited": self.limited[name]}
+                for name, limit in self.limits.items()
+            },
+            "fallbacks": self.fallbacks,
+            "unknown_keys": self.unknown_keys,
+        }
+
+
+class RateLimitMiddleware:
+    """
+    ASGI middleware rejecting requests with 429 once their client's bucket is empty.
+
+    """
+
+    def __init__(self, app: ASGIApp, limiter: RateLimiter):
+        self.app = app
+        self.limiter = limiter
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        _, decision = await self.limiter.check(scope)
+        if decision is None or decision.allowed:
+            await self.app(scope, receive, send)
+            return
+
+        response = JSONResponse(
+            {"detail": "Too many requests, retry later."},
+            status_code=429,
+            headers={"Retry-After": str(max(math.ceil(decision.retry_after), 1))},
+        )
+        await response(scope, receive, send)
+
+
+rate_limiter = RateLimiter(
+    limits={
+        name: RateLimit(*limit) for name, limit in settings.RATE_LIMIT_CLASSES.items()
+    },
+    routes=settings.RATE_LIMIT_ROUTES,
+    key_header=settings.RATE_LIMIT_KEY_HEADER,
+    api_keys=settings.RATE_LIMIT_API_KEYS,
+    fallback_size=settings.RATE_LIMIT_FALLBACK_BUCKETS,
+)
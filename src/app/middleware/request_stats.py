@@ -0,0 +1,117 @@
+import logging
+import time
+
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.core.request_stats import (
+    RequestStats,
+    fingerprint_id,
+    log_event,
+    reset_stats,
+    start_stats,
+)
+
+logger = logging.getLogger("app.request")
+
+
+def server_timing(stats: RequestStats, total: float) -> str:
+    """
+    Render the `Server-Timing` header of a request.
+
+    Args:
+        stats (RequestStats): The request's stats.
+        total (float): The time spent so far on the request, in seconds.
+
+    Returns:
+        str: The header value.
+
+    """
+    return ", ".join(
+        [
+            f'db;dur={stats.db_time * 1000:.2f};desc="{stats.queries} queries"',
+            f'redis;dur={stats.redis_time * 1000:.2f};desc="{stats.redis_commands} commands"',
+            f"app;dur={total * 1000:.2f}",
+        ]
+    )
+
+
+class RequestStatsMiddleware:
+    """
+    ASGI middleware collecting the database and Redis activity of every HTTP request.
+
+    The stats are stored in a context variable, filled by the SQLAlchemy and Redis hooks
+    of `app.db.session`. They are sent back in a `Server-Timing` header, as they stand
+    when the response starts, and logged as one JSON line once the request is done,
+    along with a warning for every statement run more than `n_plus_one_threshold` times.
+
+    Attributes:
+        n_plus_one_threshold (int): The number of runs of one statement considered normal.
+
+    """
+
+    def __init__(self, app: ASGIApp, n_plus_one_threshold: int):
+        self.app = app
+        self.n_plus_one_threshold = n_plus_one_threshold
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats()
+        token = start_stats(stats)
+        started = time.perf_counter()
+        status = 500
+
+        async def send_with_timing(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                headers = MutableHeaders(scope=message)
+                headers.append(
+                    "Server-Timing", server_timing(stats, time.perf_counter() - started)
+                )
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            reset_stats(token)
+            self.log(scope, status, stats, time.perf_counter() - started)
+
+    def log(self, scope: Scope, status: int, stats: RequestStats, total: float) -> None:
+        """
+        Log the stats of a finished request.
+
+        Args:
+            scope (Scope): The request's scope.
+            status (int): The response status, 500 if none was sent.
+            stats (RequestStats): The request's stats.
+            total (float): The request's duration, in seconds.
+
+        """
+        log_event(
+            logger,
+            logging.INFO,
+            "request",
+            method=scope["method"],
+            path=scope["path"],
+            status=status,
+            duration_ms=round(total * 1000, 2),
+            queries=stats.queries,
+            db_ms=round(stats.db_time * 1000, 2),
+            redis_commands=stats.redis_commands,
+            redis_ms=round(stats.redis_time * 1000, 2),
+        )
+        for statement, count in stats.repeated(self.n_plus_one_threshold).items():
+            log_event(
+                logger,
+                logging.WARNING,
+                "n_plus_one",
+                method=scope["method"],
+                path=scope["path"],
+                fingerprint_id=fingerprint_id(statement),
+                fingerprint=statement,
+                count=count,
+            )
@@ -0,0 +1,107 @@
+from typing import Any, Dict, Optional
+
+import fastapi.routing
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.core.tracing import Tracer
+
+
+def instrument_fastapi(tracer: Tracer) -> None:
+    """
+    Time the stages of FastAPI's request handling in their own spans.
+
+    FastAPI looks these functions up in `fastapi.routing` for every request, so wrapping
+    them there splits each handler into dependency resolution, the endpoint itself and
+    response validation and serialization.
+
+    Args:
+        tracer (Tracer): The tracer.
+
+    """
+    stages = {
+        "solve_dependencies": "fastapi.dependencies",
+        "run_endpoint_function": "fastapi.endpoint",
+        "serialize_response": "fastapi.serialize_response",
+    }
+    for attr, name in stages.items():
+        func = getattr(fastapi.routing, attr)
+        if not getattr(func, "__traced__", False):
+            wrapper = tracer.traced(name)(func)
+            wrapper.__traced__ = True  # type: ignore
+            setattr(fastapi.routing, attr, wrapper)
+
+
+class TracingMiddleware:
+    """
+    ASGI middleware starting a server span for every HTTP request.
+
+    The span continues the caller's trace when the request has a `traceparent` header,
+    and the response gets one back so the trace can be looked up. Spans are named after
+    the matched route, e.g. `GET /api/v1/user/{id}`.
+
+    Attributes:
+        tracer (Tracer): The tracer.
+
+    """
+
+    def __init__(self, app: ASGIApp, tracer: Tracer):
+        self.app = app
+        self.tracer = tracer
+        self._routes: Dict[Any, Optional[str]] = {}
+
+    def route(self, scope: Scope) -> Optional[str]:
+        """
+        Get the path template of the route that handled a request.
+
+        Args:
+            scope (Scope): The request's scope, once routed.
+
+        Returns:
+            Optional[str]: The path template, or None if no route matched.
+
+        """
+        endpoint = scope.get("endpoint")
+        if endpoint is None:
+            return None
+        if endpoint not in self._routes:
+            template = None
+            for route in scope["app"].routes:
+                if getattr(route, "endpoint", None) is endpoint:
+                    template = route.path
+                    break
+            self._routes[endpoint] = template
+        return self._routes[endpoint]
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        span = self.tracer.start_trace(
+            f"{scope['method']} {scope['path']}",
+            Headers(scope=scope).get("traceparent"),
+            **{"http.method": scope["method"], "http.target": scope["path"]},
+        )
+
+        async def send_with_traceparent(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                span.set_attribute("http.status_code", message["status"])
+                if message["status"] >= 500:
+                    span.status = "error"
+                if span.traceparent:
+                    MutableHeaders(scope=message).append("traceparent", span.traceparent)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_traceparent)
+        except BaseException as e:
+            span.record_exception(e)
+            raise
+        finally:
+            if span.sampled:
+                route = self.route(scope)
+                if route is not None:
+                    span.name = f"{scope['method']} {route}"
+                    span.set_attribute("http.route", route)
+            self.tracer.finish_trace(span)
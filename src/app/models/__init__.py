@@ -1,3 +1,4 @@
+from .cache_invalidation import CacheInvalidation  # noqa
 from .user import User  # noqa
 
-__all__ = ["User"]
+__all__ = ["CacheInvalidation", "User"]
@@ -1,8 +1,9 @@
 import datetime
 import json
-from typing import Any, Dict
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple, Type
 
 from sqlalchemy import MetaData, func
+from sqlalchemy import inspect as sa_inspect
 from sqlalchemy.ext.declarative import declared_attr
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column
 
@@ -15,6 +16,164 @@ convention = {
 }
 
 
+def _python_type(column_attr: Any) -> Any:
+    """
+    Get the Python type of a mapped column, or None if the column type doesn't declare one.
+
+    """
+    try:
+        return column_attr.expression.type.python_type
+    except NotImplementedError:
+        return None
+
+
+def _json_expression(python_type: Any, var: str) -> str:
+    """
+    Get the source of an expression rendering the JSON of a non null value of a column.
+
+    """
+    if python_type is not None and issubclass(python_type, datetime.datetime):
+        return f'\'"\' + {var}.isoformat() + \'"\''
+    if python_type is str:
+        return f"_encode_str({var})"
+    if python_type is int:
+        return f"_int_repr({var})"
+    return f"_dumps({var})"
+
+
+class ModelSerializer:
+    """
+    Serializer for one model, precomputed from the mapper's column list.
+
+    The conversion functions are generated once per model with one statement per column,
+    reading values straight from the instance's `__dict__`, or from a row by position,
+    and isoformatting only the datetime columns. This avoids walking the instance and
+    testing every value's type.
+
+    A serializer can be restricted to a subset of the columns, for sparse fieldsets.
+
+    Attributes:
+        keys (tuple[str, ...]): The attribute names of the serialized columns, in mapper order.
+
+    """
+
+    def __init__(self, model: Type["Base"], fields: Optional[Sequence[str]] = None):
+        column_attrs = list(sa_inspect(model).column_attrs)
+        if fields is not None:
+            unknown = set(fields) - {attr.key for attr in column_attrs}
+            if unknown:
+                raise ValueError(f"{model.__name__} has no column(s) {sorted(unknown)}")
+            column_attrs = [attr for attr in column_attrs if attr.key in fields]
+        self.keys = tuple(attr.key for attr in column_attrs)
+        types = [_python_type(attr) for attr in column_attrs]
+
+        items = []
+        json_parts = []
+        for i, (key, python_type) in enumerate(zip(self.keys, types)):
+            if python_type is not None and issubclass(python_type, datetime.datetime):
+                items.append(f"{key!r}: None if v{i} is None else v{i}.isoformat()")
+            else:
+                items.append(f"{key!r}: v{i}")
+            prefix = ("," if i else "{") + json.dumps(key) + ":"
+            value = _json_expression(python_type, f"v{i}")
+            json_parts.append(f"{prefix!r} + ('null' if v{i} is None else {value})")
+        by_key = "".join(
+            f"    v{i} = state[{key!r}]\n" for i, key in enumerate(self.keys)
+        )
+        by_index = "".join(f"    v{i} = row[{i}]\n" for i in range(len(self.keys)))
+        to_dict = "return {" + ", ".join(items) + "}"
+        to_json = "return (" + " + ".join(json_parts) + " + '}').encode('utf-8')"
+        source = (
+            f"def to_dict(state):\n{by_key}    {to_dict}\n\n"
+            f"def row_to_dict(row):\n{by_index}    {to_dict}\n\n"
+            f"def to_json(state):\n{by_key}    {to_json}\n"
+        )
+        namespace: Dict[str, Any] = {
+            "_encode_str": json.encoder.encode_basestring,  # type: ignore
+            "_int_repr": int.__repr__,
+            "_dumps": json.dumps,
+        }
+        exec(compile(source, f"<serializer {model.__name__}>", "exec"), namespace)
+        self._to_dict = namespace["to_dict"]
+        self._row_to_dict = namespace["row_to_dict"]
+        self._to_json = namespace["to_json"]
+
+    def dict(self, obj: "Base") -> Dict[str, Any]:
+        """
+        Convert an object to a dictionary.
+
+        Args:
+            obj (Base): The object.
+
+        Returns:
+            Dict[str, Any]: The dictionary representation of the object, without the
+                columns that are not loaded.
+
+        """
+        state = obj.__dict__
+        try:
+            return self._to_dict(state)  # type: ignore
+        except KeyError:
+            # Some columns are not loaded
+            return {
+                key: value.isoformat() if isinstance(value, datetime.datetime) else value
+                for key, value in ((key, state[key]) for key in self.keys if key in state)
+            }
+
+    def dicts(self, objs: Iterable["Base"]) -> List[Dict[str, Any]]:
+        """
+        Convert objects to dictionaries.
+
+        Args:
+            objs (Iterable[Base]): The objects.
+
+        Returns:
+            List[Dict[str, Any]]: The dictionary representations of the objects.
+
+        """
+        to_dict = self._to_dict
+        try:
+            return [to_dict(obj.__dict__) for obj in objs]
+        except KeyError:
+            return [self.dict(obj) for obj in objs]
+
+    def row_dicts(self, rows: Iterable[Sequence[Any]]) -> List[Dict[str, Any]]:
+        """
+        Convert rows selected in the order of `keys`, such as the rows returned by
+        `CRUDBase.get_multi_rows`, to dictionaries.
+
+        Args:
+            rows (Iterable[Sequence[Any]]): The rows.
+
+        Returns:
+            List[Dict[str, Any]]: The dictionary representations of the rows.
+
+        """
+        row_to_dict = self._row_to_dict
+        return [row_to_dict(row) for row in rows]
+
+    def json(self, obj: "Base") -> bytes:
+        """
+        Convert an object to JSON.
+
+        Args:
+            obj (Base): The object.
+
+        Returns:
+            bytes: The JSON representation of the object.
+
+        """
+        try:
+            return self._to_json(obj.__dict__)  # type: ignore
+        except KeyError:
+            return json.dumps(
+                self.dict(obj), separators=(",", ":"), ensure_ascii=False
+            ).encode("utf-8")
+
+
+_serializers: Dict[Tuple[type, Optional[Tuple[str, ...]]], ModelSerializer] = {}
+
+
 class Base(DeclarativeBase):
     """
     Base class for SQLAlchemy models. Inherits from the SQLAlchemy declarative base class
@@ -40,6 +199,26 @@ class Base(DeclarativeBase):
         "updated_at", server_default=func.now(), onupdate=func.now(), nullable=False
     )
 
+    @classmethod
+    def serializer(cls, fields: Optional[Tuple[str, ...]] = None) -> ModelSerializer:
+        """
+        Get the serializer of the model, building it on first use.
+
+        Args:
+            fields (Optional[Tuple[str, ...]]): Only serialize these columns. Defaults to all.
+
+        Returns:
+            ModelSerializer: The serializer.
+
+        Raises:
+            ValueError: If a field is not a column of the model.
+
+        """
+        serializer = _serializers.get((cls, fields))
+        if serializer is None:
+            serializer = _serializers[(cls, fields)] = ModelSerializer(cls, fields)
+        return serializer
+
     def dict(self) -> Dict[str, Any]:
         """
         Convert the object to a dictionary.
@@ -48,11 +227,7 @@ class Base(DeclarativeBase):
             Dict[str, Any]: The dictionary representation of the object.
 
         """
-        return {
-            k: v.isoformat() if isinstance(v, datetime.datetime) else v
-            for k, v in self.__dict__.items()
-            if not k.startswith("_")
-        }
+        return self.serializer().dict(self)
 
     def __repr__(self) -> str:
         """
@@ -62,7 +237,7 @@ class Base(DeclarativeBase):
             str: The JSON string representation of the object.
 
         """
-        return json.dumps(self.dict())
+        return self.serializer().json(self).decode("utf-8")
 
     # Generate __tablename__ automatically
     # pylint: disable=no-self-argument
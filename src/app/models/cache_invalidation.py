@@ -0,0 +1,28 @@
+from sqlalchemy import BigInteger, Integer, String
+from sqlalchemy.orm import Mapped, mapped_column
+
+from app.models.base import Base
+
+
+class CacheInvalidation(Base):
+    """
+    SQLAlchemy model for the cache invalidation outbox.
+
+    A row is written in the same transaction as the change that makes a cache tag stale,
+    and deleted once the tag has been invalidated in Redis.
+
+    Attributes:
+        id (Mapped[int]): The ID column, ordering the invalidations.
+        tag (Mapped[str]): The cache tag to invalidate.
+
+    """
+
+    id: Mapped[int] = mapped_column(
+        "id",
+        # SQLite only autoincrements INTEGER primary keys
+        BigInteger().with_variant(Integer, "sqlite"),
+        autoincrement=True,
+        nullable=False,
+        primary_key=True,
+    )
+    tag: Mapped[str] = mapped_column("tag", String(length=64), nullable=False)
@@ -1,7 +1,8 @@
-from sqlalchemy import String
+from sqlalchemy import BigInteger, Index, String
 from sqlalchemy.orm import Mapped, mapped_column
 
 from app.models.base import Base
+from app.util.snowflake import id_generator
 
 
 class User(Base):
@@ -9,12 +10,44 @@ class User(Base):
     SQLAlchemy model for the User table.
 
     Attributes:
-        id (Mapped[int]): The ID column for the User table.
+        id (Mapped[int]): The ID column for the User table, a Snowflake ID so that IDs are
+            unique across shards, within 53 bits so that JSON clients read it exactly.
         email (Mapped[str]): The email column for the User table.
 
     """
 
     id: Mapped[int] = mapped_column(
-        "id", autoincrement=True, nullable=False, unique=True, primary_key=True
+        "id",
+        BigInteger,
+        default=id_generator.next_id,
+        autoincrement=False,
+        nullable=False,
+        unique=True,
+        primary_key=True,
     )
     email: Mapped[str] = mapped_column("email", String(length=64), nullable=False)
+
+
+# Email search indexes: prefix matches use the pattern B-tree, substring matches the trigram GIN
+Index(
+    "ix_user_email_pattern",
+    User.email,
+    postgresql_ops={"email": "text_pattern_ops"},
+)
+Index(
+    "ix_user_email_trgm",
+    User.email,
+    postgresql_using="gin",
+    postgresql_ops={"email": "gin_trgm_ops"},
+).ddl_if(dialect="postgresql")
+
+# Change feed resume: keyset scans over (updated_at, id)
+Index("ix_user_updated_at_id", User.updated_at, User.id)
+
+# Time range queries: rows are appended in created_at order, so a tiny BRIN index of the
+# block ranges serves created_at ranges; updated_at ranges use ix_user_updated_at_id
+Index(
+    "ix_user_created_at_brin",
+    User.created_at,
+    postgresql_using="brin",
+).ddl_if(dialect="postgresql")
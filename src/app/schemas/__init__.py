@@ -1,3 +1,21 @@
-from .user import User, UserBase, UserCreate, UserInDB, UserUpdate  # noqa
+from .user import (  # noqa
+    User,
+    UserBase,
+    UserBatch,
+    UserBatchResponse,
+    UserBatchResult,
+    UserCreate,
+    UserInDB,
+    UserUpdate,
+)
 
-__all__ = ["User", "UserBase", "UserCreate", "UserUpdate", "UserInDB"]
+__all__ = [
+    "User",
+    "UserBase",
+    "UserCreate",
+    "UserUpdate",
+    "UserInDB",
+    "UserBatch",
+    "UserBatchResult",
+    "UserBatchResponse",
+]
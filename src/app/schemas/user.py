@@ -1,7 +1,9 @@
 from datetime import datetime
-from typing import Optional
+from typing import Annotated, List, Literal, Optional, Union
 
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
+
+from app.core.config import settings
 
 
 # Shared properties
@@ -54,3 +56,73 @@ class User(UserInDB):
     Pydantic model for returning user properties to the client.
 
     """
+
+
+# Operations accepted by the batch endpoint
+class UserBatchCreate(BaseModel):
+    """
+    Pydantic model for a batched user creation.
+
+    """
+
+    op: Literal["create"]
+    data: UserCreate
+
+
+class UserBatchUpdate(BaseModel):
+    """
+    Pydantic model for a batched user update.
+
+    """
+
+    op: Literal["update"]
+    id: int
+    data: UserUpdate
+
+
+class UserBatchDelete(BaseModel):
+    """
+    Pydantic model for a batched user deletion.
+
+    """
+
+    op: Literal["delete"]
+    id: int
+
+
+class UserBatch(BaseModel):
+    """
+    Pydantic model for a batch of user operations, applied in order in one transaction.
+
+    """
+
+    operations: List[
+        Annotated[
+            Union[UserBatchCreate, UserBatchUpdate, UserBatchDelete],
+            Field(discriminator="op"),
+        ]
+    ] = Field(..., min_items=1, max_items=settings.BATCH_MAX_OPERATIONS)
+    atomic: bool = True
+
+
+class UserBatchResult(BaseModel):
+    """
+    Pydantic model for the outcome of one batched operation.
+
+    """
+
+    op: str
+    id: Optional[int] = None
+    status: str
+    detail: Optional[str] = None
+    user: Optional[User] = None
+
+
+class UserBatchResponse(BaseModel):
+    """
+    Pydantic model for the outcome of a batch.
+
+    """
+
+    committed: bool
+    results: List[UserBatchResult]
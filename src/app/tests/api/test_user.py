@@ -0,0 +1,105 @@
+from typing import Any, AsyncIterator, List, Optional
+
+import httpx
+import pytest
+from fastapi import FastAPI
+
+from app import crud
+from app.api import deps
+from app.api.api_v1.endpoints import user
+from app.core.config import settings
+from app.db.session import DBSession, ShardRouter
+from app.util.bloom import user_ids
+from app.util.cache import MISSING, Cache
+from app.util.snowflake import id_generator
+
+pytestmark = pytest.mark.anyio
+
+
+async def no_ids() -> AsyncIterator[int]:
+    for id in []:
+        yield id
+
+
+@pytest.fixture
+async def client(
+    router: ShardRouter, cache: Cache, monkeypatch: pytest.MonkeyPatch
+) -> AsyncIterator[httpx.AsyncClient]:
+    # Invalidate right away instead of through the outbox drainer
+    monkeypatch.setattr(settings, "CACHE_OUTBOX_ENABLED", False)
+
+    async def get_db() -> AsyncIterator[DBSession]:
+        session = router.session()
+        try:
+            yield session
+        finally:
+            await session.close()
+
+    api = FastAPI()
+    api.include_router(user.router, prefix="/user")
+    api.dependency_overrides[deps.get_async_db_session] = get_db
+    api.dependency_overrides[deps.get_cache] = lambda: cache
+    transport = httpx.ASGITransport(app=api)  # type: ignore[arg-type]
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        yield client
+
+
+def reuse_id(monkeypatch: pytest.MonkeyPatch, id: int) -> None:
+    monkeypatch.setattr(id_generator, "next_id", lambda: id)
+
+
+async def test_create_clears_the_negative_entries_of_its_id(
+    client: httpx.AsyncClient, cache: Cache, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    for url in ["/user/42", "/user/42?fields=id"]:
+        assert (await client.get(url)).status_code == 404
+    assert await cache.get("user_get_42") is MISSING
+    assert (
+        0
+        < await cache.redis.ttl(crud.users.missing_tag(42))
+        <= settings.NEGATIVE_CACHE_TTL
+    )
+
+    reuse_id(monkeypatch, 42)
+    assert (await client.post("/user/", json={"email": "new@x.io"})).status_code == 200
+    assert (await client.get("/user/42")).json()["email"] == "new@x.io"
+    assert (await client.get("/user/42?fields=id")).json() == {"id": 42}
+
+
+async def test_batch_create_clears_the_negative_entries_of_its_ids(
+    client: httpx.AsyncClient, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    assert (await client.get("/user/7")).status_code == 404
+    reuse_id(monkeypatch, 7)
+    response = await client.post(
+        "/user/_batch",
+        json={"operations": [{"op": "create", "data": {"email": "new@x.io"}}]},
+    )
+    assert response.json()["results"][0]["id"] == 7
+    assert (await client.get("/user/7")).status_code == 200
+
+
+async def test_filter_has_new_ids_before_they_commit(
+    client: httpx.AsyncClient, cache: Cache, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    assert await user_ids.build(cache, no_ids())
+    create = crud.users.create
+    seen: List[Optional[bool]] = []
+
+    async def checked_create(db: DBSession, *, obj_in: Any, id: int) -> Any:
+        seen.append(await user_ids.might_contain(cache, id))
+        return await create(db, obj_in=obj_in, id=id)
+
+    monkeypatch.setattr(crud.users, "create", checked_create)
+    response = await client.post("/user/", json={"email": "new@x.io"})
+    assert seen == [True]
+    assert (await client.get(f"/user/{response.json()['id']}")).status_code == 200
+
+
+async def test_create_is_refused_without_a_worker_id(
+    client: httpx.AsyncClient, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setattr(id_generator, "worker_id", None)
+    response = await client.post("/user/", json={"email": "new@x.io"})
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "10"
@@ -0,0 +1,112 @@
+import os
+
+# The settings are read on import: the tests only need a Redis host name, they never
+# connect to it, and run against SQLite and fakeredis instead of Postgres and Redis.
+# Without Redis no worker ID is leased, so the tests use a fixed one
+os.environ.setdefault("REDIS_HOST", "localhost")
+os.environ.setdefault("SNOWFLAKE_WORKER_ID", "0")
+
+from pathlib import Path  # noqa: E402
+from typing import AsyncIterator, Iterator  # noqa: E402
+
+import pytest  # noqa: E402
+from fakeredis import FakeServer  # noqa: E402
+from fakeredis.aioredis import FakeRedis  # noqa: E402
+from sqlalchemy.ext.asyncio import AsyncSession  # noqa: E402
+
+import app.db.base  # noqa: E402,F401
+from app.db.session import ShardRouter  # noqa: E402
+from app.models.base import Base  # noqa: E402
+from app.util import cache as cache_module  # noqa: E402
+from app.util.cache import Cache, CircuitBreaker  # noqa: E402
+
+
+@pytest.fixture
+def anyio_backend() -> str:
+    return "asyncio"
+
+
+async def create_router(path: Path, shards: int = 1) -> ShardRouter:
+    """
+    Build a router over fresh SQLite databases, with every table created.
+
+    Args:
+        path (Path): The directory of the database files.
+        shards (int): The number of databases.
+
+    Returns:
+        ShardRouter: The router.
+
+    """
+    router = ShardRouter(
+        [
+            f"sqlite+aiosqlite:///{path / f'shard{index}.sqlite'}"
+            for index in range(shards)
+        ]
+    )
+    for engine in router.engines:
+        async with engine.begin() as connection:
+            await connection.run_sync(Base.metadata.create_all)
+    return router
+
+
+@pytest.fixture
+async def router(anyio_backend: str, tmp_path: Path) -> AsyncIterator[ShardRouter]:
+    """
+    A router over a single empty SQLite database.
+
+    """
+    router = await create_router(tmp_path)
+    yield router
+    await router.engines[0].dispose()
+
+
+@pytest.fixture
+async def db(router: ShardRouter) -> AsyncIterator[AsyncSession]:
+    """
+    A session on an empty SQLite database.
+
+    """
+    async with router.factories[0]() as session:
+        yield session
+
+
+@pytest.fixture
+async def shards(anyio_backend: str, tmp_path: Path) -> AsyncIterator[ShardRouter]:
+    """
+    A router over three empty SQLite databases.
+
+    """
+    router = await create_router(tmp_path, shards=3)
+    yield router
+    for engine in router.engines:
+        await engine.dispose()
+
+
+@pytest.fixture
+async def redis(anyio_backend: str) -> AsyncIterator[FakeRedis]:
+    """
+    A client of an empty in-process Redis server.
+
+    """
+    redis = FakeRedis(server=FakeServer())
+    yield redis
+    await redis.aclose()
+
+
+@pytest.fixture
+def breaker() -> CircuitBreaker:
+    return CircuitBreaker(failure_threshold=3, reset_timeout=30.0)
+
+
+@pytest.fixture
+def cache(redis: FakeRedis, breaker: CircuitBreaker) -> Iterator[Cache]:
+    """
+    A cache on the fake Redis, with its own circuit breaker.
+
+    """
+    cache_module.pending_invalidations.clear()
+    cache_module.invalidation_lag.clear()
+    yield Cache(redis, breaker=breaker)
+    cache_module.pending_invalidations.clear()
+    cache_module.invalidation_lag.clear()
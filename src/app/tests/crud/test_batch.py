@@ -0,0 +1,75 @@
+from typing import List
+
+import pytest
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import crud
+from app.crud.base import BatchOperation
+from app.models.user import User
+from app.schemas.user import UserCreate, UserUpdate
+
+pytestmark = pytest.mark.anyio
+
+
+async def create_users(db: AsyncSession, emails: List[str]) -> List[User]:
+    return [
+        await crud.users.create(db, obj_in=UserCreate(email=email)) for email in emails
+    ]
+
+
+async def emails(db: AsyncSession) -> List[str]:
+    return [user.email for user in await crud.users.get_multi(db, order_by=["email"])]
+
+
+async def test_atomic_batch_commits_every_operation(db: AsyncSession) -> None:
+    (user,) = await create_users(db, ["old@x.io"])
+    results = await crud.users.batch(
+        db,
+        [
+            BatchOperation("create", obj_in=UserCreate(email="new@x.io")),
+            BatchOperation("update", user.id, UserUpdate(email="changed@x.io")),
+        ],
+    )
+    assert [result.status for result in results] == ["ok", "ok"]
+    assert results[0].id == results[0].obj.id
+    assert await emails(db) == ["changed@x.io", "new@x.io"]
+
+
+async def test_atomic_batch_rolls_back_on_failure(db: AsyncSession) -> None:
+    (user,) = await create_users(db, ["old@x.io"])
+    results = await crud.users.batch(
+        db,
+        [
+            BatchOperation("create", obj_in=UserCreate(email="new@x.io")),
+            BatchOperation("delete", user.id),
+            BatchOperation("delete", 1),
+            BatchOperation("create", obj_in=UserCreate(email="late@x.io")),
+        ],
+    )
+    assert [result.status for result in results] == [
+        "rolled_back",
+        "rolled_back",
+        "not_found",
+        "skipped",
+    ]
+    # Rolled back creates still report the ID they were given
+    assert results[0].id is not None and results[3].id is not None
+    assert await emails(db) == ["old@x.io"]
+
+
+async def test_savepoint_batch_only_undoes_failed_operations(db: AsyncSession) -> None:
+    (user,) = await create_users(db, ["old@x.io"])
+    results = await crud.users.batch(
+        db,
+        [
+            BatchOperation("create", obj_in=UserCreate(email="new@x.io")),
+            # Reusing an existing primary key fails on flush
+            BatchOperation("create", user.id, UserCreate(email="dup@x.io")),
+            BatchOperation("delete", 1),
+            BatchOperation("update", user.id, UserUpdate(email="changed@x.io")),
+        ],
+        atomic=False,
+    )
+    assert [result.status for result in results] == ["ok", "failed", "not_found", "ok"]
+    assert results[1].detail == "IntegrityError"
+    assert await emails(db) == ["changed@x.io", "new@x.io"]
@@ -0,0 +1,103 @@
+import datetime
+from typing import List
+
+import pytest
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import crud
+from app.crud.base import escape_like
+from app.models.user import User
+from app.schemas.user import UserCreate
+
+pytestmark = pytest.mark.anyio
+
+EMAILS = ["a_b@x.io", "axb@x.io", "50%@x.io", "500@x.io", "back\\slash@x.io", "bob@y.io"]
+
+
+async def create_users(db: AsyncSession, emails: List[str]) -> List[User]:
+    return [
+        await crud.users.create(db, obj_in=UserCreate(email=email)) for email in emails
+    ]
+
+
+async def search(db: AsyncSession, **kwargs: str) -> List[str]:
+    users = await crud.users.get_multi(
+        db, filters=crud.users.search_filters(**kwargs), order_by=["email"]
+    )
+    return [user.email for user in users]
+
+
+def test_escape_like() -> None:
+    assert escape_like("plain") == "plain"
+    assert escape_like("a_b%c") == "a\\_b\\%c"
+    assert escape_like("back\\slash") == "back\\\\slash"
+
+
+def test_search_filters_only_when_requested() -> None:
+    assert crud.users.search_filters() == []
+    assert len(crud.users.search_filters(email_prefix="a", email_contains="b")) == 2
+
+
+async def test_search_by_prefix(db: AsyncSession) -> None:
+    await create_users(db, EMAILS)
+    assert await search(db, email_prefix="b") == ["back\\slash@x.io", "bob@y.io"]
+    assert await search(db, email_prefix="bo") == ["bob@y.io"]
+    assert await search(db, email_prefix="x") == []
+
+
+async def test_search_treats_wildcards_literally(db: AsyncSession) -> None:
+    await create_users(db, EMAILS)
+    assert await search(db, email_prefix="a_") == ["a_b@x.io"]
+    assert await search(db, email_contains="0%") == ["50%@x.io"]
+    assert await search(db, email_contains="k\\s") == ["back\\slash@x.io"]
+    assert await search(db, email_contains="%") == ["50%@x.io"]
+
+
+async def test_search_combines_prefix_and_substring(db: AsyncSession) -> None:
+    await create_users(db, EMAILS)
+    assert await search(db, email_prefix="a", email_contains="@x") == [
+        "a_b@x.io",
+        "axb@x.io",
+    ]
+
+
+async def test_keyset_pages_cover_every_row_once(db: AsyncSession) -> None:
+    # Duplicate emails, so that the pages are told apart by the ID tie breaker
+    await create_users(db, [f"user{i % 4}@x.io" for i in range(10)])
+    expected = await crud.users.get_multi(db, limit=100, order_by=["email", "id"])
+    seen: List[User] = []
+    filters = []
+    while True:
+        page = await crud.users.get_multi(
+            db, limit=3, filters=filters, order_by=["email", "id"]
+        )
+        if not page:
+            break
+        seen.extend(page)
+        filters = [crud.users.keyset_filter("email", (page[-1].email, page[-1].id))]
+    assert [user.id for user in seen] == [user.id for user in expected]
+
+
+async def test_keyset_pages_by_id(db: AsyncSession) -> None:
+    users = await create_users(db, [f"user{i}@x.io" for i in range(5)])
+    page = await crud.users.get_multi(
+        db, filters=[crud.users.keyset_filter("id", (None, users[1].id))]
+    )
+    assert [user.id for user in page] == [user.id for user in users[2:]]
+
+
+async def test_range_filters_are_half_open(db: AsyncSession) -> None:
+    users = await create_users(db, [f"user{i}@x.io" for i in range(4)])
+    start = datetime.datetime(2024, 1, 1)
+    for day, user in enumerate(users):
+        await crud.users.update(
+            db, id=user.id, obj_in={"created_at": start + datetime.timedelta(days=day)}
+        )
+    filters = crud.users.range_filter(
+        "created_at",
+        start + datetime.timedelta(days=1),
+        start + datetime.timedelta(days=3),
+    )
+    page = await crud.users.get_multi(db, filters=filters)
+    assert [user.id for user in page] == [users[1].id, users[2].id]
+    assert crud.users.range_filter("created_at") == []
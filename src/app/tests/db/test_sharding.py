@@ -0,0 +1,172 @@
+import random
+from collections import Counter
+from typing import Dict, List
+
+import pytest
+from sqlalchemy import select
+
+from app import crud
+from app.crud.base import BatchOperation
+from app.db.session import ShardedSession, ShardRouter, async_session_factory, jump_hash
+from app.models.user import User
+from app.schemas.user import UserCreate, UserUpdate
+
+
+def keys(count: int) -> List[int]:
+    generator = random.Random(41)
+    return [generator.getrandbits(53) for _ in range(count)]
+
+
+def test_jump_hash_is_stable_and_in_range() -> None:
+    for key in keys(1_000):
+        bucket = jump_hash(key, 7)
+        assert 0 <= bucket < 7
+        assert jump_hash(key, 7) == bucket
+    assert {jump_hash(key, 1) for key in keys(100)} == {0}
+
+
+def test_jump_hash_spreads_keys_evenly() -> None:
+    counts = Counter(jump_hash(key, 4) for key in keys(40_000))
+    assert sorted(counts) == [0, 1, 2, 3]
+    assert all(9_000 < count < 11_000 for count in counts.values())
+
+
+@pytest.mark.parametrize("buckets", [1, 2, 3, 9])
+def test_adding_a_shard_only_moves_keys_to_it(buckets: int) -> None:
+    moved = [
+        key
+        for key in keys(20_000)
+        if jump_hash(key, buckets) != jump_hash(key, buckets + 1)
+    ]
+    assert all(jump_hash(key, buckets + 1) == buckets for key in moved)
+    assert len(moved) == pytest.approx(20_000 / (buckets + 1), rel=0.1)
+
+
+def test_single_database_gets_plain_sessions() -> None:
+    router = ShardRouter.single(async_session_factory)
+    assert not router.sharded
+    assert not isinstance(router.session(), ShardedSession)
+    assert router.shard_for(12345) == 0
+
+
+async def ids_per_shard(router: ShardRouter) -> List[List[int]]:
+    ids = []
+    for factory in router.factories:
+        async with factory() as session:
+            ids.append(list(await session.scalars(select(User.id).order_by(User.id))))
+    return ids
+
+
+async def create_users(router: ShardRouter, count: int) -> List[User]:
+    return [
+        await crud.users.create(
+            router.session(), obj_in=UserCreate(email=f"u{i % 7}@x.io")
+        )
+        for i in range(count)
+    ]
+
+
+@pytest.mark.anyio
+async def test_rows_are_stored_in_their_shard(shards: ShardRouter) -> None:
+    users = await create_users(shards, 30)
+    stored = await ids_per_shard(shards)
+    expected: Dict[int, List[int]] = {index: [] for index in range(3)}
+    for user in users:
+        expected[shards.shard_for(user.id)].append(user.id)
+    assert stored == [sorted(expected[index]) for index in range(3)]
+    # With 30 users every shard gets some
+    assert all(stored)
+    for user in users[:5]:
+        assert (await crud.users.get(shards.session(), user.id)).email == user.email
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize("skip,limit", [(0, 100), (0, 5), (7, 6), (25, 10), (40, 5)])
+async def test_fan_out_pages_match_a_single_database(
+    shards: ShardRouter, skip: int, limit: int
+) -> None:
+    users = await create_users(shards, 30)
+    end = skip + limit
+    by_id = sorted(user.id for user in users)
+    page = await crud.users.get_multi(shards.session(), skip=skip, limit=limit)
+    assert [user.id for user in page] == by_id[skip:end]
+
+    by_email = [user.id for user in sorted(users, key=lambda user: (user.email, user.id))]
+    page = await crud.users.get_multi(
+        shards.session(), skip=skip, limit=limit, order_by=["email", "id"]
+    )
+    assert [user.id for user in page] == by_email[skip:end]
+
+
+@pytest.mark.anyio
+async def test_fan_out_rows_merge_by_columns_left_out(shards: ShardRouter) -> None:
+    users = await create_users(shards, 30)
+    by_email = [user.id for user in sorted(users, key=lambda user: (user.email, user.id))]
+    rows = await crud.users.get_multi_rows(
+        shards.session(), skip=4, limit=8, fields=("id",), order_by=["email", "id"]
+    )
+    assert [row.id for row in rows] == by_email[4:12]
+
+
+@pytest.mark.anyio
+async def test_fan_out_applies_filters_on_every_shard(shards: ShardRouter) -> None:
+    users = await create_users(shards, 30)
+    expected = sorted(user.id for user in users if user.email == "u3@x.io")
+    page = await crud.users.get_multi(
+        shards.session(), filters=crud.users.search_filters(email_prefix="u3")
+    )
+    assert [user.id for user in page] == expected
+
+
+@pytest.mark.anyio
+async def test_atomic_batch_commits_on_every_shard(shards: ShardRouter) -> None:
+    existing = await create_users(shards, 6)
+    operations = [
+        BatchOperation("create", obj_in=UserCreate(email=f"new{i}@x.io"))
+        for i in range(9)
+    ]
+    operations.append(
+        BatchOperation("update", existing[0].id, UserUpdate(email="up@x.io"))
+    )
+    operations.append(BatchOperation("delete", existing[1].id))
+    results = await crud.users.batch(shards.session(), operations)
+    assert {result.status for result in results} == {"ok"}
+    created = [result.id for result in results[:9]]
+    assert len({shards.shard_for(id) for id in created}) > 1
+    stored = await ids_per_shard(shards)
+    for id in created:
+        assert id in stored[shards.shard_for(id)]
+    assert existing[1].id not in stored[shards.shard_for(existing[1].id)]
+    assert (await crud.users.get(shards.session(), existing[0].id)).email == "up@x.io"
+
+
+@pytest.mark.anyio
+async def test_atomic_batch_rolls_back_every_shard(shards: ShardRouter) -> None:
+    existing = await create_users(shards, 6)
+    before = await ids_per_shard(shards)
+    operations = [
+        BatchOperation("create", obj_in=UserCreate(email=f"new{i}@x.io"))
+        for i in range(9)
+    ]
+    operations.append(BatchOperation("delete", existing[2].id))
+    operations.append(BatchOperation("update", 1, UserUpdate(email="gone@x.io")))
+    results = await crud.users.batch(shards.session(), operations)
+    assert [result.status for result in results] == ["rolled_back"] * 10 + ["not_found"]
+    assert await ids_per_shard(shards) == before
+
+
+@pytest.mark.anyio
+async def test_savepoint_batch_keeps_other_shards(shards: ShardRouter) -> None:
+    (existing,) = await create_users(shards, 1)
+    operations = [
+        BatchOperation("create", obj_in=UserCreate(email=f"new{i}@x.io"))
+        for i in range(6)
+    ]
+    operations.insert(
+        3, BatchOperation("create", existing.id, UserCreate(email="dup@x.io"))
+    )
+    results = await crud.users.batch(shards.session(), operations, atomic=False)
+    assert [result.status for result in results] == ["ok"] * 3 + ["failed"] + ["ok"] * 3
+    stored = sorted(id for ids in await ids_per_shard(shards) for id in ids)
+    created = [result.id for result in results if result.status == "ok"]
+    assert stored == sorted([existing.id, *created])
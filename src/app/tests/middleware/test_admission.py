@@ -0,0 +1,131 @@
+import asyncio
+from typing import Any, AsyncIterator, Dict
+
+import httpx
+import pytest
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.responses import PlainTextResponse
+from starlette.routing import Route
+
+from app.middleware.admission import (
+    AdmissionController,
+    AdmissionControlMiddleware,
+    AdmissionGate,
+)
+
+pytestmark = pytest.mark.anyio
+
+
+def scope(method: str, path: str) -> Dict[str, Any]:
+    return {"type": "http", "method": method, "path": path}
+
+
+async def test_full_gate_sheds_right_away() -> None:
+    gate = AdmissionGate("write", limit=1, queue_size=0, queue_timeout=10)
+    assert await gate.acquire()
+    assert not await gate.acquire()
+    assert gate.stats() == {
+        "limit": 1,
+        "queue_size": 0,
+        "active": 1,
+        "waiting": 0,
+        "admitted": 1,
+        "shed": 1,
+    }
+    gate.release()
+    assert await gate.acquire()
+
+
+async def test_queued_request_gets_released_slot() -> None:
+    gate = AdmissionGate("read", limit=1, queue_size=1, queue_timeout=10)
+    assert await gate.acquire()
+    waiter = asyncio.create_task(gate.acquire())
+    await asyncio.sleep(0)
+    assert gate.waiting == 1
+    # The queue is full
+    assert not await gate.acquire()
+    gate.release()
+    assert await waiter
+    assert gate.stats()["active"] == 1 and gate.shed == 1
+
+
+async def test_queued_request_is_shed_after_timeout() -> None:
+    gate = AdmissionGate("read", limit=1, queue_size=1, queue_timeout=0.01)
+    assert await gate.acquire()
+    assert not await gate.acquire()
+    assert gate.waiting == 0 and gate.shed == 1
+
+
+def test_classify() -> None:
+    controller = AdmissionController(
+        gates={},
+        health_prefix="/health",
+        exempt_paths=["/health/_alive"],
+        retry_after=1,
+        stream_paths=["/changes"],
+    )
+    assert controller.classify(scope("GET", "/health/_ready")) == "health"
+    assert controller.classify(scope("GET", "/changes")) == "stream"
+    assert controller.classify(scope("HEAD", "/items")) == "read"
+    assert controller.classify(scope("PATCH", "/items")) == "write"
+    assert controller.gate_for(scope("GET", "/health/_alive")) is None
+
+
+@pytest.fixture
+def controller() -> AdmissionController:
+    return AdmissionController(
+        gates={
+            "write": AdmissionGate("write", limit=1, queue_size=0, queue_timeout=1),
+            "read": AdmissionGate("read", limit=1, queue_size=0, queue_timeout=1),
+        },
+        health_prefix="/health",
+        exempt_paths=["/health/_alive"],
+        retry_after=3,
+    )
+
+
+@pytest.fixture
+def release(anyio_backend: str) -> asyncio.Event:
+    return asyncio.Event()
+
+
+@pytest.fixture
+async def client(
+    controller: AdmissionController, release: asyncio.Event
+) -> AsyncIterator[httpx.AsyncClient]:
+    async def slow(request: Any) -> PlainTextResponse:
+        await release.wait()
+        return PlainTextResponse("slow")
+
+    async def ok(request: Any) -> PlainTextResponse:
+        return PlainTextResponse("ok")
+
+    app = Starlette(
+        routes=[
+            Route("/slow", slow, methods=["POST"]),
+            Route("/items", ok, methods=["GET", "POST"]),
+            Route("/health/_alive", ok),
+        ],
+        middleware=[Middleware(AdmissionControlMiddleware, controller=controller)],
+    )
+    transport = httpx.ASGITransport(app=app)  # type: ignore[arg-type]
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        yield client
+
+
+async def test_middleware_sheds_saturated_class(
+    client: httpx.AsyncClient, controller: AdmissionController, release: asyncio.Event
+) -> None:
+    slow = asyncio.create_task(client.post("/slow"))
+    while not controller.gates["write"].active:
+        await asyncio.sleep(0)
+    response = await client.post("/items")
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "3"
+    # Other classes and exempt paths are still served
+    assert (await client.get("/items")).status_code == 200
+    assert (await client.get("/health/_alive")).status_code == 200
+    release.set()
+    assert (await slow).status_code == 200
+    assert (await client.post("/items")).status_code == 200
@@ -0,0 +1,161 @@
+import asyncio
+from typing import Any, AsyncIterator, Dict, List
+
+import httpx
+import pytest
+from fastapi import Depends, FastAPI
+from sqlalchemy import event, text
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.types import Message
+
+from app.core import deadline
+from app.db.session import ShardRouter
+from app.middleware.deadline import DeadlineMiddleware
+
+pytestmark = pytest.mark.anyio
+
+
+class Probe:
+    """
+    Records what happened to the requests of the test app.
+
+    """
+
+    def __init__(self) -> None:
+        self.events: List[str] = []
+        self.started = asyncio.Event()
+
+
+class Connections:
+    """
+    Counts the connections of an engine checked out of its pool.
+
+    """
+
+    def __init__(self, router: ShardRouter) -> None:
+        self.checked_out = 0
+        engine = router.engines[0].sync_engine
+        event.listen(engine, "checkout", self._checkout)
+        event.listen(engine, "checkin", self._checkin)
+
+    def _checkout(self, *args: Any) -> None:
+        self.checked_out += 1
+
+    def _checkin(self, *args: Any) -> None:
+        self.checked_out -= 1
+
+
+@pytest.fixture
+def probe(anyio_backend: str) -> Probe:
+    return Probe()
+
+
+@pytest.fixture
+def connections(router: ShardRouter) -> Connections:
+    return Connections(router)
+
+
+@pytest.fixture
+def app(router: ShardRouter, probe: Probe) -> DeadlineMiddleware:
+    async def get_db() -> AsyncIterator[AsyncSession]:
+        session = router.factories[0]()
+        try:
+            yield session
+        finally:
+            # Give a late cancellation a chance to hit the teardown
+            await asyncio.sleep(0.01)
+            await session.close()
+            probe.events.append("closed")
+
+    api = FastAPI()
+
+    @api.get("/fast")
+    async def fast(db: AsyncSession = Depends(get_db)) -> Dict[str, Any]:
+        await db.execute(text("SELECT 1"))
+        return {"remaining": deadline.remaining()}
+
+    @api.get("/slow")
+    async def slow(db: AsyncSession = Depends(get_db)) -> None:
+        await db.execute(text("SELECT 1"))
+        probe.started.set()
+        try:
+            await asyncio.sleep(60)
+        except asyncio.CancelledError:
+            probe.events.append("cancelled")
+            raise
+
+    return DeadlineMiddleware(api, timeout=0.5, exempt_paths=["/stream"])
+
+
+@pytest.fixture
+async def client(app: DeadlineMiddleware) -> AsyncIterator[httpx.AsyncClient]:
+    transport = httpx.ASGITransport(app=app)  # type: ignore[arg-type]
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        yield client
+
+
+async def test_handler_sees_its_deadline(client: httpx.AsyncClient) -> None:
+    response = await client.get("/fast")
+    assert response.status_code == 200
+    assert 0 < response.json()["remaining"] <= 0.5
+    assert deadline.remaining() is None
+
+
+async def test_teardown_finishes_after_the_response(
+    client: httpx.AsyncClient, connections: Connections, probe: Probe
+) -> None:
+    # The client disconnects once it has the whole response, while the session is closing
+    for _ in range(3):
+        assert (await client.get("/fast")).status_code == 200
+    assert probe.events == ["closed"] * 3
+    assert connections.checked_out == 0
+
+
+async def test_deadline_answers_504_and_releases_the_connection(
+    client: httpx.AsyncClient, connections: Connections, probe: Probe
+) -> None:
+    response = await client.get("/slow")
+    assert response.status_code == 504
+    assert probe.events == ["cancelled", "closed"]
+    assert connections.checked_out == 0
+
+
+async def test_disconnect_cancels_the_handler(
+    app: DeadlineMiddleware, connections: Connections, probe: Probe
+) -> None:
+    disconnected = asyncio.Event()
+    requests: List[Message] = [{"type": "http.request", "body": b"", "more_body": False}]
+    sent: List[Message] = []
+
+    async def receive() -> Message:
+        if requests:
+            return requests.pop()
+        await disconnected.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message: Message) -> None:
+        sent.append(message)
+
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": "/slow",
+        "raw_path": b"/slow",
+        "root_path": "",
+        "query_string": b"",
+        "headers": [],
+        "client": ("127.0.0.1", 1234),
+        "server": ("test", 80),
+    }
+    request = asyncio.create_task(app(scope, receive, send))
+    await probe.started.wait()
+    assert connections.checked_out == 1
+    disconnected.set()
+    await asyncio.wait_for(request, 1)
+    assert probe.events == ["cancelled", "closed"]
+    assert connections.checked_out == 0
+    # Nobody is listening anymore, so no response is sent
+    assert sent == []
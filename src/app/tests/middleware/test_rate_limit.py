@@ -0,0 +1,143 @@
+import functools
+import hashlib
+from typing import Any, AsyncIterator, Dict
+
+import httpx
+import pytest
+from fakeredis import FakeServer
+from fakeredis.aioredis import FakeRedis
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.responses import PlainTextResponse
+from starlette.routing import Route
+
+from app.middleware import rate_limit
+from app.middleware.rate_limit import (
+    TOKEN_BUCKET_SCRIPT,
+    LocalTokenBuckets,
+    RateLimit,
+    RateLimiter,
+    RateLimitMiddleware,
+)
+from app.util.cache import Cache, CircuitBreaker
+
+API_KEY = "secret-key"
+
+
+def scope(method: str = "GET", path: str = "/api/v1/user/1", **headers: str) -> Dict:
+    return {
+        "type": "http",
+        "method": method,
+        "path": path,
+        "headers": [
+            (k.replace("_", "-").encode(), v.encode()) for k, v in headers.items()
+        ],
+        "client": ("10.0.0.1", 1234),
+    }
+
+
+@pytest.fixture
+def limiter(
+    monkeypatch: pytest.MonkeyPatch, redis: FakeRedis, breaker: CircuitBreaker
+) -> RateLimiter:
+    # Keep the worker's circuit breaker out of the tests
+    monkeypatch.setattr(rate_limit, "Cache", functools.partial(Cache, breaker=breaker))
+    limiter = RateLimiter(
+        limits={"read": RateLimit(1.0, 3), "write": RateLimit(1.0, 1)},
+        routes={"* /health/*": "", "GET /api/*": "read", "* /api/*": "write"},
+        key_header="X-API-Key",
+        fallback_size=2,
+        api_keys=[hashlib.sha256(API_KEY.encode()).hexdigest().upper()],
+    )
+    limiter._redis = redis
+    limiter._script = redis.register_script(TOKEN_BUCKET_SCRIPT)
+    return limiter
+
+
+def test_classify(limiter: RateLimiter) -> None:
+    assert limiter.classify(scope()) == "read"
+    assert limiter.classify(scope("DELETE")) == "write"
+    # Matched by a pattern of no class, or by no pattern at all
+    assert limiter.classify(scope(path="/health/_ready")) is None
+    assert limiter.classify(scope(path="/docs")) is None
+
+
+def test_client_is_only_identified_by_known_keys(limiter: RateLimiter) -> None:
+    known = limiter.client(scope(x_api_key=API_KEY))
+    assert known.startswith("key:") and API_KEY not in known
+    assert limiter.client(scope(x_api_key="made-up")) == "ip:10.0.0.1"
+    assert limiter.client(scope()) == "ip:10.0.0.1"
+    assert limiter.unknown_keys == 1
+
+
+@pytest.mark.anyio
+async def test_bucket_empties_after_burst(limiter: RateLimiter) -> None:
+    decisions = [(await limiter.check(scope()))[1] for _ in range(4)]
+    assert [d.allowed for d in decisions] == [True, True, True, False]
+    assert [d.remaining for d in decisions[:3]] == [2, 1, 0]
+    assert 0 < decisions[3].retry_after <= 1
+    assert limiter.limited == {"read": 1, "write": 0}
+    assert limiter.fallbacks == 0
+
+
+@pytest.mark.anyio
+async def test_buckets_per_client_and_class(limiter: RateLimiter) -> None:
+    assert (await limiter.check(scope("POST")))[1].allowed
+    assert not (await limiter.check(scope("POST")))[1].allowed
+    assert (await limiter.check(scope("POST", x_api_key=API_KEY)))[1].allowed
+    assert (await limiter.check(scope("GET")))[1].allowed
+
+
+@pytest.mark.anyio
+async def test_unlimited_requests_take_no_token(limiter: RateLimiter) -> None:
+    assert await limiter.check(scope(path="/health/_ready")) == (None, None)
+    assert await limiter._redis.keys() == []
+
+
+@pytest.mark.anyio
+async def test_falls_back_to_local_buckets(limiter: RateLimiter) -> None:
+    server = FakeServer()
+    server.connected = False
+    limiter._redis = FakeRedis(server=server)
+    limiter._script = limiter._redis.register_script(TOKEN_BUCKET_SCRIPT)
+    decisions = [(await limiter.check(scope("POST")))[1] for _ in range(2)]
+    assert [d.allowed for d in decisions] == [True, False]
+    assert limiter.fallbacks == 2
+
+
+def test_local_buckets_refill_and_evict(monkeypatch: pytest.MonkeyPatch) -> None:
+    now = [100.0]
+    monkeypatch.setattr(rate_limit.time, "monotonic", lambda: now[0])
+    buckets = LocalTokenBuckets(max_buckets=2)
+    limit = RateLimit(2.0, 1)
+    assert buckets.acquire("a", limit).allowed
+    decision = buckets.acquire("a", limit)
+    assert not decision.allowed and decision.retry_after == pytest.approx(0.5)
+    now[0] += 0.5
+    assert buckets.acquire("a", limit).allowed
+    buckets.acquire("b", limit)
+    buckets.acquire("c", limit)
+    assert list(buckets._buckets) == ["b", "c"]
+
+
+@pytest.fixture
+async def client(limiter: RateLimiter) -> AsyncIterator[httpx.AsyncClient]:
+    async def ok(request: Any) -> PlainTextResponse:
+        return PlainTextResponse("ok")
+
+    app = Starlette(
+        routes=[Route("/api/items", ok, methods=["GET", "POST"])],
+        middleware=[Middleware(RateLimitMiddleware, limiter=limiter)],
+    )
+    transport = httpx.ASGITransport(app=app)  # type: ignore[arg-type]
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        yield client
+
+
+@pytest.mark.anyio
+async def test_middleware_rejects_with_retry_after(client: httpx.AsyncClient) -> None:
+    assert (await client.post("/api/items")).status_code == 200
+    response = await client.post("/api/items")
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == "1"
+    assert (await client.get("/api/items")).status_code == 200
@@ -0,0 +1,92 @@
+from typing import AsyncIterator, Iterable
+
+import pytest
+
+from app.util.bloom import RedisBloomFilter
+from app.util.cache import Cache
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+def bloom() -> RedisBloomFilter:
+    return RedisBloomFilter("test_bloom", capacity=1_000, error_rate=0.01)
+
+
+async def members(values: Iterable[int]) -> AsyncIterator[int]:
+    for value in values:
+        yield value
+
+
+def open_breaker(cache: Cache) -> None:
+    for _ in range(cache.breaker.failure_threshold):
+        cache.breaker.record_failure()
+
+
+async def test_unbuilt_filter_cannot_tell(cache: Cache, bloom: RedisBloomFilter) -> None:
+    await bloom.add(cache, [1])
+    assert await bloom.is_built(cache) is False
+    assert await bloom.might_contain(cache, 1) is None
+    assert await bloom.might_contain(cache, 2) is None
+
+
+async def test_built_filter_never_misses_a_member(
+    cache: Cache, bloom: RedisBloomFilter
+) -> None:
+    assert await bloom.build(cache, members(range(500)), batch_size=64)
+    await bloom.add(cache, [10_000])
+    assert await bloom.is_built(cache)
+    assert all([await bloom.might_contain(cache, id) for id in [*range(500), 10_000]])
+    absent = [await bloom.might_contain(cache, id) for id in range(20_000, 21_000)]
+    assert absent.count(True) < 50
+
+
+async def test_build_is_skipped_while_another_worker_builds(
+    cache: Cache, bloom: RedisBloomFilter
+) -> None:
+    await cache.redis.set(f"{bloom.key}:building", 1)
+    assert not await bloom.build(cache, members(range(10)))
+    assert await bloom.is_built(cache) is False
+
+
+async def test_failed_addition_resets_the_filter(
+    cache: Cache, bloom: RedisBloomFilter
+) -> None:
+    await bloom.build(cache, members(range(10)))
+    open_breaker(cache)
+    await bloom.add(cache, [42])
+    assert bloom.stale
+    cache.breaker.record_success()
+    # The worker that lost the addition resets the filter before trusting it again
+    assert await bloom.might_contain(cache, 42) is None
+    assert not bloom.stale
+    assert await bloom.is_built(cache) is False
+    assert await bloom.build(cache, members([*range(10), 42]))
+    assert await bloom.might_contain(cache, 42)
+
+
+async def test_reset_during_build_leaves_filter_unbuilt(
+    cache: Cache, bloom: RedisBloomFilter
+) -> None:
+    async def reset_midway() -> AsyncIterator[int]:
+        yield 1
+        await bloom.reset(cache)
+        yield 2
+
+    assert not await bloom.build(cache, reset_midway())
+    assert await bloom.is_built(cache) is False
+    assert not await cache.redis.exists(f"{bloom.key}:building")
+
+
+async def test_build_fails_when_redis_goes_away(
+    cache: Cache, bloom: RedisBloomFilter
+) -> None:
+    async def redis_goes_away() -> AsyncIterator[int]:
+        yield 1
+        open_breaker(cache)
+        yield 2
+
+    with pytest.raises(RuntimeError):
+        await bloom.build(cache, redis_goes_away(), batch_size=1)
+    cache.breaker.record_success()
+    assert await bloom.is_built(cache) is False
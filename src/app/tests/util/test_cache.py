@@ -0,0 +1,139 @@
+import asyncio
+from typing import Any
+
+import pytest
+from fakeredis.aioredis import FakeRedis
+from redis.exceptions import ConnectionError
+
+from app.util import cache as cache_module
+from app.util.cache import MISSING, Cache, CircuitBreaker
+from app.util.codec import CacheSerializer, MsgpackCodec
+
+
+class Clock:
+    """
+    Stand-in for `time.monotonic`, moved forward by hand.
+
+    """
+
+    def __init__(self) -> None:
+        self.now = 1_000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch: pytest.MonkeyPatch) -> Clock:
+    clock = Clock()
+    monkeypatch.setattr(cache_module.time, "monotonic", clock)
+    return clock
+
+
+async def fail() -> Any:
+    raise ConnectionError("Redis is down")
+
+
+def test_breaker_opens_after_consecutive_failures(breaker: CircuitBreaker) -> None:
+    for _ in range(breaker.failure_threshold - 1):
+        breaker.record_failure()
+    breaker.record_success()
+    for _ in range(breaker.failure_threshold - 1):
+        breaker.record_failure()
+    assert breaker.state == "closed" and breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert not breaker.allow()
+
+
+def test_breaker_probes_once_after_reset_timeout(
+    breaker: CircuitBreaker, clock: Clock
+) -> None:
+    for _ in range(breaker.failure_threshold):
+        breaker.record_failure()
+    clock.now += breaker.reset_timeout - 1
+    assert not breaker.allow()
+    clock.now += 1
+    assert breaker.allow()
+    assert breaker.state == "half_open"
+    # Only one probe at a time
+    assert not breaker.allow()
+    breaker.record_success()
+    assert breaker.state == "closed" and breaker.allow()
+
+
+def test_breaker_reopens_when_probe_fails(breaker: CircuitBreaker, clock: Clock) -> None:
+    for _ in range(breaker.failure_threshold):
+        breaker.record_failure()
+    clock.now += breaker.reset_timeout
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open"
+    clock.now += breaker.reset_timeout - 1
+    assert not breaker.allow()
+
+
+@pytest.mark.anyio
+async def test_call_records_failures_and_timeouts(cache: Cache) -> None:
+    cache.timeout = 0.01
+    assert await cache.call(fail) == (False, None)
+    assert await cache.call(lambda: asyncio.sleep(1)) == (False, None)
+    assert cache.breaker.failures == 2
+    assert await cache.call(lambda: cache.redis.ping()) == (True, True)
+    assert cache.breaker.failures == 0
+
+
+@pytest.mark.anyio
+async def test_open_breaker_skips_redis(cache: Cache) -> None:
+    for _ in range(cache.breaker.failure_threshold):
+        await cache.call(fail)
+    await cache.set("key", {"id": 1})
+    assert await cache.redis.get("key") is None
+    assert await cache.get("key") is None
+
+
+@pytest.mark.anyio
+async def test_set_get_and_invalidate(cache: Cache) -> None:
+    await cache.set("user:1", {"id": 1}, tag="user_get")
+    assert await cache.get("user:1") == {"id": 1}
+    await cache.invalidate(["user_get"])
+    assert await cache.get("user:1") is None
+
+
+@pytest.mark.anyio
+async def test_invalidations_are_replayed_before_use(cache: Cache) -> None:
+    await cache.set("user:1", {"id": 1}, tag="user_get")
+    for _ in range(cache.breaker.failure_threshold):
+        await cache.call(fail)
+    await cache.invalidate(["user_get"])
+    assert cache_module.pending_invalidations == {"user_get"}
+    cache.breaker.record_success()
+    assert await cache.get("user:1") is None
+    assert not cache_module.pending_invalidations
+
+
+@pytest.mark.anyio
+async def test_negative_entries_expire_with_their_tag(cache: Cache) -> None:
+    await cache.set("user:2", MISSING, "user_missing_2", ttl=10)
+    assert await cache.get("user:2") is MISSING
+    assert 0 < await cache.redis.ttl("user:2") <= 10
+    # Misses of IDs never created don't leave tag sets behind
+    assert 0 < await cache.redis.ttl("user_missing_2") <= 10
+    await cache.invalidate(["user_missing_2"])
+    assert await cache.get("user:2") is None
+
+
+@pytest.mark.anyio
+async def test_payloads_of_other_deploys_are_misses(
+    redis: FakeRedis, breaker: CircuitBreaker
+) -> None:
+    old = Cache(
+        redis, breaker=breaker, serializer=CacheSerializer(MsgpackCodec(), None, 0, 1)
+    )
+    new = Cache(
+        redis, breaker=breaker, serializer=CacheSerializer(MsgpackCodec(), None, 0, 2)
+    )
+    await old.set("user:1", {"id": 1})
+    assert await new.get("user:1") is None
+    await redis.set("user:1", b'{"id": 1}')
+    assert await new.get("user:1") is None
@@ -0,0 +1,86 @@
+import datetime
+from typing import Any, Dict, List, Optional
+
+import pytest
+
+from app.util.codec import CODECS, COMPRESSORS, CacheDecodeError, CacheSerializer
+
+CREATED = datetime.datetime(2024, 2, 29, 12, 30, 15, 123456)
+UPDATED = datetime.datetime(
+    2024, 3, 1, 8, 0, tzinfo=datetime.timezone(datetime.timedelta(hours=2))
+)
+USERS: List[Dict[str, Any]] = [
+    {"id": 1, "email": "a@x.io", "created_at": CREATED, "updated_at": UPDATED},
+    {"id": 2, "email": "b@x.io", "created_at": CREATED, "updated_at": UPDATED},
+]
+
+
+def serializer(
+    codec: str = "msgpack", compression: Optional[str] = None, version: int = 1
+) -> CacheSerializer:
+    return CacheSerializer(
+        CODECS[codec], compression=compression, threshold=0, schema_version=version
+    )
+
+
+@pytest.mark.parametrize("compression", [None, *sorted(COMPRESSORS)])
+def test_msgpack_round_trip(compression: Optional[str]) -> None:
+    codec = serializer(compression=compression)
+    assert codec.decode(codec.encode(USERS)) == USERS
+    assert codec.decode(codec.encode(USERS[0])) == USERS[0]
+
+
+def test_msgpack_keeps_datetime_offsets() -> None:
+    codec = serializer()
+    assert codec.decode(codec.encode(UPDATED)).utcoffset() == UPDATED.utcoffset()
+    assert codec.decode(codec.encode(CREATED)).tzinfo is None
+
+
+@pytest.mark.parametrize("compression", [None, *sorted(COMPRESSORS)])
+def test_json_round_trip(compression: Optional[str]) -> None:
+    codec = serializer("json", compression)
+    expected = [
+        {**user, "created_at": CREATED.isoformat(), "updated_at": UPDATED.isoformat()}
+        for user in USERS
+    ]
+    assert codec.decode(codec.encode(USERS)) == expected
+
+
+def test_list_of_dicts_stored_as_table() -> None:
+    codec = serializer("json")
+    table = codec.encode([{"id": 1, "email": "a"}, {"id": 2, "email": "b"}])
+    assert table.count(b"email") == 1
+    # Dicts with different keys are stored as they are
+    mixed = [{"id": 1}, {"email": "b"}]
+    assert codec.decode(codec.encode(mixed)) == mixed
+
+
+def test_small_payloads_are_not_compressed() -> None:
+    if not COMPRESSORS:
+        pytest.skip("No compression library installed")
+    codec = CacheSerializer(
+        CODECS["json"], sorted(COMPRESSORS)[0], threshold=1_000, schema_version=1
+    )
+    assert codec.encode({"id": 1})[2] == 0
+
+
+def test_unknown_compression_is_disabled() -> None:
+    assert serializer(compression="nope").compression is None
+
+
+def test_other_schema_version_is_rejected() -> None:
+    payload = serializer(version=1).encode(USERS)
+    with pytest.raises(CacheDecodeError):
+        serializer(version=2).decode(payload)
+
+
+def test_other_codec_is_rejected() -> None:
+    payload = serializer("json").encode(USERS)
+    with pytest.raises(CacheDecodeError):
+        serializer("msgpack").decode(payload)
+
+
+@pytest.mark.parametrize("payload", [b"", b"\xc1\x02", b'{"id": 1}', b"\x81\xa2id\x01"])
+def test_unversioned_payloads_are_rejected(payload: bytes) -> None:
+    with pytest.raises(CacheDecodeError):
+        serializer().decode(payload)
@@ -0,0 +1,111 @@
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import crud
+from app.crud.base import BatchOperation
+from app.db.session import ShardRouter
+from app.models.cache_invalidation import CacheInvalidation
+from app.models.user import User
+from app.schemas.user import UserCreate
+from app.util import outbox as outbox_module
+from app.util.cache import Cache
+from app.util.outbox import InvalidationDeliveryError, InvalidationOutbox
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+def outbox() -> InvalidationOutbox:
+    return InvalidationOutbox(batch_size=2, interval=1.0, max_backoff=8.0)
+
+
+async def count(db: AsyncSession, model: type) -> int:
+    async with db:
+        return await db.scalar(select(func.count()).select_from(model))
+
+
+async def test_batch_writes_each_invalidated_tag_once(db: AsyncSession) -> None:
+    operations = [
+        BatchOperation("create", obj_in=UserCreate(email=f"user{i}@x.io"))
+        for i in range(5)
+    ]
+    results = await crud.users.batch(db, operations, atomic=False)
+    async with db:
+        tags = list(await db.scalars(select(CacheInvalidation.tag)))
+    assert sorted(tags) == sorted(
+        [
+            *crud.users.invalidate_tags["create"],
+            *[crud.users.missing_tag(result.id) for result in results],
+        ]
+    )
+    assert await count(db, User) == 5
+
+
+async def test_rolled_back_writes_leave_no_rows(db: AsyncSession) -> None:
+    operations = [
+        BatchOperation("create", obj_in=UserCreate(email="new@x.io")),
+        BatchOperation("delete", 1),
+    ]
+    await crud.users.batch(db, operations)
+    assert await count(db, CacheInvalidation) == 0
+
+
+async def test_drain_delivers_and_deletes_rows(
+    db: AsyncSession, cache: Cache, outbox: InvalidationOutbox
+) -> None:
+    await cache.set("user:1", {"id": 1}, tag="user_get")
+    await cache.set("users", [], tag="user_list")
+    async with db.begin():
+        db.add_all(CacheInvalidation(tag=tag) for tag in ["user_get", "user_list"])
+    assert await outbox.drain_shard(db, cache) == 2
+    assert await count(db, CacheInvalidation) == 0
+    assert await cache.get("user:1") is None and await cache.get("users") is None
+
+
+async def test_drain_keeps_rows_while_redis_is_down(
+    db: AsyncSession, cache: Cache, outbox: InvalidationOutbox
+) -> None:
+    async with db.begin():
+        db.add(CacheInvalidation(tag="user_get"))
+    for _ in range(cache.breaker.failure_threshold):
+        cache.breaker.record_failure()
+    with pytest.raises(InvalidationDeliveryError):
+        await outbox.drain_shard(db, cache)
+    assert await count(db, CacheInvalidation) == 1
+
+
+async def test_lag_is_the_age_of_the_oldest_row(
+    db: AsyncSession, outbox: InvalidationOutbox
+) -> None:
+    assert await outbox.shard_lag(db) == 0.0
+    async with db.begin():
+        # SQLite stores the time in UTC, to the second
+        an_hour_ago = datetime.utcnow() - timedelta(hours=1)
+        db.add(CacheInvalidation(tag="user_get", created_at=an_hour_ago))
+        db.add(CacheInvalidation(tag="user_list"))
+    assert await outbox.shard_lag(db) == pytest.approx(3600, abs=2)
+
+
+async def test_reads_skip_the_cache_while_the_outbox_is_behind(
+    router: ShardRouter,
+    db: AsyncSession,
+    cache: Cache,
+    outbox: InvalidationOutbox,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    monkeypatch.setattr(outbox_module, "shards", router)
+    await cache.set("user:1", {"id": 1}, tag="user_get")
+    async with db.begin():
+        a_minute_ago = datetime.utcnow() - timedelta(minutes=1)
+        db.add(CacheInvalidation(tag="user_list", created_at=a_minute_ago))
+    assert await outbox.measure_lag() == {0: pytest.approx(60, abs=2)}
+    assert outbox.stats()["behind"]
+    assert await cache.get("user:1") is None
+
+    await outbox.drain(cache)
+    assert await outbox.measure_lag() == {0: 0.0}
+    assert not outbox.stats()["behind"]
+    assert await cache.get("user:1") == {"id": 1}
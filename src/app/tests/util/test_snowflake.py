@@ -0,0 +1,81 @@
+import asyncio
+
+import pytest
+from fakeredis.aioredis import FakeRedis
+
+from app.util.snowflake import (
+    SnowflakeGenerator,
+    WorkerIdLease,
+    WorkerIdUnavailableError,
+)
+
+pytestmark = pytest.mark.anyio
+
+
+def lease(ttl: float = 30.0) -> WorkerIdLease:
+    generator = SnowflakeGenerator(worker_id=None, epoch_ms=0)
+    return WorkerIdLease(generator, prefix="worker", ttl=ttl, renew_interval=10.0)
+
+
+async def test_running_workers_lease_different_ids(redis: FakeRedis) -> None:
+    leases = [lease() for _ in range(20)]
+    worker_ids = [await each.acquire(redis) for each in leases]
+    assert len(set(worker_ids)) == 20
+    for each, worker_id in zip(leases, worker_ids):
+        assert each.generator.worker_id == worker_id
+        next_id = each.generator.next_id()
+        assert next_id >> SnowflakeGenerator.SEQUENCE_BITS & 0xFF == worker_id
+        assert 0 < await redis.pttl(f"worker:{worker_id}") <= 30_000
+
+
+async def test_no_ids_without_a_lease(redis: FakeRedis) -> None:
+    for worker_id in range(SnowflakeGenerator.MAX_WORKER_ID + 1):
+        await redis.set(f"worker:{worker_id}", "other")
+    unlucky = lease()
+    with pytest.raises(WorkerIdUnavailableError):
+        await unlucky.acquire(redis)
+    with pytest.raises(WorkerIdUnavailableError):
+        unlucky.generator.next_id()
+
+
+async def test_released_id_is_free_again(redis: FakeRedis) -> None:
+    first = lease()
+    worker_id = await first.acquire(redis)
+    await first.release(redis)
+    assert await redis.exists(f"worker:{worker_id}") == 0
+    with pytest.raises(WorkerIdUnavailableError):
+        first.generator.next_id()
+
+
+async def test_unrenewed_lease_stops_ids_before_it_expires(redis: FakeRedis) -> None:
+    short = lease(ttl=0.05)
+    await short.acquire(redis)
+    short.generator.next_id()
+    await asyncio.sleep(0.06)
+    with pytest.raises(WorkerIdUnavailableError):
+        short.generator.next_id()
+    assert await short.renew(redis) is False
+
+
+async def test_lost_lease_is_never_renewed_over_another_worker(redis: FakeRedis) -> None:
+    first = lease()
+    worker_id = await first.acquire(redis)
+    # The lease expired, e.g. while Redis was unreachable, and another worker took the ID
+    await redis.set(f"worker:{worker_id}", "other")
+    assert await first.renew(redis) is False
+    with pytest.raises(WorkerIdUnavailableError):
+        first.generator.next_id()
+    await first.keep(redis)
+    assert first.worker_id not in (None, worker_id)
+    assert await redis.get(f"worker:{worker_id}") == b"other"
+    first.generator.next_id()
+
+
+async def test_renewal_extends_the_lease(redis: FakeRedis) -> None:
+    short = lease(ttl=0.2)
+    worker_id = await short.acquire(redis)
+    await asyncio.sleep(0.15)
+    assert await short.renew(redis)
+    await asyncio.sleep(0.1)
+    assert short.worker_id == worker_id
+    short.generator.next_id()
@@ -1,3 +1,4 @@
 from .api import invalidate_cache
+from .cache import Cache, cache_status
 
-__all__ = ["invalidate_cache"]
+__all__ = ["Cache", "cache_status", "invalidate_cache"]
@@ -7,6 +7,10 @@ async def invalidate_cache(redis: aioredis.Redis, tags: List[str]) -> None:  # t
     """
     Invalidate the cache for the given tags.
 
+    Takes two pipelined round trips whatever the number of tags. Only the keys read from a
+    tag are removed from it, so a key tagged in between stays tagged for the next
+    invalidation.
+
     Args:
         redis (aioredis.Redis): The Redis client.
         tags (List[str]): The list of tags to invalidate.
@@ -15,8 +19,17 @@ async def invalidate_cache(redis: aioredis.Redis, tags: List[str]) -> None:  # t
         None
 
     """
-    for tag in tags:
-        cache_keys = await redis.smembers(tag)
-        if cache_keys:
-            await redis.delete(*cache_keys)
-        await redis.delete(tag)
+    if not tags:
+        return
+    async with redis.pipeline(transaction=False) as pipe:
+        for tag in tags:
+            pipe.smembers(tag)
+        tagged = await pipe.execute()
+    if not any(tagged):
+        return
+    async with redis.pipeline(transaction=False) as pipe:
+        for tag, cache_keys in zip(tags, tagged):
+            if cache_keys:
+                pipe.delete(*cache_keys)
+                pipe.srem(tag, *cache_keys)
+        await pipe.execute()
@@ -0,0 +1,295 @@
+import asyncio
+import hashlib
+import logging
+import math
+from typing import Any, List, Optional
+
+from app import crud
+from app.core.config import settings
+from app.db.session import get_redis_session, shards
+from app.util.cache import Cache
+
+logger = logging.getLogger(__name__)
+
+# Sets the ready bit, KEYS[1], at offset ARGV[2], unless the filter was reset since the
+# build started, i.e. its generation, KEYS[2], is no longer ARGV[1]
+FINISH_BUILD_SCRIPT = """
+if (redis.call('GET', KEYS[2]) or '0') ~= ARGV[1] then
+    return 0
+end
+redis.call('SETBIT', KEYS[1], ARGV[2], 1)
+return 1
+"""
+
+# Seconds a worker may spend building the filter before another one takes over
+BUILD_LOCK_TTL = 600
+
+
+class RedisBloomFilter:
+    """
+    Bloom filter stored in a Redis bitmap, shared by all workers.
+
+    Lookups and additions are a single `BITFIELD` command each. The bit right after the
+    filter marks it as fully built: until a build completed, or if Redis evicted the key,
+    every lookup answers "maybe", so the filter never reports an existing member as missing.
+
+    An addition that cannot be delivered would make the filter miss a member for every
+    worker, so it resets the filter instead, deleting the bitmap as soon as Redis answers
+    again. Until then this worker's lookups answer "can't tell". A reset also bumps the
+    filter's generation, so that a build that started before it never marks it as built.
+
+    Attributes:
+        key (str): The Redis key of the bitmap.
+        size (int): The number of bits in the filter.
+        hashes (int): The number of bits set per member.
+        stale (bool): Whether an addition failed and the filter still has to be reset.
+
+    """
+
+    def __init__(self, key: str, capacity: int, error_rate: float):
+        self.key = key
+        self.size = max(int(-capacity * math.log(error_rate) / math.log(2) ** 2), 8)
+        self.hashes = max(round(self.size / capacity * math.log(2)), 1)
+        self.stale = False
+        self._ready_offset = self.size
+        self._generation_key = f"{key}:generation"
+        self._lock_key = f"{key}:building"
+
+    def _offsets(self, member: Any) -> List[int]:
+        """
+        Get the bit offsets of a member, using double hashing.
+
+        Args:
+            member (Any): The member.
+
+        Returns:
+            List[int]: The offsets.
+
+        """
+        digest = hashlib.blake2b(str(member).encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    async def _set_bits(self, cache: Cache, members: List[Any]) -> bool:
+        """
+        Set the bits of members.
+
+        Args:
+            cache (Cache): The Redis cache.
+            members (List[Any]): The members.
+
+        Returns:
+            bool: Whether the bits were set.
+
+        """
+        bitfield = cache.redis.bitfield(self.key)
+        for offset in {offset for member in members for offset in self._offsets(member)}:
+            bitfield.set("u1", offset, 1)
+        ok, _ = await cache.call(bitfield.execute)
+        return bool(ok)
+
+    async def reset(self, cache: Cache) -> bool:
+        """
+        Delete the filter, so that lookups answer "can't tell" until it is built again.
+
+        Args:
+            cache (Cache): The Redis cache.
+
+        Returns:
+            bool: Whether the filter was deleted.
+
+        """
+
+        async def _reset() -> None:
+            async with cache.redis.pipeline(transaction=True) as pipe:
+                pipe.delete(self.key)
+                pipe.incr(self._generation_key)
+                await pipe.execute()
+
+        ok, _ = await cache.call(_reset)
+        if ok:
+            self.stale = False
+        return bool(ok)
+
+    async def add(self, cache: Cache, members: List[Any]) -> None:
+        """
+        Add members to the filter, resetting it if Redis is unavailable.
+
+        Args:
+            cache (Cache): The Redis cache.
+            members (List[Any]): The members.
+
+        """
+        if members and not await self._set_bits(cache, members):
+            self.stale = True
+            logger.warning(
+                f"Unable to add to the bloom filter '{self.key}', resetting it"
+            )
+            await self.reset(cache)
+
+    async def might_contain(self, cache: Cache, member: Any) -> Optional[bool]:
+        """
+        Check whether a member may be in the filter.
+
+        Args:
+            cache (Cache): The Redis cache.
+            member (Any): The member.
+
+        Returns:
+            Optional[bool]: False if the member is definitely absent, True if it may be
+                present, None if the filter can't tell (not built or Redis unavailable).
+
+        """
+        if self.stale:
+            await self.reset(cache)
+            return None
+        bitfield = cache.redis.bitfield(self.key)
+        bitfield.get("u1", self._ready_offset)
+        for offset in self._offsets(member):
+            bitfield.get("u1", offset)
+        ok, bits = await cache.call(bitfield.execute)
+        if not ok or not bits[0]:
+            return None
+        return all(bits[1:])
+
+    async def is_built(self, cache: Cache) -> Optional[bool]:
+        """
+        Check whether the filter is built.
+
+        Args:
+            cache (Cache): The Redis cache.
+
+        Returns:
+            Optional[bool]: Whether the filter is built, None if Redis is unavailable.
+
+        """
+        ok, bit = await cache.call(
+            lambda: cache.redis.getbit(self.key, self._ready_offset)
+        )
+        return bool(bit) if ok else None
+
+    async def build(self, cache: Cache, members: Any, batch_size: int = 1_000) -> bool:
+        """
+        Add every member and mark the filter as built, unless another worker is building it.
+
+        Members added concurrently are not lost, since bits are only ever set.
+
+        Args:
+            cache (Cache): The Redis cache.
+            members (Any): An asynchronous iterable of all members.
+            batch_size (int): The number of members added per Redis command.
+
+        Returns:
+            bool: Whether this worker built the filter.
+
+        Raises:
+            RuntimeError: If Redis became unavailable during the build.
+
+        """
+        ok, locked = await cache.call(
+            lambda: cache.redis.set(self._lock_key, 1, nx=True, ex=BUILD_LOCK_TTL)
+        )
+        if not ok or not locked:
+            return False
+        try:
+            ok, generation = await cache.call(
+                lambda: cache.redis.get(self._generation_key)
+            )
+            if not ok:
+                raise RuntimeError(f"Could not build the bloom filter '{self.key}'")
+            batch: List[Any] = []
+            async for member in members:
+                batch.append(member)
+                if len(batch) >= batch_size:
+                    if not await self._set_bits(cache, batch):
+                        raise RuntimeError(
+                            f"Could not build the bloom filter '{self.key}'"
+                        )
+                    batch = []
+            if batch and not await self._set_bits(cache, batch):
+                raise RuntimeError(f"Could not build the bloom filter '{self.key}'")
+            ok, built = await cache.call(
+                lambda: cache.redis.eval(
+                    FINISH_BUILD_SCRIPT,
+                    2,
+                    self.key,
+                    self._generation_key,
+                    generation or b"0",
+                    self._ready_offset,
+                )
+            )
+            if not ok:
+                raise RuntimeError(f"Could not build the bloom filter '{self.key}'")
+            # Not built if the filter was reset meanwhile, the next check builds it again
+            return bool(built)
+        finally:
+            await cache.call(lambda: cache.redis.delete(self._lock_key))
+
+
+user_ids = RedisBloomFilter(
+    "user_ids_bloom",
+    capacity=settings.USER_BLOOM_CAPACITY,
+    error_rate=settings.USER_BLOOM_ERROR_RATE,
+)
+
+# Set to check the user ID filter right away, e.g. after an admin reset it
+_check_user_ids = asyncio.Event()
+
+
+async def build_user_ids_filter(cache: Cache) -> bool:
+    """
+    Build the user ID bloom filter from the database, unless it is already built.
+
+    Args:
+        cache (Cache): The Redis cache.
+
+    Returns:
+        bool: Whether this worker built the filter.
+
+    """
+    if await user_ids.is_built(cache) is not False:
+        return False
+    logger.info("Building the user ID bloom filter")
+    built = await user_ids.build(cache, crud.users.stream_ids(shards.session()))
+    if built:
+        logger.info("User ID bloom filter built")
+    return built
+
+
+def check_user_ids_filter() -> None:
+    """
+    Check the user ID bloom filter now, building it if it is not.
+
+    """
+    _check_user_ids.set()
+
+
+async def keep_user_ids_filter() -> None:
+    """
+    Build the user ID bloom filter at startup and whenever it is found unbuilt, until cancelled.
+
+    The filter is checked every `USER_BLOOM_CHECK_INTERVAL` seconds, so that it is built
+    again after it was reset by a failed addition or an admin, or evicted by Redis.
+
+    """
+    redis = await get_redis_session()
+    try:
+        cache = Cache(redis)
+        while True:
+            _check_user_ids.clear()
+            try:
+                await build_user_ids_filter(cache)
+            except Exception as e:
+                logger.error(f"Unable to build the user ID bloom filter. Error: {e}")
+            try:
+                await asyncio.wait_for(
+                    _check_user_ids.wait(), settings.USER_BLOOM_CHECK_INTERVAL
+                )
+            except asyncio.TimeoutError:
+                pass
+    finally:
+        if user_ids.stale:
+            # Last chance, once the worker is gone nothing remembers the failed addition
+            await user_ids.reset(cache)
+        await redis.aclose()
@@ -0,0 +1,270 @@
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, Iterable, Optional, Set, Tuple
+
+from redis import asyncio as aioredis
+
+from app.core import deadline
+from app.core.config import settings
+from app.util.api import invalidate_cache
+from app.util.codec import CacheDecodeError, CacheSerializer, cache_serializer
+
+logger = logging.getLogger(__name__)
+
+CACHE_ERRORS = (aioredis.RedisError, asyncio.TimeoutError, OSError)
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker guarding calls to a flaky dependency.
+
+    The breaker opens after `failure_threshold` consecutive failures and rejects calls
+    for `reset_timeout` seconds. It then lets a single probe through (half open): the
+    probe closes the breaker on success and opens it again on failure.
+
+    Attributes:
+        failure_threshold (int): The consecutive failures that open the breaker.
+        reset_timeout (float): The seconds the breaker stays open before probing.
+        state (str): One of `closed`, `open` or `half_open`.
+        failures (int): The current number of consecutive failures.
+
+    """
+
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+
+    def allow(self) -> bool:
+        """
+        Check whether a call may go through.
+
+        Returns:
+            bool: Whether to make the call.
+
+        """
+        if self.state == "closed":
+            return True
+        if (
+            self.state == "open"
+            and time.monotonic() - self._opened_at >= self.reset_timeout
+        ):
+            self.state = "half_open"
+        if self.state == "half_open" and not self._probing:
+            self._probing = True
+            return True
+        return False
+
+    def record_success(self) -> None:
+        """
+        Record a successful call, closing the breaker.
+
+        """
+        self.state = "closed"
+        self.failures = 0
+        self._probing = False
+
+    def record_failure(self) -> None:
+        """
+        Record a failed call, opening the breaker if needed.
+
+        """
+        self.failures += 1
+        self._probing = False
+        if self.state == "half_open" or self.failures >= self.failure_threshold:
+            self.state = "open"
+            self._opened_at = time.monotonic()
+
+
+redis_breaker = CircuitBreaker(
+    failure_threshold=settings.CACHE_BREAKER_FAILURE_THRESHOLD,
+    reset_timeout=settings.CACHE_BREAKER_RESET_TIMEOUT,
+)
+
+# Returned by `Cache.get` for objects cached as not existing
+MISSING = object()
+_MISSING_PAYLOAD = b"\x00missing"
+
+# Tags whose invalidation could not be delivered, replayed before the cache is used again
+pending_invalidations: Set[str] = set()
+
+# Age in seconds of the oldest undelivered invalidation in the outbox of each shard, as
+# last measured by the outbox drainer
+invalidation_lag: Dict[int, float] = {}
+
+
+def invalidations_behind() -> bool:
+    """
+    Check whether the outbox is further behind than `CACHE_OUTBOX_MAX_LAG`.
+
+    Returns:
+        bool: Whether the cache may serve entries stale for longer than allowed.
+
+    """
+    return settings.CACHE_OUTBOX_MAX_LAG > 0 and any(
+        lag > settings.CACHE_OUTBOX_MAX_LAG for lag in invalidation_lag.values()
+    )
+
+
+class Cache:
+    """
+    Redis cache that degrades to a no-op instead of failing requests.
+
+    Every call is bounded by `CACHE_TIMEOUT` and goes through the worker's circuit breaker.
+    Values are encoded by the configured `CacheSerializer`.
+    While Redis is unavailable reads miss, writes are skipped and invalidations are queued.
+    Queued invalidations are replayed before the next read or write, so this worker never
+    serves an entry it failed to invalidate, and entries left behind by other workers expire
+    within `REDIS_TTL`. Reads also miss while the invalidation outbox is further behind
+    than `CACHE_OUTBOX_MAX_LAG`, so committed writes are seen within that bound.
+
+    Attributes:
+        redis (aioredis.Redis): The Redis client.
+        breaker (CircuitBreaker): The circuit breaker guarding Redis.
+        timeout (float): The timeout of each Redis call, in seconds.
+        serializer (CacheSerializer): Encodes and decodes the cached values.
+
+    """
+
+    def __init__(
+        self,
+        redis: aioredis.Redis,  # type: ignore
+        breaker: CircuitBreaker = redis_breaker,
+        timeout: float = settings.CACHE_TIMEOUT,
+        serializer: CacheSerializer = cache_serializer,
+    ):
+        self.redis = redis
+        self.breaker = breaker
+        self.timeout = timeout
+        self.serializer = serializer
+
+    async def call(self, operation: Callable[[], Awaitable[Any]]) -> Tuple[bool, Any]:
+        """
+        Run a Redis operation through the circuit breaker.
+
+        Args:
+            operation (Callable[[], Awaitable[Any]]): Makes the Redis call.
+
+        Returns:
+            Tuple[bool, Any]: Whether the call succeeded, and its result.
+
+        """
+        if not self.breaker.allow():
+            return False, None
+        timeout = self.timeout
+        remaining = deadline.remaining()
+        if remaining is not None:
+            timeout = min(timeout, remaining)
+        try:
+            result = await asyncio.wait_for(operation(), timeout)
+        except CACHE_ERRORS as e:
+            self.breaker.record_failure()
+            logger.warning(f"Redis call failed, breaker is {self.breaker.state}: {e!r}")
+            return False, None
+        self.breaker.record_success()
+        return True, result
+
+    async def _replay_invalidations(self) -> bool:
+        """
+        Deliver the invalidations queued while Redis was unavailable.
+
+        Returns:
+            bool: Whether the cache is safe to use.
+
+        """
+        if not pending_invalidations:
+            return True
+        tags = list(pending_invalidations)
+        ok, _ = await self.call(lambda: invalidate_cache(self.redis, tags))
+        if ok:
+            pending_invalidations.difference_update(tags)
+        return ok
+
+    async def get(self, key: str) -> Any:
+        """
+        Get a cached value.
+
+        Args:
+            key (str): The cache key.
+
+        Returns:
+            Any: The value, `MISSING` for an object cached as not existing, or None on a
+                miss, if the payload is from an incompatible deploy, if Redis is unavailable
+                or if the outbox is behind.
+
+        """
+        if invalidations_behind() or not await self._replay_invalidations():
+            return None
+        _, payload = await self.call(lambda: self.redis.get(key))
+        if payload is None:
+            return None
+        if payload == _MISSING_PAYLOAD:
+            return MISSING
+        try:
+            return self.serializer.decode(payload)
+        except CacheDecodeError:
+            return None
+
+    async def set(
+        self, key: str, value: Any, tag: Optional[str] = None, ttl: Optional[int] = None
+    ) -> None:
+        """
+        Cache a value and tag it for invalidation.
+
+        Negative entries are filed under tags of their own, e.g. one per ID, which expire
+        along with them so that lookups of IDs never created don't leave tag sets behind.
+
+        Args:
+            key (str): The cache key.
+            value (Any): The value, or `MISSING` to record that the object does not exist.
+            tag (Optional[str]): The tag to file the key under, None for entries that only expire.
+            ttl (Optional[int]): The expiration time in seconds. Defaults to `REDIS_TTL`.
+
+        """
+        if not await self._replay_invalidations():
+            return
+        payload = _MISSING_PAYLOAD if value is MISSING else self.serializer.encode(value)
+        ex = ttl or settings.REDIS_TTL
+
+        async def _set() -> None:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                pipe.set(key, payload, ex=ex)
+                if tag is not None:
+                    pipe.sadd(tag, key)  # Tag the item for invalidation
+                    if value is MISSING:
+                        pipe.expire(tag, ex)
+                await pipe.execute()
+
+        await self.call(_set)
+
+    async def invalidate(self, tags: Iterable[str]) -> None:
+        """
+        Invalidate the cache for the given tags, queueing them if Redis is unavailable.
+
+        Args:
+            tags (Iterable[str]): The tags to invalidate.
+
+        """
+        pending_invalidations.update(tags)
+        await self._replay_invalidations()
+
+
+def cache_status() -> Dict[str, Any]:
+    """
+    Get the state of the worker's Redis circuit breaker.
+
+    Returns:
+        Dict[str, Any]: The breaker state, failure count, queued invalidations and whether
+            reads bypass the cache because the outbox is behind.
+
+    """
+    return {
+        "state": redis_breaker.state,
+        "failures": redis_breaker.failures,
+        "pending_invalidations": sorted(pending_invalidations),
+        "invalidations_behind": invalidations_behind(),
+    }
@@ -0,0 +1,259 @@
+import asyncio
+import json
+import logging
+from typing import Any, Dict, List, Optional, Sequence, Set
+
+import asyncpg
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Queued in place of the buffered events of an evicted subscriber
+EVICTED = b"event: evicted\ndata: {}\n\n"
+
+
+def format_event(event: str, data: Any, event_id: Optional[str] = None) -> bytes:
+    """
+    Render a Server-Sent Event.
+
+    Args:
+        event (str): The event type.
+        data (Any): The JSON serializable payload.
+        event_id (Optional[str]): The ID clients resume from with `Last-Event-ID`, if any.
+
+    Returns:
+        bytes: The event, ready to be written to the stream.
+
+    """
+    lines = [f"id: {event_id}"] if event_id else []
+    lines.append(f"event: {event}")
+    lines.append(f"data: {json.dumps(data, separators=(',', ':'), default=str)}")
+    return ("\n".join(lines) + "\n\n").encode("utf-8")
+
+
+def event_id(row: Dict[str, Any]) -> str:
+    """
+    Build the resume cursor of a row, `<updated_at>,<id>`.
+
+    Args:
+        row (Dict[str, Any]): The row, with `updated_at` as an ISO 8601 string.
+
+    Returns:
+        str: The cursor.
+
+    """
+    return f"{row['updated_at']},{row['id']}"
+
+
+class Subscription:
+    """
+    A change feed client, with its bounded buffer of pending events.
+
+    Attributes:
+        queue (asyncio.Queue[bytes]): The rendered events waiting to be sent.
+        evicted (bool): Whether the client was dropped for falling behind.
+
+    """
+
+    def __init__(self, buffer_size: int):
+        self.queue: "asyncio.Queue[bytes]" = asyncio.Queue(maxsize=buffer_size)
+        self.evicted = False
+
+
+class ChangeFeed:
+    """
+    Fans the notifications of one Postgres channel out to many subscribers.
+
+    Each worker holds one `LISTEN` connection per database, opened with the first
+    subscriber and reopened if it drops. Every notification is rendered once and queued for each
+    subscriber; a subscriber whose buffer is full is evicted, its buffer replaced by an
+    `evicted` event, so one slow consumer never holds up the others or grows memory.
+
+    Attributes:
+        channel (str): The Postgres channel to listen on.
+        trigger (Optional[str]): The trigger notifying the channel, whose argument is
+            checked against `channel` when a listener connects.
+        dsns (List[str]): The asyncpg DSNs of the databases, one per shard.
+        buffer_size (int): The maximum number of events buffered per subscriber.
+        subscribers (Set[Subscription]): The connected subscribers.
+        evictions (int): The total number of evicted subscribers.
+
+    """
+
+    def __init__(
+        self,
+        channel: str,
+        dsns: Sequence[str],
+        buffer_size: int,
+        trigger: Optional[str] = None,
+    ):
+        self.channel = channel
+        self.trigger = trigger
+        self.dsns = list(dsns)
+        self.buffer_size = buffer_size
+        self.subscribers: Set[Subscription] = set()
+        self.evictions = 0
+        self._tasks: List["asyncio.Task[None]"] = []
+
+    def subscribe(self) -> Subscription:
+        """
+        Register a new subscriber, starting the listeners if needed.
+
+        Returns:
+            Subscription: The subscription, to pass to `unsubscribe` once done.
+
+        """
+        if not self._tasks or all(task.done() for task in self._tasks):
+            self._tasks = [asyncio.create_task(self._listen(dsn)) for dsn in self.dsns]
+        subscription = Subscription(self.buffer_size)
+        self.subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        """
+        Remove a subscriber.
+
+        Args:
+            subscription (Subscription): The subscription returned by `subscribe`.
+
+        """
+        self.subscribers.discard(subscription)
+
+    def publish(self, message: bytes) -> None:
+        """
+        Queue a rendered event for every subscriber, evicting the ones that fell behind.
+
+        Args:
+            message (bytes): The rendered event.
+
+        """
+        for subscription in list(self.subscribers):
+            try:
+                subscription.queue.put_nowait(message)
+            except asyncio.QueueFull:
+                self._evict(subscription)
+
+    def _evict(self, subscription: Subscription) -> None:
+        """
+        Drop a subscriber's buffer and tell it it was evicted.
+
+        Args:
+            subscription (Subscription): The subscription.
+
+        """
+        self.unsubscribe(subscription)
+        subscription.evicted = True
+        self.evictions += 1
+        while not subscription.queue.empty():
+            subscription.queue.get_nowait()
+        subscription.queue.put_nowait(EVICTED)
+
+    def _on_notification(
+        self, connection: Any, pid: int, channel: str, payload: str
+    ) -> None:
+        """
+        Handle a notification sent by the table triggers.
+
+        Args:
+            connection (Any): The listening connection.
+            pid (int): The PID of the notifying backend.
+            channel (str): The channel.
+            payload (str): The JSON payload, `{"op": ..., "row": {...}}`.
+
+        """
+        try:
+            change = json.loads(payload)
+            op, row = change["op"], change["row"]
+        except (ValueError, KeyError) as e:
+            logger.warning(f"Ignoring malformed notification on {channel}: {e!r}")
+            return
+        # Deleted rows keep their last updated_at, which must not move the cursor back
+        cursor = event_id(row) if op != "delete" else None
+        self.publish(format_event(op, row, cursor))
+
+    async def _check_trigger(self, connection: Any) -> None:
+        """
+        Log an error if the trigger notifies another channel than the one listened on.
+
+        Args:
+            connection (Any): The listening connection.
+
+        """
+        if self.trigger is None:
+            return
+        channels = await connection.fetch(
+            "SELECT split_part(encode(tgargs, 'escape'), '\\000', 1) AS channel "
+            "FROM pg_trigger WHERE tgname = $1",
+            self.trigger,
+        )
+        if not channels:
+            logger.error(f"Change feed trigger {self.trigger} is missing")
+        for row in channels:
+            if row["channel"] != self.channel:
+                logger.error(
+                    f"Change feed trigger {self.trigger} notifies {row['channel']} but "
+                    f"the feed listens on {self.channel}, re-run its migration with "
+                    f"-x channel={self.channel}"
+                )
+
+    async def _listen(self, dsn: str) -> None:
+        """
+        Keep a `LISTEN` connection to a database open while there are subscribers.
+
+        Args:
+            dsn (str): The asyncpg DSN of the database.
+
+        """
+        backoff = 1.0
+        while self.subscribers:
+            connection = None
+            try:
+                connection = await asyncpg.connect(dsn)
+                lost = asyncio.Event()
+                connection.add_termination_listener(lambda _: lost.set())
+                await connection.add_listener(self.channel, self._on_notification)
+                await self._check_trigger(connection)
+                backoff = 1.0
+                while self.subscribers and not lost.is_set():
+                    try:
+                        await asyncio.wait_for(lost.wait(), timeout=5.0)
+                    except asyncio.TimeoutError:
+                        pass
+            except (
+                OSError,
+                asyncio.TimeoutError,
+                asyncpg.PostgresError,
+                asyncpg.InterfaceError,
+            ) as e:
+                logger.warning(
+                    f"Change feed listener failed, retrying in {backoff}s: {e!r}"
+                )
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, 30.0)
+            finally:
+                if connection is not None and not connection.is_closed():
+                    await connection.close()
+
+    async def stop(self) -> None:
+        """
+        Stop the listeners and drop all subscribers.
+
+        """
+        self.subscribers.clear()
+        tasks, self._tasks = self._tasks, []
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+user_changes = ChangeFeed(
+    channel=settings.CHANGE_FEED_CHANNEL,
+    dsns=[
+        url.replace("postgresql+asyncpg://", "postgresql://", 1)
+        for url in settings.DB_SHARDS or [str(settings.DB_ASYNC_URI)]
+        if url.startswith("postgresql")
+    ],
+    buffer_size=settings.CHANGE_FEED_BUFFER,
+    trigger="user_change_notify",
+)
@@ -0,0 +1,278 @@
+import datetime
+import json
+import logging
+import struct
+from abc import ABC, abstractmethod
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import msgpack
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - optional dependency
+    zstandard = None
+
+try:
+    import lz4.frame as lz4_frame
+except ImportError:  # pragma: no cover - optional dependency
+    lz4_frame = None
+
+
+class CacheDecodeError(ValueError):
+    """
+    Raised when a cached payload can't be decoded by this deploy.
+
+    """
+
+
+class CacheCodec(ABC):
+    """
+    Base class for the codecs serializing cached values.
+
+    Attributes:
+        codec_id (int): The ID written in the payload header.
+
+    """
+
+    codec_id = 0
+
+    @abstractmethod
+    def dumps(self, obj: Any) -> bytes:
+        """
+        Serialize a value.
+
+        Args:
+            obj (Any): The value.
+
+        Returns:
+            bytes: The serialized value.
+
+        """
+
+    @abstractmethod
+    def loads(self, data: bytes) -> Any:
+        """
+        Deserialize a value.
+
+        Args:
+            data (bytes): The serialized value.
+
+        Returns:
+            Any: The value.
+
+        """
+
+
+class JSONCodec(CacheCodec):
+    """
+    Codec writing JSON, datetimes as ISO 8601 strings.
+
+    """
+
+    codec_id = 1
+
+    def dumps(self, obj: Any) -> bytes:
+        return json.dumps(
+            obj,
+            separators=(",", ":"),
+            default=lambda v: v.isoformat() if isinstance(v, datetime.datetime) else v,
+        ).encode("utf-8")
+
+    def loads(self, data: bytes) -> Any:
+        return json.loads(data)
+
+
+_EPOCH = datetime.datetime(1970, 1, 1)
+_NAIVE_DATETIME_EXT = 1
+_AWARE_DATETIME_EXT = 2
+_NAIVE_DATETIME = struct.Struct(">q")
+_AWARE_DATETIME = struct.Struct(">qi")
+
+
+def _msgpack_default(value: Any) -> Any:
+    """
+    Pack datetimes as microseconds since the epoch, plus the UTC offset for aware ones.
+
+    """
+    if isinstance(value, datetime.datetime):
+        offset = value.utcoffset()
+        delta = value.replace(tzinfo=None) - _EPOCH
+        micros = (delta.days * 86400 + delta.seconds) * 1_000_000 + delta.microseconds
+        if offset is None:
+            return msgpack.ExtType(_NAIVE_DATETIME_EXT, _NAIVE_DATETIME.pack(micros))
+        offset_seconds = int(offset.total_seconds())
+        micros -= offset_seconds * 1_000_000
+        return msgpack.ExtType(
+            _AWARE_DATETIME_EXT, _AWARE_DATETIME.pack(micros, offset_seconds)
+        )
+    raise TypeError(f"Object of type {type(value).__name__} is not msgpack serializable")
+
+
+def _msgpack_ext_hook(code: int, data: bytes) -> Any:
+    """
+    Unpack the datetimes packed by `_msgpack_default`.
+
+    """
+    if code == _NAIVE_DATETIME_EXT:
+        (micros,) = _NAIVE_DATETIME.unpack(data)
+        return _EPOCH + datetime.timedelta(microseconds=micros)
+    if code == _AWARE_DATETIME_EXT:
+        micros, offset_seconds = _AWARE_DATETIME.unpack(data)
+        local = _EPOCH + datetime.timedelta(microseconds=micros, seconds=offset_seconds)
+        return local.replace(
+            tzinfo=datetime.timezone(datetime.timedelta(seconds=offset_seconds))
+        )
+    return msgpack.ExtType(code, data)
+
+
+class MsgpackCodec(CacheCodec):
+    """
+    Codec writing msgpack, datetimes as 8 byte extension values.
+
+    """
+
+    codec_id = 2
+
+    def dumps(self, obj: Any) -> bytes:
+        return msgpack.packb(obj, default=_msgpack_default, use_bin_type=True)
+
+    def loads(self, data: bytes) -> Any:
+        return msgpack.unpackb(data, ext_hook=_msgpack_ext_hook, raw=False)
+
+
+CODECS: Dict[str, CacheCodec] = {"json": JSONCodec(), "msgpack": MsgpackCodec()}
+
+# name: (flag, compress, decompress), only the installed libraries are available
+COMPRESSORS: Dict[
+    str, Tuple[int, Callable[[bytes], bytes], Callable[[bytes], bytes]]
+] = {}
+if zstandard is not None:
+    COMPRESSORS["zstd"] = (
+        0x02,
+        zstandard.ZstdCompressor(level=3).compress,
+        zstandard.ZstdDecompressor().decompress,
+    )
+if lz4_frame is not None:
+    COMPRESSORS["lz4"] = (0x04, lz4_frame.compress, lz4_frame.decompress)
+
+
+class CacheSerializer:
+    """
+    Encodes cached values into versioned, optionally compressed payloads.
+
+    Every payload starts with a 5 byte header: a magic byte, the codec ID, flags and the
+    schema version. A payload written by another codec or schema version, or by a deploy
+    that didn't version payloads at all, fails to decode and is treated as a cache miss.
+
+    Lists of dicts sharing the same keys, like list pages, are stored as a table: the
+    keys once, then one row of values per item.
+
+    Attributes:
+        codec (CacheCodec): The codec serializing values.
+        compression (Optional[str]): The compressor applied to large payloads, if any.
+        threshold (int): The minimum size, in bytes, of a payload worth compressing.
+        schema_version (int): The version of the cached data layout.
+
+    """
+
+    MAGIC = 0xC1  # Never used by msgpack, and not valid as the first byte of JSON
+    HEADER = struct.Struct(">BBBH")
+    TABLE_FLAG = 0x01
+
+    def __init__(
+        self,
+        codec: CacheCodec,
+        compression: Optional[str],
+        threshold: int,
+        schema_version: int,
+    ):
+        if compression and compression not in COMPRESSORS:
+            logger.warning(
+                f"Cache compression '{compression}' is not installed, disabled"
+            )
+            compression = None
+        self.codec = codec
+        self.compression = compression
+        self.threshold = threshold
+        self.schema_version = schema_version
+
+    def encode(self, obj: Any) -> bytes:
+        """
+        Encode a value.
+
+        Args:
+            obj (Any): The value.
+
+        Returns:
+            bytes: The payload.
+
+        """
+        flags = 0
+        if (
+            isinstance(obj, list)
+            and obj
+            and all(isinstance(item, dict) for item in obj)
+            and all(item.keys() == obj[0].keys() for item in obj)
+        ):
+            keys = list(obj[0])
+            obj = [keys, [list(item.values()) for item in obj]]
+            flags |= self.TABLE_FLAG
+        body = self.codec.dumps(obj)
+        if self.compression and len(body) >= self.threshold:
+            flag, compress, _ = COMPRESSORS[self.compression]
+            body = compress(body)
+            flags |= flag
+        header = self.HEADER.pack(
+            self.MAGIC, self.codec.codec_id, flags, self.schema_version
+        )
+        return header + body
+
+    def decode(self, data: bytes) -> Any:
+        """
+        Decode a payload.
+
+        Args:
+            data (bytes): The payload.
+
+        Returns:
+            Any: The value.
+
+        Raises:
+            CacheDecodeError: If the payload was written by another codec or schema version.
+
+        """
+        if len(data) < self.HEADER.size:
+            raise CacheDecodeError("Payload too short")
+        magic, codec_id, flags, version = self.HEADER.unpack_from(data)
+        if (
+            magic != self.MAGIC
+            or codec_id != self.codec.codec_id
+            or version != self.schema_version
+        ):
+            raise CacheDecodeError(f"Unsupported payload (codec {codec_id}, v{version})")
+        header_size = self.HEADER.size
+        body = data[header_size:]
+        for flag, _, decompress in COMPRESSORS.values():
+            if flags & flag:
+                body = decompress(body)
+                break
+        else:
+            if flags & ~self.TABLE_FLAG:
+                raise CacheDecodeError("Payload compressed with an unavailable library")
+        obj = self.codec.loads(body)
+        if flags & self.TABLE_FLAG:
+            keys, rows = obj
+            obj = [dict(zip(keys, row)) for row in rows]
+        return obj
+
+
+cache_serializer = CacheSerializer(
+    codec=CODECS[settings.CACHE_CODEC],
+    compression=settings.CACHE_COMPRESSION,
+    threshold=settings.CACHE_COMPRESSION_THRESHOLD,
+    schema_version=settings.CACHE_SCHEMA_VERSION,
+)
@@ -0,0 +1,307 @@
+import asyncio
+import logging
+import random
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from app.core.config import settings
+from app.db.session import DBSession, get_redis_session, shards
+from app.util.cache import Cache
+
+logger = logging.getLogger(__name__)
+
+# Loads the value of a cache key from the database, None if there is nothing to cache
+Loader = Callable[[DBSession], Awaitable[Any]]
+
+
+class CountMinSketch:
+    """
+    Approximate counter of how often each key was seen, in constant memory.
+
+    Each key is counted in one cell of each of the `depth` rows, and its estimate is the
+    smallest of those cells, so it is never below the true count. Only the smallest cells
+    are incremented (conservative update), which keeps the overestimate low.
+
+    Attributes:
+        width (int): The number of cells per row.
+        depth (int): The number of rows.
+
+    """
+
+    def __init__(self, width: int, depth: int):
+        self.width = width
+        self.depth = depth
+        self._rows = [[0] * width for _ in range(depth)]
+        self._seeds = [random.getrandbits(32) for _ in range(depth)]
+
+    def _cells(self, key: str) -> List[int]:
+        return [hash((seed, key)) % self.width for seed in self._seeds]
+
+    def add(self, key: str) -> int:
+        """
+        Count one occurrence of a key.
+
+        Args:
+            key (str): The key.
+
+        Returns:
+            int: The new estimate of the key's count.
+
+        """
+        cells = self._cells(key)
+        count = min(row[cell] for row, cell in zip(self._rows, cells)) + 1
+        for row, cell in zip(self._rows, cells):
+            if row[cell] < count:
+                row[cell] = count
+        return count
+
+    def estimate(self, key: str) -> int:
+        """
+        Estimate how often a key was seen.
+
+        Args:
+            key (str): The key.
+
+        Returns:
+            int: The estimate, never below the true count.
+
+        """
+        return min(row[cell] for row, cell in zip(self._rows, self._cells(key)))
+
+    def decay(self) -> None:
+        """
+        Halve every count, so that keys which are no longer read fade away.
+
+        """
+        for row in self._rows:
+            for cell, count in enumerate(row):
+                row[cell] = count >> 1
+
+
+class HotKey:
+    """
+    A cache key among the most read ones, and how to refill it.
+
+    Attributes:
+        key (str): The cache key.
+        tag (str): The tag the key is filed under.
+        load (Loader): Loads the cached value from the database.
+        count (int): The estimated number of reads.
+
+    """
+
+    __slots__ = ("key", "tag", "load", "count")
+
+    def __init__(self, key: str, tag: str, load: Loader, count: int):
+        self.key = key
+        self.tag = tag
+        self.load = load
+        self.count = count
+
+
+class HotKeyTracker:
+    """
+    Finds the most read cache keys of the worker and refreshes them before they expire.
+
+    Reads are counted in a count-min sketch and the `top_k` keys with the highest counts
+    are kept along with their loader. Every `interval` seconds, the hot keys expiring
+    within `refresh_ahead` seconds, or already gone, are reloaded from the database and
+    cached again, up to `budget` keys per round, hottest first. Counts are halved every
+    `decay_interval` seconds so the hot set follows the traffic.
+
+    A read hitting an entry refreshed after the previous one would have expired counts as
+    a miss avoided.
+
+    Attributes:
+        top_k (int): The number of hot keys tracked.
+        interval (float): The time between refresh rounds, in seconds.
+        refresh_ahead (float): How long before expiring a hot key is refreshed, in seconds.
+        budget (int): The maximum number of keys refreshed per round.
+        decay_interval (float): The time between count decays, in seconds.
+        hot (Dict[str, HotKey]): The hot keys.
+
+    """
+
+    def __init__(
+        self,
+        top_k: int,
+        width: int,
+        depth: int,
+        interval: float,
+        refresh_ahead: float,
+        budget: int,
+        decay_interval: float,
+    ):
+        self.top_k = top_k
+        self.interval = interval
+        self.refresh_ahead = refresh_ahead
+        self.budget = budget
+        self.decay_interval = decay_interval
+        self.sketch = CountMinSketch(width, depth)
+        self.hot: Dict[str, HotKey] = {}
+        # Lower bound of the hot keys' counts, counts only grow between decays
+        self._floor = 0
+        # Monotonic time at which the entry replaced by a refresh would have expired
+        self._refreshed: Dict[str, float] = {}
+        self._last_decay = time.monotonic()
+        self.hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self.refresh_failures = 0
+        self.misses_avoided = 0
+
+    def record(self, key: str, tag: str, load: Loader, hit: bool) -> None:
+        """
+        Count a read of a cache key.
+
+        Args:
+            key (str): The cache key.
+            tag (str): The tag the key is filed under.
+            load (Loader): Loads the cached value from the database.
+            hit (bool): Whether the read was served from the cache.
+
+        """
+        if hit:
+            self.hits += 1
+            expired_at = self._refreshed.get(key)
+            if expired_at is not None and time.monotonic() >= expired_at:
+                self.misses_avoided += 1
+                del self._refreshed[key]
+        else:
+            self.misses += 1
+
+        count = self.sketch.add(key)
+        entry = self.hot.get(key)
+        if entry is not None:
+            entry.count = count
+            return
+        if len(self.hot) >= self.top_k:
+            if count <= self._floor:
+                return
+            coldest = min(self.hot.values(), key=lambda hot_key: hot_key.count)
+            if count <= coldest.count:
+                self._floor = coldest.count
+                return
+            del self.hot[coldest.key]
+            self._refreshed.pop(coldest.key, None)
+        self.hot[key] = HotKey(key, tag, load, count)
+        if len(self.hot) >= self.top_k:
+            self._floor = min(hot_key.count for hot_key in self.hot.values())
+
+    def decay(self) -> None:
+        """
+        Halve every count.
+
+        """
+        self.sketch.decay()
+        for entry in self.hot.values():
+            entry.count >>= 1
+        self._floor >>= 1
+        self._last_decay = time.monotonic()
+
+    async def refresh(self, cache: Cache) -> int:
+        """
+        Reload the hot keys that are about to expire.
+
+        Args:
+            cache (Cache): The Redis cache.
+
+        Returns:
+            int: The number of keys refreshed.
+
+        """
+        entries = sorted(
+            self.hot.values(), key=lambda hot_key: hot_key.count, reverse=True
+        )
+        if not entries:
+            return 0
+
+        async def _ttls() -> List[int]:
+            async with cache.redis.pipeline(transaction=False) as pipe:
+                for entry in entries:
+                    pipe.ttl(entry.key)
+                return await pipe.execute()
+
+        ok, ttls = await cache.call(_ttls)
+        if not ok:
+            return 0
+        # -2 means the key is gone, -1 that it never expires
+        due = [
+            (entry, max(ttl, 0))
+            for entry, ttl in zip(entries, ttls)
+            if ttl != -1 and ttl < self.refresh_ahead
+        ]
+        refreshed = 0
+        for entry, ttl in due[: self.budget]:
+            db = shards.session()
+            try:
+                value = await entry.load(db)
+            except Exception as e:
+                self.refresh_failures += 1
+                logger.warning(f"Unable to refresh the hot key '{entry.key}': {e!r}")
+                continue
+            finally:
+                await db.close()
+            if not value:
+                continue
+            await cache.set(entry.key, value, entry.tag)
+            self._refreshed[entry.key] = time.monotonic() + ttl
+            refreshed += 1
+        self.refreshes += refreshed
+        return refreshed
+
+    async def run(self) -> None:
+        """
+        Refresh the hot keys until cancelled.
+
+        """
+        redis = await get_redis_session()
+        try:
+            cache = Cache(redis)
+            while True:
+                await asyncio.sleep(self.interval)
+                if time.monotonic() - self._last_decay >= self.decay_interval:
+                    self.decay()
+                try:
+                    await self.refresh(cache)
+                except Exception as e:
+                    logger.error(f"Unable to refresh the hot keys. Error: {e}")
+        finally:
+            await redis.aclose()
+
+    def stats(self, limit: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Get the tracker's counters and hottest keys.
+
+        Args:
+            limit (Optional[int]): The number of hot keys to return. Defaults to all.
+
+        Returns:
+            Dict[str, Any]: The counters and the hot keys with their estimated reads.
+
+        """
+        entries = sorted(
+            self.hot.values(), key=lambda hot_key: hot_key.count, reverse=True
+        )
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "refreshes": self.refreshes,
+            "refresh_failures": self.refresh_failures,
+            "misses_avoided": self.misses_avoided,
+            "hot_keys": [
+                {"key": entry.key, "tag": entry.tag, "reads": entry.count}
+                for entry in entries[:limit]
+            ],
+        }
+
+
+hot_keys = HotKeyTracker(
+    top_k=settings.HOT_KEYS_TOP_K,
+    width=settings.HOT_KEYS_SKETCH_WIDTH,
+    depth=settings.HOT_KEYS_SKETCH_DEPTH,
+    interval=settings.HOT_KEYS_REFRESH_INTERVAL,
+    refresh_ahead=settings.HOT_KEYS_REFRESH_AHEAD,
+    budget=settings.HOT_KEYS_REFRESH_BUDGET,
+    decay_interval=settings.HOT_KEYS_DECAY_INTERVAL,
+)
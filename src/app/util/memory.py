@@ -0,0 +1,248 @@
+import asyncio
+import gc
+import logging
+import resource
+import time
+import tracemalloc
+from collections import Counter, deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from app.core.config import settings
+from app.core.request_stats import log_event
+
+logger = logging.getLogger(__name__)
+
+
+def rss() -> int:
+    """
+    Get the resident set size of the process.
+
+    Returns:
+        int: The RSS in bytes, or the peak RSS where the current one is unavailable.
+
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * resource.getpagesize()
+    except (OSError, IndexError, ValueError):
+        # ru_maxrss is in kilobytes on Linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def object_counts(limit: int = 20) -> List[Tuple[str, int]]:
+    """
+    Count the objects tracked by the garbage collector, by type.
+
+    This walks every tracked object, so it takes a while on large heaps.
+
+    Args:
+        limit (int): The number of types to return.
+
+    Returns:
+        List[Tuple[str, int]]: The most common types and their counts.
+
+    """
+    counts = Counter(type(obj).__qualname__ for obj in gc.get_objects())
+    return counts.most_common(limit)
+
+
+def _stat_to_dict(stat: Any) -> Dict[str, Any]:
+    """
+    Convert a tracemalloc statistic, or statistic diff, to a dict.
+
+    """
+    data = {
+        "traceback": [f"{frame.filename}:{frame.lineno}" for frame in stat.traceback],
+        "size": stat.size,
+        "count": stat.count,
+    }
+    if hasattr(stat, "size_diff"):
+        data["size_diff"] = stat.size_diff
+        data["count_diff"] = stat.count_diff
+    return data
+
+
+class MemoryProfiler:
+    """
+    On-demand tracemalloc profiling of the worker.
+
+    Nothing is traced until `start` is called, so the profiler costs nothing otherwise.
+    `diff` compares the heap with the snapshot taken by the previous `diff` call.
+
+    Attributes:
+        baseline (Optional[tracemalloc.Snapshot]): The snapshot the next diff compares to.
+
+    """
+
+    def __init__(self) -> None:
+        self.baseline: Optional[tracemalloc.Snapshot] = None
+
+    @property
+    def tracing(self) -> bool:
+        return tracemalloc.is_tracing()
+
+    def start(self, frames: int) -> None:
+        """
+        Start tracing allocations, dropping the diff baseline.
+
+        Args:
+            frames (int): The number of frames stored per allocation.
+
+        """
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+        tracemalloc.start(frames)
+        self.baseline = None
+
+    def stop(self) -> None:
+        """
+        Stop tracing allocations and free the traces.
+
+        """
+        tracemalloc.stop()
+        self.baseline = None
+
+    def _snapshot(self) -> tracemalloc.Snapshot:
+        """
+        Take a snapshot, leaving out the allocations of tracemalloc itself.
+
+        """
+        return tracemalloc.take_snapshot().filter_traces(
+            [tracemalloc.Filter(False, tracemalloc.__file__)]
+        )
+
+    def top(self, limit: int = 20, group_by: str = "lineno") -> List[Dict[str, Any]]:
+        """
+        Get the largest allocators.
+
+        Args:
+            limit (int): The number of allocators to return.
+            group_by (str): `lineno`, `filename` or `traceback`.
+
+        Returns:
+            List[Dict[str, Any]]: The allocators, largest first.
+
+        Raises:
+            RuntimeError: If tracemalloc is not tracing.
+
+        """
+        if not self.tracing:
+            raise RuntimeError("tracemalloc is not tracing")
+        stats = self._snapshot().statistics(group_by)
+        return [_stat_to_dict(stat) for stat in stats[:limit]]
+
+    def diff(
+        self, limit: int = 20, group_by: str = "lineno"
+    ) -> Optional[List[Dict[str, Any]]]:
+        """
+        Get the allocations that grew most since the previous call, and take a new baseline.
+
+        Args:
+            limit (int): The number of allocators to return.
+            group_by (str): `lineno`, `filename` or `traceback`.
+
+        Returns:
+            Optional[List[Dict[str, Any]]]: The allocators, largest growth first, or None on
+                the first call, which only takes the baseline.
+
+        Raises:
+            RuntimeError: If tracemalloc is not tracing.
+
+        """
+        if not self.tracing:
+            raise RuntimeError("tracemalloc is not tracing")
+        snapshot = self._snapshot()
+        baseline, self.baseline = self.baseline, snapshot
+        if baseline is None:
+            return None
+        stats = snapshot.compare_to(baseline, group_by)
+        return [_stat_to_dict(stat) for stat in stats[:limit]]
+
+    def traced_memory(self) -> Optional[Dict[str, int]]:
+        """
+        Get the size of the traced allocations.
+
+        Returns:
+            Optional[Dict[str, int]]: The current and peak traced sizes in bytes, or None if
+                tracemalloc is not tracing.
+
+        """
+        if not self.tracing:
+            return None
+        current, peak = tracemalloc.get_traced_memory()
+        return {"current": current, "peak": peak}
+
+
+class MemorySampler:
+    """
+    Samples the worker's RSS periodically and logs its growth trend.
+
+    The trend is the least squares slope of the RSS over the last `window` samples, in
+    bytes per hour, so a steady leak stands out from the noise of single samples.
+
+    Attributes:
+        interval (float): The time between samples, in seconds.
+        samples (Deque[Tuple[float, int]]): The monotonic time and RSS of the last samples.
+
+    """
+
+    def __init__(self, interval: float, window: int):
+        self.interval = interval
+        self.samples: Deque[Tuple[float, int]] = deque(maxlen=window)
+
+    def trend(self) -> Optional[float]:
+        """
+        Get the RSS growth rate over the sampled window.
+
+        Returns:
+            Optional[float]: The slope in bytes per hour, or None with fewer than two samples.
+
+        """
+        if len(self.samples) < 2:
+            return None
+        n = len(self.samples)
+        mean_t = sum(t for t, _ in self.samples) / n
+        mean_m = sum(m for _, m in self.samples) / n
+        variance = sum((t - mean_t) ** 2 for t, _ in self.samples)
+        if variance == 0:
+            return None
+        covariance = sum((t - mean_t) * (m - mean_m) for t, m in self.samples)
+        return covariance / variance * 3600
+
+    def sample(self) -> Dict[str, Any]:
+        """
+        Take one sample and log it.
+
+        Returns:
+            Dict[str, Any]: The logged fields.
+
+        """
+        current = rss()
+        self.samples.append((time.monotonic(), current))
+        trend = self.trend()
+        fields: Dict[str, Any] = {
+            "rss": current,
+            "rss_window_start": self.samples[0][1],
+            "trend_bytes_per_hour": round(trend) if trend is not None else None,
+            "gc_counts": gc.get_count(),
+        }
+        traced = memory_profiler.traced_memory()
+        if traced is not None:
+            fields["traced"] = traced
+        log_event(logger, logging.INFO, "memory_sample", **fields)
+        return fields
+
+    async def run(self) -> None:
+        """
+        Sample until cancelled.
+
+        """
+        while True:
+            self.sample()
+            await asyncio.sleep(self.interval)
+
+
+memory_profiler = MemoryProfiler()
+memory_sampler = MemorySampler(
+    interval=settings.MEMORY_SAMPLE_INTERVAL, window=settings.MEMORY_SAMPLE_WINDOW
+)
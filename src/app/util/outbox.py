@@ -0,0 +1,238 @@
+import asyncio
+import logging
+import time
+from datetime import timezone
+from typing import Any, Dict, Optional
+
+from sqlalchemy import delete, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.db.session import get_redis_session, shards
+from app.models.cache_invalidation import CacheInvalidation
+from app.util.api import invalidate_cache
+from app.util.cache import Cache, invalidation_lag, invalidations_behind
+
+logger = logging.getLogger(__name__)
+
+
+class InvalidationDeliveryError(Exception):
+    """
+    Raised to keep the drained outbox rows when Redis could not be reached.
+
+    """
+
+
+class InvalidationOutbox:
+    """
+    Delivers the cache invalidations written to the outbox table by `CRUDBase` writes.
+
+    Writers call `wake` once their transaction has committed, so invalidations normally
+    reach Redis a few milliseconds later, off the request path. The outbox of every shard
+    is also polled every `interval` seconds, which picks up rows left behind by other
+    workers. While Redis is unreachable the rows are kept and retried with exponential
+    backoff, up to `max_backoff` seconds, so an invalidation is never lost.
+
+    Rows are locked with `FOR UPDATE SKIP LOCKED`, so that several workers drain the
+    same outbox without delivering a batch twice.
+
+    After every poll the age of the oldest row of each shard is measured, undelivered
+    rows of other workers included, and published in `invalidation_lag`. The cache is
+    bypassed while a shard is further behind than `CACHE_OUTBOX_MAX_LAG` seconds.
+
+    Attributes:
+        batch_size (int): The maximum number of rows delivered per Redis round trip.
+        interval (float): The time between polls, in seconds.
+        max_backoff (float): The maximum time between retries, in seconds.
+        delivered (int): The number of rows delivered.
+        failures (int): The number of failed deliveries.
+
+    """
+
+    def __init__(self, batch_size: int, interval: float, max_backoff: float):
+        self.batch_size = batch_size
+        self.interval = interval
+        self.max_backoff = max_backoff
+        self.delivered = 0
+        self.failures = 0
+        self._last_delivery: Optional[float] = None
+        self._wake = asyncio.Event()
+
+    def wake(self) -> None:
+        """
+        Drain the outbox now, e.g. after committing invalidations.
+
+        """
+        self._wake.set()
+
+    async def drain_shard(self, session: AsyncSession, cache: Cache) -> int:
+        """
+        Deliver one batch of a shard's outbox.
+
+        Args:
+            session (AsyncSession): A session on the shard.
+            cache (Cache): The Redis cache.
+
+        Returns:
+            int: The number of rows delivered.
+
+        Raises:
+            InvalidationDeliveryError: If Redis could not be reached.
+
+        """
+        async with session.begin():
+            rows = (
+                await session.execute(
+                    select(CacheInvalidation.id, CacheInvalidation.tag)
+                    .order_by(CacheInvalidation.id)
+                    .limit(self.batch_size)
+                    .with_for_update(skip_locked=True)
+                )
+            ).all()
+            if not rows:
+                return 0
+            tags = sorted({row.tag for row in rows})
+            ok, _ = await cache.call(lambda: invalidate_cache(cache.redis, tags))
+            if not ok:
+                # Leave the transaction block to release the rows
+                raise InvalidationDeliveryError(f"Unable to invalidate {tags}")
+            await session.execute(
+                delete(CacheInvalidation).where(
+                    CacheInvalidation.id.in_([row.id for row in rows])
+                )
+            )
+        return len(rows)
+
+    async def shard_lag(self, session: AsyncSession) -> float:
+        """
+        Measure the age of the oldest row of a shard's outbox, by the database clock.
+
+        Args:
+            session (AsyncSession): A session on the shard.
+
+        Returns:
+            float: The age in seconds, 0 if the outbox is empty.
+
+        """
+        async with session:
+            row = (
+                await session.execute(
+                    select(CacheInvalidation.created_at, func.now())
+                    .order_by(CacheInvalidation.id)
+                    .limit(1)
+                )
+            ).first()
+        if row is None:
+            return 0.0
+        created_at, now = row
+        if now.tzinfo is not None:
+            # The timestamps are stored as naive UTC datetimes
+            now = now.astimezone(timezone.utc).replace(tzinfo=None)
+        return max((now - created_at).total_seconds(), 0.0)
+
+    async def measure_lag(self) -> Dict[int, float]:
+        """
+        Measure the age of the oldest row of every shard's outbox into `invalidation_lag`.
+
+        Returns:
+            Dict[int, float]: The age in seconds of the oldest row of each shard.
+
+        """
+        for index, factory in enumerate(shards.factories):
+            invalidation_lag[index] = await self.shard_lag(factory())
+        return dict(invalidation_lag)
+
+    async def drain(self, cache: Cache) -> int:
+        """
+        Deliver the outbox of every shard, until empty.
+
+        Args:
+            cache (Cache): The Redis cache.
+
+        Returns:
+            int: The number of rows delivered.
+
+        Raises:
+            InvalidationDeliveryError: If Redis could not be reached.
+
+        """
+        total = 0
+        for factory in shards.factories:
+            async with factory() as session:
+                while True:
+                    delivered = await self.drain_shard(session, cache)
+                    total += delivered
+                    self.delivered += delivered
+                    if delivered < self.batch_size:
+                        break
+        if total:
+            self._last_delivery = time.monotonic()
+        return total
+
+    async def run(self) -> None:
+        """
+        Drain the outbox until cancelled.
+
+        The lag is measured every `interval` seconds, even while deliveries back off.
+
+        """
+        redis = await get_redis_session()
+        try:
+            cache = Cache(redis)
+            delay = self.interval
+            retry_at = 0.0
+            while True:
+                try:
+                    await asyncio.wait_for(self._wake.wait(), self.interval)
+                except asyncio.TimeoutError:
+                    pass
+                if self._wake.is_set() or time.monotonic() >= retry_at:
+                    self._wake.clear()
+                    try:
+                        await self.drain(cache)
+                        delay = self.interval
+                        retry_at = 0.0
+                    except Exception as e:
+                        self.failures += 1
+                        delay = min(max(delay, self.interval) * 2, self.max_backoff)
+                        retry_at = time.monotonic() + delay
+                        logger.warning(
+                            f"Unable to drain the cache invalidation outbox, retrying in {delay}s: {e!r}"
+                        )
+                try:
+                    await self.measure_lag()
+                except Exception as e:
+                    logger.warning(
+                        f"Unable to measure the cache invalidation outbox lag: {e!r}"
+                    )
+        finally:
+            await redis.aclose()
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get the delivery counters of the worker's drainer.
+
+        Returns:
+            Dict[str, Any]: The rows delivered, failed deliveries, seconds since the last
+                delivery, age in seconds of the oldest row of each shard, and whether the
+                cache is bypassed because one is older than `CACHE_OUTBOX_MAX_LAG`.
+
+        """
+        return {
+            "delivered": self.delivered,
+            "failures": self.failures,
+            "lag": {index: round(lag, 3) for index, lag in invalidation_lag.items()},
+            "behind": invalidations_behind(),
+            "since_last_delivery": (
+                round(time.monotonic() - self._last_delivery, 3)
+                if self._last_delivery is not None
+                else None
+            ),
+        }
+
+
+invalidation_outbox = InvalidationOutbox(
+    batch_size=settings.CACHE_OUTBOX_BATCH_SIZE,
+    interval=settings.CACHE_OUTBOX_POLL_INTERVAL,
+    max_backoff=settings.CACHE_OUTBOX_MAX_BACKOFF,
+)
@@ -0,0 +1,291 @@
+import asyncio
+import logging
+import random
+import threading
+import time
+import uuid
+from typing import Any, Optional
+
+from app.core.config import settings
+from app.db.session import get_redis_session
+
+logger = logging.getLogger(__name__)
+
+
+class WorkerIdUnavailableError(Exception):
+    """
+    Raised when IDs are needed while the worker holds no worker ID.
+
+    """
+
+
+class SnowflakeGenerator:
+    """
+    Allocates 53-bit IDs unique across processes without coordination.
+
+    An ID is made of the milliseconds since `epoch_ms` (41 bits, about 69 years), the
+    worker ID (8 bits) and a per-millisecond sequence (4 bits), so IDs are roughly
+    ordered by creation time and each worker can allocate 16 of them per millisecond.
+    IDs fit in 53 bits so that JSON clients reading numbers as doubles, e.g. JavaScript,
+    get them exactly. IDs never go backwards: if the clock does, or the sequence runs
+    out, the generator keeps counting from its last timestamp instead of waiting.
+
+    Attributes:
+        worker_id (Optional[int]): The ID of this worker, unique among the running workers,
+            None until one is leased.
+        epoch_ms (int): The start of the timestamps, in milliseconds since the Unix epoch.
+        valid_until (Optional[float]): The `time.monotonic()` time at which the worker ID
+            stops being valid, None if it never does.
+
+    """
+
+    WORKER_BITS = 8
+    SEQUENCE_BITS = 4
+    MAX_WORKER_ID = (1 << WORKER_BITS) - 1
+    SEQUENCE_MASK = (1 << SEQUENCE_BITS) - 1
+
+    def __init__(self, worker_id: Optional[int], epoch_ms: int):
+        self.worker_id = worker_id
+        self.epoch_ms = epoch_ms
+        self.valid_until: Optional[float] = None
+        self._last_ms = -1
+        self._sequence = 0
+        self._lock = threading.Lock()
+
+    @property
+    def worker_id(self) -> Optional[int]:
+        return self._worker_id
+
+    @worker_id.setter
+    def worker_id(self, value: Optional[int]) -> None:
+        if value is not None and not 0 <= value <= self.MAX_WORKER_ID:
+            raise ValueError(f"Worker ID must be between 0 and {self.MAX_WORKER_ID}")
+        self._worker_id = value
+
+    def next_id(self) -> int:
+        """
+        Allocate a new ID.
+
+        Returns:
+            int: The ID.
+
+        Raises:
+            WorkerIdUnavailableError: If the worker holds no valid worker ID.
+
+        """
+        if self._worker_id is None or (
+            self.valid_until is not None and time.monotonic() >= self.valid_until
+        ):
+            raise WorkerIdUnavailableError("The worker holds no Snowflake worker ID")
+        with self._lock:
+            now = max(time.time_ns() // 1_000_000, self._last_ms)
+            if now == self._last_ms:
+                self._sequence = (self._sequence + 1) & self.SEQUENCE_MASK
+                if self._sequence == 0:
+                    # Sequence exhausted for this millisecond, borrow the next one
+                    now += 1
+            else:
+                self._sequence = 0
+            self._last_ms = now
+            return (
+                (now - self.epoch_ms) << (self.WORKER_BITS + self.SEQUENCE_BITS)
+                | self._worker_id << self.SEQUENCE_BITS
+                | self._sequence
+            )
+
+    @classmethod
+    def timestamp_ms(cls, id: int, epoch_ms: int) -> int:
+        """
+        Get the allocation time of an ID.
+
+        Args:
+            id (int): The ID.
+            epoch_ms (int): The epoch of the generator that allocated it.
+
+        Returns:
+            int: The allocation time, in milliseconds since the Unix epoch.
+
+        """
+        return (id >> (cls.WORKER_BITS + cls.SEQUENCE_BITS)) + epoch_ms
+
+
+# Extend or drop a worker ID lease, only if this worker still holds it
+RENEW_LEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('PEXPIRE', KEYS[1], ARGV[2])
+end
+return 0
+"""
+RELEASE_LEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+class WorkerIdLease:
+    """
+    Leases the worker ID of a `SnowflakeGenerator` from Redis, unless one is configured.
+
+    Each worker ID is a Redis key set with `NX` and a TTL, holding a token of the worker,
+    so no two running workers share an ID. The lease is renewed every `renew_interval`
+    seconds and released at shutdown, so the IDs of stopped workers are free again after
+    at most `ttl` seconds. The generator refuses to allocate IDs while the worker holds
+    no lease, and stops a little before the lease could have expired in Redis if it can't
+    be renewed, so writes fail instead of risking duplicate IDs.
+
+    Attributes:
+        generator (SnowflakeGenerator): The generator given the leased worker ID.
+        prefix (str): The prefix of the Redis keys, followed by the worker ID.
+        ttl (float): The lifetime of a lease, in seconds.
+        renew_interval (float): The time between renewals, in seconds.
+
+    """
+
+    def __init__(
+        self,
+        generator: SnowflakeGenerator,
+        prefix: str,
+        ttl: float,
+        renew_interval: float,
+    ):
+        self.generator = generator
+        self.prefix = prefix
+        self.ttl = ttl
+        self.renew_interval = renew_interval
+        self.token = uuid.uuid4().hex
+        self.worker_id: Optional[int] = None
+
+    def _key(self, worker_id: int) -> str:
+        return f"{self.prefix}:{worker_id}"
+
+    def _hold(self, worker_id: int, since: float) -> None:
+        self.worker_id = worker_id
+        self.generator.worker_id = worker_id
+        # Counted from before the request, so it ends before the key expires in Redis
+        self.generator.valid_until = since + self.ttl
+
+    def _lose(self) -> None:
+        self.worker_id = None
+        self.generator.worker_id = None
+
+    async def acquire(self, redis: Any) -> int:
+        """
+        Lease a free worker ID, trying them all from a random one.
+
+        Args:
+            redis (Any): The asynchronous Redis session.
+
+        Returns:
+            int: The leased worker ID.
+
+        Raises:
+            WorkerIdUnavailableError: If every worker ID is leased.
+
+        """
+        first = random.randint(0, SnowflakeGenerator.MAX_WORKER_ID)
+        for offset in range(SnowflakeGenerator.MAX_WORKER_ID + 1):
+            worker_id = (first + offset) & SnowflakeGenerator.MAX_WORKER_ID
+            since = time.monotonic()
+            if await redis.set(
+                self._key(worker_id), self.token, nx=True, px=int(self.ttl * 1000)
+            ):
+                self._hold(worker_id, since)
+                return worker_id
+        raise WorkerIdUnavailableError("Every Snowflake worker ID is leased")
+
+    async def renew(self, redis: Any) -> bool:
+        """
+        Extend the lease of the worker ID.
+
+        Args:
+            redis (Any): The asynchronous Redis session.
+
+        Returns:
+            bool: Whether the lease was extended, False if it expired meanwhile and the
+                worker no longer holds an ID.
+
+        """
+        if self.worker_id is None:
+            return False
+        since = time.monotonic()
+        renewed = await redis.eval(
+            RENEW_LEASE_SCRIPT,
+            1,
+            self._key(self.worker_id),
+            self.token,
+            int(self.ttl * 1000),
+        )
+        if not renewed:
+            logger.error(f"Lost the lease of Snowflake worker ID {self.worker_id}")
+            self._lose()
+            return False
+        self._hold(self.worker_id, since)
+        return True
+
+    async def release(self, redis: Any) -> None:
+        """
+        Free the worker ID for other workers.
+
+        Args:
+            redis (Any): The asynchronous Redis session.
+
+        """
+        if self.worker_id is None:
+            return
+        worker_id = self.worker_id
+        self._lose()
+        await redis.eval(RELEASE_LEASE_SCRIPT, 1, self._key(worker_id), self.token)
+
+    async def keep(self, redis: Any) -> None:
+        """
+        Renew the lease, or lease a worker ID again after losing it, once.
+
+        Gives up after `renew_interval` seconds, so a hung Redis doesn't delay the next
+        attempt.
+
+        Args:
+            redis (Any): The asynchronous Redis session.
+
+        """
+
+        async def _keep() -> None:
+            if not await self.renew(redis):
+                await self.acquire(redis)
+
+        try:
+            await asyncio.wait_for(_keep(), self.renew_interval)
+        except Exception as e:
+            logger.error(
+                f"Unable to lease a Snowflake worker ID, creates fail until one is. "
+                f"Error: {e!r}"
+            )
+
+    async def run(self) -> None:
+        """
+        Keep the lease until cancelled, then release it.
+
+        """
+        redis = await get_redis_session()
+        try:
+            while True:
+                await asyncio.sleep(self.renew_interval)
+                await self.keep(redis)
+        finally:
+            try:
+                await self.release(redis)
+            except Exception as e:
+                logger.warning(f"Unable to release the Snowflake worker ID: {e!r}")
+            await redis.aclose()
+
+
+id_generator = SnowflakeGenerator(
+    worker_id=settings.SNOWFLAKE_WORKER_ID, epoch_ms=settings.SNOWFLAKE_EPOCH_MS
+)
+worker_id_lease = WorkerIdLease(
+    id_generator,
+    prefix="snowflake_worker",
+    ttl=settings.SNOWFLAKE_LEASE_TTL,
+    renew_interval=settings.SNOWFLAKE_LEASE_RENEW_INTERVAL,
+)
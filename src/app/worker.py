@@ -0,0 +1,14 @@
+from uvicorn.workers import UvicornWorker
+
+
+class TunedUvicornWorker(UvicornWorker):
+    """
+    Uvicorn worker pinned to uvloop and httptools.
+
+    The stock worker silently falls back to asyncio and h11 when the fast
+    implementations are missing, this one fails at boot instead.
+    Keepalive and backlog are taken from the gunicorn config.
+
+    """
+
+    CONFIG_KWARGS = {"loop": "uvloop", "http": "httptools"}